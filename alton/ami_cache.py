@@ -0,0 +1,121 @@
+"""
+SQLite cache of the tags of the AMIs looked up in AWS, kept across restarts.
+
+An AMI's tags are set when it's built, so once found an AMI never needs looking up again. The cache keeps
+the most recently used MAX_ENTRIES AMIs, and is read a row at a time, as AMIs are asked for.
+"""
+from collections import namedtuple
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+# An AMI read from the cache - with the attributes of a boto Image which Alton uses.
+CachedAmi = namedtuple('CachedAmi', 'id tags')
+
+
+class AmiCache(object):
+    """
+    Least recently used AMIs, by id, in a SQLite database.
+    """
+    # Most AMIs kept.
+    MAX_ENTRIES = 10000
+
+    # Most AMI ids in one query - SQLite allows 999 parameters.
+    QUERY_BATCH_SIZE = 500
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS amis (
+            ami_id TEXT PRIMARY KEY,
+            tags TEXT NOT NULL,
+            last_used REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS amis_last_used ON amis (last_used)",
+    )
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self.db_lock = threading.Lock()
+        self.db_conn = None
+        # Process the connection was made in - Will forks after creating plugins, and connections can't be shared.
+        self.db_pid = None
+
+    def _connection(self):
+        """
+        Returns the connection to the database, connecting the first time it's used in this process.
+        Only call with db_lock held.
+        """
+        if self.db_pid != os.getpid():
+            self.db_conn = sqlite3.connect(self.database_path, check_same_thread=False)
+            self.db_pid = os.getpid()
+            # Losing the last writes in a crash only costs some lookups, so don't wait for the disk.
+            self.db_conn.execute("PRAGMA synchronous = OFF")
+            with self.db_conn:
+                for statement in self.SCHEMA:
+                    self.db_conn.execute(statement)
+        return self.db_conn
+
+    def get(self, ami_id):
+        """
+        Returns the cached AMI with the given id, or None.
+        """
+        return self.get_many([ami_id]).get(ami_id)
+
+    def get_many(self, ami_ids):
+        """
+        Returns the cached AMIs with the given ids, by id, marking them as used.
+        """
+        ami_ids = list(ami_ids)
+        amis = {}
+        with self.db_lock:
+            db_conn = self._connection()
+            with db_conn:
+                for start in range(0, len(ami_ids), self.QUERY_BATCH_SIZE):
+                    batch = ami_ids[start:start + self.QUERY_BATCH_SIZE]
+                    placeholders = ', '.join('?' * len(batch))
+                    rows = db_conn.execute(
+                        "SELECT ami_id, tags FROM amis WHERE ami_id IN ({})".format(placeholders), batch
+                    ).fetchall()
+                    for ami_id, tags in rows:
+                        amis[ami_id] = CachedAmi(ami_id, json.loads(tags))
+                    if rows:
+                        db_conn.execute(
+                            "UPDATE amis SET last_used = ? WHERE ami_id IN ({})".format(placeholders),
+                            [time.time()] + batch
+                        )
+        return amis
+
+    def put(self, ami):
+        """
+        Cache an AMI found in AWS.
+        """
+        self.put_many([ami])
+
+    def put_many(self, amis):
+        """
+        Cache AMIs found in AWS, evicting the least recently used ones beyond MAX_ENTRIES.
+        """
+        if not amis:
+            return
+        now = time.time()
+        with self.db_lock:
+            db_conn = self._connection()
+            with db_conn:
+                db_conn.executemany(
+                    "INSERT OR REPLACE INTO amis (ami_id, tags, last_used) VALUES (?, ?, ?)",
+                    [(ami.id, json.dumps(dict(ami.tags)), now) for ami in amis]
+                )
+                excess = db_conn.execute("SELECT COUNT(*) FROM amis").fetchone()[0] - self.MAX_ENTRIES
+                if excess > 0:
+                    log.info("Evicting %d AMIs from the AMI cache", excess)
+                    db_conn.execute(
+                        "DELETE FROM amis WHERE ami_id IN (SELECT ami_id FROM amis ORDER BY last_used LIMIT ?)",
+                        (excess,)
+                    )
@@ -0,0 +1,220 @@
+"""
+Redis storage for the subscriptions to build notifications.
+"""
+import json
+import pickle
+
+# How long build subscriptions are kept, in seconds - refreshed whenever a build's subscriptions change.
+SUBSCRIPTION_EXPIRE_SECONDS = 259200
+
+
+class BuildSubscriptions(object):
+    """
+    Stores which users in which rooms are notified when a build completes.
+
+    Each build has a Redis set of the rooms subscribed to it, and each (build, room) has a Redis set of the users
+    to mention in that room. Subscribing is a single pipelined transaction of SADDs, so concurrent subscribers
+    never overwrite each other's subscriptions.
+
+    Each user also has a Redis set of the (build, room) pairs they're subscribed to, so their subscriptions can
+    be found without scanning every build. Entries are only removed from it when it's read, so it may list
+    subscriptions which have since expired - the (build, room) sets are authoritative.
+
+    Subscriptions stored in the legacy format, a pickled dict per build, are moved into the sets the first time
+    their build is looked up.
+    """
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def _rooms_key(self, build_id):
+        """
+        Key of the set of rooms subscribed to a build.
+        """
+        return 'notify_rooms:{}'.format(build_id)
+
+    def _users_key(self, build_id, room):
+        """
+        Key of the set of users subscribed to a build in a room.
+        """
+        return 'notify_users:{}:{}'.format(build_id, room)
+
+    def _legacy_key(self, build_id):
+        """
+        Key of a build's subscriptions in the legacy format - a dict of the users to notify in each room,
+        pickled by Will's storage.
+        """
+        return 'notify_{}'.format(build_id)
+
+    def _user_builds_key(self, user):
+        """
+        Key of the set of (build, room) pairs a user is subscribed to.
+        """
+        return 'notify_user_builds:{}'.format(user)
+
+    def _user_build_entry(self, build_id, room):
+        """
+        Member of a user's set of subscriptions, recording one (build, room) pair.
+        """
+        return json.dumps([build_id, room])
+
+    def _add(self, pipe, build_id, room, users):
+        """
+        Queue the commands which subscribe users in room to build_id, refreshing the expiry of the build's keys.
+
+        Returns:
+            int: The number of commands queued.
+        """
+        rooms_key = self._rooms_key(build_id)
+        users_key = self._users_key(build_id, room)
+        pipe.sadd(rooms_key, room)
+        pipe.sadd(users_key, *users)
+        pipe.expire(rooms_key, SUBSCRIPTION_EXPIRE_SECONDS)
+        pipe.expire(users_key, SUBSCRIPTION_EXPIRE_SECONDS)
+        for user in users:
+            user_builds_key = self._user_builds_key(user)
+            pipe.sadd(user_builds_key, self._user_build_entry(build_id, room))
+            pipe.expire(user_builds_key, SUBSCRIPTION_EXPIRE_SECONDS)
+        return 4 + 2 * len(users)
+
+    def _migrate_legacy(self, build_ids):
+        """
+        Move any legacy subscriptions of the build_ids into sets, keeping the time they have left to expire.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for build_id in build_ids:
+            pipe.get(self._legacy_key(build_id))
+            pipe.ttl(self._legacy_key(build_id))
+        results = pipe.execute()
+        legacy_builds = [
+            (build_id, value, ttl)
+            for build_id, value, ttl in zip(build_ids, results[::2], results[1::2])
+            if value is not None
+        ]
+        if not legacy_builds:
+            return
+
+        pipe = self.redis.pipeline(transaction=True)
+        for build_id, value, ttl in legacy_builds:
+            for room, users in pickle.loads(value).items():
+                if not users:
+                    continue
+                self._add(pipe, build_id, room, users)
+                # Redis returns no TTL for keys saved without an expiry.
+                if ttl > 0:
+                    pipe.expire(self._rooms_key(build_id), int(ttl))
+                    pipe.expire(self._users_key(build_id, room), int(ttl))
+            pipe.delete(self._legacy_key(build_id))
+        pipe.execute()
+
+    def create(self, build_id, room, users):
+        """
+        Register a new build, subscribing users in room to it.
+        """
+        pipe = self.redis.pipeline(transaction=True)
+        self._add(pipe, build_id, room, users)
+        pipe.execute()
+
+    def unknown_builds(self, build_ids):
+        """
+        Returns the build IDs which have never been registered, or whose subscriptions have expired.
+        """
+        self._migrate_legacy(build_ids)
+        pipe = self.redis.pipeline(transaction=False)
+        for build_id in build_ids:
+            pipe.exists(self._rooms_key(build_id))
+        return [build_id for build_id, exists in zip(build_ids, pipe.execute()) if not exists]
+
+    def subscribe(self, build_ids, room, users):
+        """
+        Subscribe users in room to each of the build_ids, in one transaction.
+
+        Returns:
+            dict(build_id: set()): The users now subscribed to each build in room.
+        """
+        if not build_ids:
+            return {}
+        pipe = self.redis.pipeline(transaction=True)
+        for build_id in build_ids:
+            write_count = self._add(pipe, build_id, room, users)
+            pipe.smembers(self._users_key(build_id, room))
+        results = pipe.execute()
+        # Each build queued the same number of write commands, followed by its SMEMBERS.
+        return dict(zip(build_ids, results[write_count::write_count + 1]))
+
+    def subscriptions(self, build_id):
+        """
+        Returns the users subscribed to build_id.
+
+        Returns:
+            dict(room: list()): Sorted lists of the users to notify in each subscribed room.
+        """
+        return self.bulk_subscriptions([build_id])[build_id]
+
+    def bulk_subscriptions(self, build_ids):
+        """
+        Returns the users subscribed to each of the build_ids, in two pipelined round trips however many
+        builds are asked for.
+
+        Returns:
+            dict(build_id: dict(room: list())): Sorted lists of the users to notify in each subscribed room,
+            for each build.
+        """
+        build_ids = list(build_ids)
+        self._migrate_legacy(build_ids)
+        pipe = self.redis.pipeline(transaction=False)
+        for build_id in build_ids:
+            pipe.smembers(self._rooms_key(build_id))
+        build_rooms = [(build_id, room) for build_id, rooms in zip(build_ids, pipe.execute()) for room in sorted(rooms)]
+
+        pipe = self.redis.pipeline(transaction=False)
+        for build_id, room in build_rooms:
+            pipe.smembers(self._users_key(build_id, room))
+        subscriptions = {build_id: {} for build_id in build_ids}
+        for (build_id, room), users in zip(build_rooms, pipe.execute()):
+            # A room's users expire on their own schedule, so skip rooms left with nobody to notify.
+            if users:
+                subscriptions[build_id][room] = sorted(users)
+        return subscriptions
+
+    def _user_entries(self, user):
+        """
+        Returns the (build_id, room) pairs user is still subscribed to, removing expired ones from their index.
+        """
+        user_builds_key = self._user_builds_key(user)
+        entries = sorted(self.redis.smembers(user_builds_key))
+        pipe = self.redis.pipeline(transaction=False)
+        for entry in entries:
+            pipe.sismember(self._users_key(*json.loads(entry)), user)
+        current_entries, expired_entries = [], []
+        for entry, is_member in zip(entries, pipe.execute()):
+            (current_entries if is_member else expired_entries).append(entry)
+        if expired_entries:
+            self.redis.srem(user_builds_key, *expired_entries)
+        return [tuple(json.loads(entry)) for entry in current_entries]
+
+    def user_subscriptions(self, user):
+        """
+        Returns the builds user is subscribed to, in time proportional to the number of their subscriptions.
+
+        Returns:
+            dict(build_id: list()): Sorted lists of the rooms user is notified in, for each build.
+        """
+        subscriptions = {}
+        for build_id, room in self._user_entries(user):
+            subscriptions.setdefault(build_id, []).append(room)
+        return subscriptions
+
+    def unsubscribe_all(self, user):
+        """
+        Unsubscribe user from every build, in one transaction.
+
+        Returns:
+            list: The sorted build IDs user was unsubscribed from.
+        """
+        entries = self._user_entries(user)
+        pipe = self.redis.pipeline(transaction=True)
+        for build_id, room in entries:
+            pipe.srem(self._users_key(build_id, room), user)
+        pipe.delete(self._user_builds_key(user))
+        pipe.execute()
+        return sorted(set(build_id for build_id, __ in entries))
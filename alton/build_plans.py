@@ -0,0 +1,53 @@
+"""
+Redis storage for the AMI build plans resolved by "cut ami noop", so they can be built later as reviewed.
+"""
+import binascii
+import json
+import os
+
+# How long a build plan can be confirmed for, in seconds.
+PLAN_EXPIRE_SECONDS = 1800
+
+
+class BuildPlans(object):
+    """
+    Stores resolved AMI build plans under short random tokens, until they're confirmed or expire.
+
+    Plans are stored by the user who made them, and only that user can confirm them. Confirming a plan
+    removes it in the same transaction that reads it, so each plan is built at most once.
+    """
+    # Random bytes in each token - tokens are hex, so twice as many characters.
+    TOKEN_BYTES = 4
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def _plan_key(self, user, token):
+        """
+        Key of the plan a user stored under a token.
+        """
+        return 'build_plan:{}:{}'.format(user, token)
+
+    def create(self, user, plan):
+        """
+        Store a plan, returning the token it can be confirmed with.
+
+        Arguments:
+            user (str): User making the plan - the only one who can confirm it.
+            plan (dict): JSON-serializable description of the build.
+        """
+        while True:
+            token = binascii.hexlify(os.urandom(self.TOKEN_BYTES))
+            if self.redis.set(self._plan_key(user, token), json.dumps(plan), ex=PLAN_EXPIRE_SECONDS, nx=True):
+                return token
+
+    def pop(self, user, token):
+        """
+        Remove and return the plan a user stored under a token, or None if there's no such plan, or it has
+        expired. Another user's plan under the token is left alone.
+        """
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.get(self._plan_key(user, token))
+        pipe.delete(self._plan_key(user, token))
+        plan, __ = pipe.execute()
+        return json.loads(plan) if plan is not None else None
@@ -0,0 +1,230 @@
+"""
+Bounded pool for running long chat commands, with per-user limits and cancellation.
+"""
+from collections import deque
+from datetime import datetime
+import functools
+import itertools
+import logging
+import threading
+
+
+log = logging.getLogger(__name__)
+
+
+class TooManyCommands(Exception):
+    """
+    Raised when a user already has as many commands in flight as they're allowed.
+    """
+    pass
+
+
+class CommandCancelled(Exception):
+    """
+    Raised in a command's thread when the command has been cancelled.
+    """
+    pass
+
+
+class Command(object):
+    """
+    A command waiting for, or running in, the command pool.
+    """
+    def __init__(self, command_id, user, description):
+        self.command_id = command_id
+        self.user = user
+        self.description = description
+        self.submitted_at = datetime.now()
+        self.started_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def state(self):
+        """
+        'queued' until the command gets a slot in the pool, 'running' after.
+        """
+        return 'queued' if self.started_at is None else 'running'
+
+    @property
+    def cancelled(self):
+        """
+        Whether the command has been cancelled.
+        """
+        return self.cancel_event.is_set()
+
+    def elapsed(self, now=None):
+        """
+        Returns how long the command has been in its current state, as a timedelta.
+        """
+        return (now or datetime.now()) - (self.started_at or self.submitted_at)
+
+
+class CommandPool(object):
+    """
+    Bounds how many long commands run at once.
+
+    Will already runs each command in a thread of its own, so a command runs in that thread once it's admitted
+    to the pool - until then it waits, in submission order. Each user may only have a few commands in flight.
+
+    Running commands can't be stopped from outside their thread, so cancellation is cooperative: commands call
+    check_cancelled() between steps, which raises CommandCancelled once they've been cancelled. Queued commands
+    are cancelled straight away.
+    """
+    # Number of commands which may run at once.
+    MAX_RUNNING = 4
+
+    # Number of commands each user may have queued or running at once.
+    MAX_PER_USER = 2
+
+    def __init__(self, max_running=MAX_RUNNING, max_per_user=MAX_PER_USER):
+        self.max_running = max_running
+        self.max_per_user = max_per_user
+        self.condition = threading.Condition()
+        self.command_ids = itertools.count(1)
+        self.queued = deque()
+        self.running = []
+        self.local = threading.local()
+
+    def commands(self):
+        """
+        Returns the commands in flight, running commands first and then queued ones, in submission order.
+        """
+        with self.condition:
+            return list(self.running) + list(self.queued)
+
+    def queue_depth(self):
+        """
+        Returns the number of commands waiting for a slot in the pool.
+        """
+        with self.condition:
+            return len(self.queued)
+
+    def current_command(self):
+        """
+        Returns the command running in this thread, if any.
+        """
+        return getattr(self.local, 'command', None)
+
+    def check_cancelled(self):
+        """
+        Raise CommandCancelled if the command running in this thread has been cancelled.
+        """
+        command = self.current_command()
+        if command is not None and command.cancelled:
+            raise CommandCancelled(command.command_id)
+
+    def cancel(self, command_id, user=None):
+        """
+        Cancel a command in flight.
+
+        Arguments:
+            command_id (int): ID of the command to cancel.
+            user (str): Only cancel the command if it belongs to this user, None to cancel anyone's command.
+
+        Returns:
+            Command: The cancelled command, or None if no such command is in flight.
+        """
+        with self.condition:
+            for command in itertools.chain(self.running, self.queued):
+                if command.command_id == command_id and user in (None, command.user):
+                    command.cancel_event.set()
+                    # Wake the command if it's still queued, so it can give up its place.
+                    self.condition.notify_all()
+                    return command
+        return None
+
+    def run(self, user, description, func, on_queued=None):
+        """
+        Run func() in this thread once there's a slot in the pool, returning its result.
+
+        Arguments:
+            user (str): User who issued the command.
+            description (str): What the command is, for listing commands in flight.
+            func (callable): The command.
+            on_queued (callable): Called with the command and the number of commands ahead of it if it has to wait.
+
+        Raises:
+            TooManyCommands: If user already has MAX_PER_USER commands in flight.
+            CommandCancelled: If the command is cancelled.
+        """
+        with self.condition:
+            in_flight = [command for command in itertools.chain(self.running, self.queued) if command.user == user]
+            if len(in_flight) >= self.max_per_user:
+                raise TooManyCommands(in_flight)
+            command = Command(next(self.command_ids), user, description)
+            self.queued.append(command)
+            commands_ahead = len(self.queued) - 1
+            must_wait = commands_ahead > 0 or len(self.running) >= self.max_running
+
+        try:
+            if must_wait and on_queued is not None:
+                on_queued(command, commands_ahead)
+            with self.condition:
+                while not command.cancelled and (
+                        self.queued[0] is not command or len(self.running) >= self.max_running
+                ):
+                    self.condition.wait()
+                self.queued.remove(command)
+                if command.cancelled:
+                    raise CommandCancelled(command.command_id)
+                command.started_at = datetime.now()
+                self.running.append(command)
+
+            self.local.command = command
+            try:
+                return func()
+            finally:
+                self.local.command = None
+                with self.condition:
+                    self.running.remove(command)
+        finally:
+            with self.condition:
+                if command in self.queued:
+                    self.queued.remove(command)
+                self.condition.notify_all()
+
+
+# The pool shared by every plugin.
+COMMAND_POOL = CommandPool()
+
+
+def pooled(func):
+    """
+    Decorator which runs a plugin command in the shared command pool.
+
+    The user is told if the command has to wait for a slot, if they already have too many commands in flight,
+    and when the command is cancelled. Apply it below @respond_to.
+    """
+    @functools.wraps(func)
+    def wrapper(plugin, message, *args, **kwargs):
+        """
+        Run the command in the pool, replying to the user about its progress through it.
+        """
+        def on_queued(command, commands_ahead):
+            """
+            Tell the user their command is waiting.
+            """
+            plugin.reply(message, "Busy right now - your command is job {}, with {} ahead of it.".format(
+                command.command_id, commands_ahead
+            ))
+
+        try:
+            return COMMAND_POOL.run(
+                message.sender.nick,
+                message['body'],
+                functools.partial(func, plugin, message, *args, **kwargs),
+                on_queued=on_queued
+            )
+        except TooManyCommands as exc:
+            plugin.reply(
+                message,
+                "You already have {} commands running or queued: job(s) {}. "
+                "Wait for one to finish, or cancel one with 'cancel job <id>'.".format(
+                    len(exc.args[0]), ', '.join(str(command.command_id) for command in exc.args[0])
+                ),
+                color='red'
+            )
+        except CommandCancelled as exc:
+            log.info("Cancelled job %s", exc.args[0])
+            plugin.reply(message, "Cancelled job {}.".format(exc.args[0]), color='yellow')
+    return wrapper
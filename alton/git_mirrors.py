@@ -0,0 +1,147 @@
+"""
+Local bare mirrors of the repos AMIs are built from, for summarizing the commits between two versions.
+
+Mirrors are cloned the first time a repo's commits are asked for, and fetched again by a periodic job. The
+commits between two hashes never change, so each range is only read from its mirror once.
+"""
+from collections import OrderedDict, namedtuple
+import glob
+import logging
+import os
+import re
+import subprocess
+import threading
+
+from alton.metrics import backend_call
+from alton.repo_urls import web_url
+
+
+log = logging.getLogger(__name__)
+
+# Refs which can be looked up in a mirror - AMIs record abbreviated commit hashes.
+COMMIT_HASH = re.compile(r'^[0-9a-fA-F]{4,40}$')
+
+# The commits which one version of a repo has and another hasn't, and vice versa, with the subject lines
+# of (up to MAX_SUBJECTS of) the added ones, newest first, as 'abc1234 Subject'.
+CommitRange = namedtuple('CommitRange', 'added removed subjects')
+
+
+class GitMirrors(object):
+    """
+    Bare mirrors of git repos, kept in one directory, named after each repo's web URL.
+    """
+    # Most commit subject lines listed for each range.
+    MAX_SUBJECTS = 20
+
+    # Most commit ranges kept.
+    CACHE_SIZE = 5000
+
+    def __init__(self, mirror_dir):
+        self.mirror_dir = mirror_dir
+        self.lock = threading.Lock()
+        # Commit ranges read, by (repo web URL, from hash, to hash), least recently used first.
+        self.ranges = OrderedDict()
+        # Locks held while cloning or fetching each mirror, by mirror path.
+        self.mirror_locks = {}
+
+    def mirror_path(self, remote):
+        """
+        Returns the path of the mirror of a repo, e.g. <mirror_dir>/github.com_edx_edx-platform.git.
+        """
+        name = re.sub(r'[^\w.-]+', '_', web_url(remote).split('://', 1)[-1]).strip('_')
+        return os.path.join(self.mirror_dir, name + '.git')
+
+    def _mirror_lock(self, path):
+        """
+        Returns the lock held while cloning or fetching the mirror at path.
+        """
+        with self.lock:
+            return self.mirror_locks.setdefault(path, threading.Lock())
+
+    def _git(self, operation, *args):
+        """
+        Run a git command, returning its output.
+
+        Raises:
+            subprocess.CalledProcessError: If git fails.
+        """
+        with backend_call('git', operation):
+            return subprocess.check_output(('git',) + args, stderr=subprocess.STDOUT)
+
+    def _clone(self, remote, path):
+        """
+        Create the mirror of a repo, if it doesn't exist yet.
+        """
+        with self._mirror_lock(path):
+            if not os.path.isdir(path):
+                log.info("Mirroring %s to %s", remote, path)
+                self._git('clone', 'clone', '--mirror', '--quiet', '--', remote, path)
+
+    def fetch(self, path):
+        """
+        Bring the mirror at path up to date with its repo.
+        """
+        with self._mirror_lock(path):
+            self._git('fetch', '--git-dir', path, 'remote', 'update', '--prune')
+
+    def refresh(self):
+        """
+        Fetch every mirror, logging any which can't be fetched.
+        """
+        for path in sorted(glob.glob(os.path.join(self.mirror_dir, '*.git'))):
+            try:
+                self.fetch(path)
+            except subprocess.CalledProcessError as exc:
+                log.warning("Unable to fetch %s: %s", path, exc.output)
+
+    def commits(self, remote, from_hash, to_hash):
+        """
+        Returns the CommitRange from one version of a repo to another, or None if either hash isn't a commit
+        in the repo, even after fetching it.
+
+        Arguments:
+            remote (str): The repo's git remote.
+            from_hash (str): Commit hash of the old version.
+            to_hash (str): Commit hash of the new version.
+        """
+        if not (COMMIT_HASH.match(from_hash) and COMMIT_HASH.match(to_hash)):
+            return None
+        key = (web_url(remote), from_hash, to_hash)
+        with self.lock:
+            commit_range = self.ranges.pop(key, None)
+            if commit_range is not None:
+                self.ranges[key] = commit_range
+                return commit_range
+
+        path = self.mirror_path(remote)
+        try:
+            self._clone(remote, path)
+            try:
+                commit_range = self._read_range(path, from_hash, to_hash)
+            except subprocess.CalledProcessError:
+                # The mirror may not have the commits yet.
+                self.fetch(path)
+                commit_range = self._read_range(path, from_hash, to_hash)
+        except subprocess.CalledProcessError as exc:
+            log.warning("Unable to read %s..%s of %s: %s", from_hash, to_hash, remote, exc.output)
+            return None
+
+        with self.lock:
+            self.ranges[key] = commit_range
+            while len(self.ranges) > self.CACHE_SIZE:
+                self.ranges.popitem(last=False)
+        return commit_range
+
+    def _read_range(self, path, from_hash, to_hash):
+        """
+        Returns the CommitRange from from_hash to to_hash in the mirror at path.
+        """
+        removed, added = self._git(
+            'rev-list', '--git-dir', path, 'rev-list', '--left-right', '--count',
+            '{}...{}'.format(from_hash, to_hash), '--'
+        ).split()
+        subjects = self._git(
+            'log', '--git-dir', path, 'log', '--format=%h %s', '--max-count={}'.format(self.MAX_SUBJECTS),
+            '{}..{}'.format(from_hash, to_hash), '--'
+        ).decode('utf-8', 'replace').splitlines()
+        return CommitRange(int(added), int(removed), subjects)
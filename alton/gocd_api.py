@@ -6,6 +6,8 @@ import logging
 
 from yagocd import Yagocd as yagocd
 
+from alton.metrics import timed_backend
+
 LOG = logging.getLogger(__name__)
 LOG.setLevel(logging.INFO)
 
@@ -20,6 +22,7 @@ class GoCDAPI(object):
             auth=(username, password),
         )
 
+    @timed_backend('gocd', 'pause_pipeline')
     def pause_pipeline(self, pipeline_name, cause):
         """
         Pauses the specified pipeline with the specified cause.
@@ -27,6 +30,7 @@ class GoCDAPI(object):
         LOG.info("Pausing pipeline '%s' with cause '%s'.", pipeline_name, cause)
         self.client.pipelines.pause(pipeline_name, cause)
 
+    @timed_backend('gocd', 'unpause_pipeline')
     def unpause_pipeline(self, pipeline_name):
         """
         Unpauses the specified pipeline.
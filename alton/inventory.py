@@ -0,0 +1,270 @@
+"""
+View of each AWS account's EC2 instances and ELBs, kept up to date by change notifications.
+
+The view of an account is replaced with a full listing every so often, and in between is updated by the
+EC2 state-change, Auto Scaling and ELB (CloudTrail) events AWS publishes through CloudWatch Events, delivered
+by SNS to the bot's inventory webhook. Commands read the view instead of listing instances and ELBs, as long
+as it has been listed within MAX_AGE_SECONDS and no event has come in which it couldn't follow.
+
+The view is kept in Redis, since the web server receiving events and the commands reading them run in
+different processes.
+"""
+from collections import namedtuple
+import json
+import logging
+
+
+log = logging.getLogger(__name__)
+
+# An instance in the view - with the attributes of a boto Instance which Alton uses.
+InventoryInstance = namedtuple('InventoryInstance', 'id image_id state tags private_dns_name')
+
+# The instances in the view matching a lookup, in place of the boto Reservations it would return.
+InventoryReservation = namedtuple('InventoryReservation', 'instances')
+
+# An ELB in the view, with the InventoryInstanceRefs of its instances.
+InventoryElb = namedtuple('InventoryElb', 'name instances')
+
+# An instance registered with an ELB.
+InventoryInstanceRef = namedtuple('InventoryInstanceRef', 'id')
+
+# States of instances which are launching, and so should be in the view.
+LAUNCHING_STATES = ('pending', 'running')
+
+# Instance states which a launched instance can be in, in the order an instance goes through them - events
+# can arrive out of order, so a state earlier than the one in the view is ignored.
+INSTANCE_STATES = ('pending', 'running', 'stopping', 'stopped', 'shutting-down', 'terminated')
+
+
+class Inventory(object):
+    """
+    The instances and ELBs of each AWS profile, in Redis.
+
+    Each instance's details and its state are kept in separate hashes, and each ELB's instances in a set, so
+    every event is applied with single-key commands which can't overwrite concurrent changes.
+    """
+    # How long after being listed the view of an account is used, in seconds.
+    MAX_AGE_SECONDS = 7200
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def _key(self, profile, *parts):
+        """
+        Key of part of the view of a profile, e.g. alton_inventory:edx:instances.
+        """
+        return ':'.join(('alton_inventory', profile) + parts)
+
+    def is_fresh(self, profile):
+        """
+        Returns whether the view of a profile can be used.
+        """
+        return bool(self.redis.exists(self._key(profile, 'fresh')))
+
+    def invalidate(self, profile):
+        """
+        Stop using the view of a profile until it's listed again.
+        """
+        log.info("Inventory of %s is out of date until it's listed again", profile)
+        self.redis.delete(self._key(profile, 'fresh'))
+
+    def replace(self, profile, reservations, elbs):
+        """
+        Replace the view of a profile with a full listing of its instances and ELBs.
+
+        Arguments:
+            profile (str): AWS profile listed.
+            reservations (list): boto Reservations of every instance.
+            elbs (list): boto LoadBalancers of every ELB.
+        """
+        old_elb_names = self.redis.smembers(self._key(profile, 'elbs'))
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(
+            self._key(profile, 'instances'), self._key(profile, 'states'), self._key(profile, 'elbs'),
+            *[self._key(profile, 'elb', name) for name in old_elb_names]
+        )
+        instances = [instance for reservation in reservations for instance in reservation.instances]
+        if instances:
+            pipe.hmset(self._key(profile, 'instances'), {
+                instance.id: self._instance_details(instance) for instance in instances
+            })
+            pipe.hmset(self._key(profile, 'states'), {instance.id: instance.state for instance in instances})
+        for elb in elbs:
+            pipe.sadd(self._key(profile, 'elbs'), elb.name)
+            if elb.instances:
+                pipe.sadd(self._key(profile, 'elb', elb.name), *[instance.id for instance in elb.instances])
+        pipe.set(self._key(profile, 'fresh'), 1, ex=self.MAX_AGE_SECONDS)
+        pipe.execute()
+
+    def add_instances(self, profile, instances):
+        """
+        Add boto Instances looked up after hearing they launched.
+        """
+        if not instances:
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hmset(self._key(profile, 'instances'), {
+            instance.id: self._instance_details(instance) for instance in instances
+        })
+        pipe.hmset(self._key(profile, 'states'), {instance.id: instance.state for instance in instances})
+        pipe.execute()
+
+    def _instance_details(self, instance):
+        """
+        Returns the details of a boto Instance kept in the view, as JSON - all but its state, which changes.
+        """
+        return json.dumps({
+            'image_id': instance.image_id,
+            'tags': dict(instance.tags),
+            'private_dns_name': instance.private_dns_name,
+        })
+
+    def reservations(self, profile, filters):
+        """
+        Returns the instances of a profile matching EC2 filters, as a list of one InventoryReservation - or
+        None if the view can't be used, or can't apply the filters.
+
+        Only the 'instance-state-name' and 'tag:<name>' filters, with single values, are supported.
+        """
+        if any(name != 'instance-state-name' and not name.startswith('tag:') for name in filters):
+            return None
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.exists(self._key(profile, 'fresh'))
+        pipe.hgetall(self._key(profile, 'instances'))
+        pipe.hgetall(self._key(profile, 'states'))
+        fresh, details, states = pipe.execute()
+        if not fresh:
+            return None
+
+        instances = []
+        for instance_id, instance_details in sorted(details.items()):
+            instance_details = json.loads(instance_details)
+            instance = InventoryInstance(
+                instance_id, instance_details['image_id'], states.get(instance_id),
+                instance_details['tags'], instance_details['private_dns_name']
+            )
+            if all(
+                    (instance.state if name == 'instance-state-name' else instance.tags.get(name[4:])) == value
+                    for name, value in filters.items()
+            ):
+                instances.append(instance)
+        return [InventoryReservation(instances)] if instances else []
+
+    def load_balancers(self, profile):
+        """
+        Returns the InventoryElbs of a profile, or None if the view can't be used.
+        """
+        if not self.is_fresh(profile):
+            return None
+        names = sorted(self.redis.smembers(self._key(profile, 'elbs')))
+        pipe = self.redis.pipeline(transaction=False)
+        for name in names:
+            pipe.smembers(self._key(profile, 'elb', name))
+        return [
+            InventoryElb(name, [InventoryInstanceRef(instance_id) for instance_id in sorted(instance_ids)])
+            for name, instance_ids in zip(names, pipe.execute())
+        ]
+
+    def apply(self, profile, event):
+        """
+        Apply a change notification to the view of a profile.
+
+        Arguments:
+            profile (str): AWS profile the event is from.
+            event (dict): A CloudWatch event, or an SNS notification of one.
+
+        Returns:
+            (str, list): What was done with the event - 'updated', 'ignored' or 'subscribe' - and the ids of
+            launched instances which aren't in the view, which should be looked up and added.
+        """
+        if event.get('Type') == 'SubscriptionConfirmation':
+            log.warning("Confirm the inventory subscription of %s by visiting %s", profile, event.get('SubscribeURL'))
+            return 'subscribe', []
+        if event.get('Type') == 'Notification':
+            event = json.loads(event['Message'])
+
+        detail_type = event.get('detail-type')
+        detail = event.get('detail') or {}
+        if detail_type == 'EC2 Instance State-change Notification':
+            return self._apply_state(profile, detail.get('instance-id'), detail.get('state'))
+        elif detail_type == 'EC2 Instance Launch Successful':
+            # Auto Scaling reports launches late, after the instance's own state changes - only use them to
+            # hear about instances which aren't in the view.
+            instance_id = detail.get('EC2InstanceId')
+            if not instance_id or self.redis.hexists(self._key(profile, 'instances'), instance_id):
+                return 'ignored', []
+            return 'updated', [instance_id]
+        elif detail_type == 'EC2 Instance Terminate Successful':
+            return self._apply_state(profile, detail.get('EC2InstanceId'), 'terminated')
+        elif detail_type == 'AWS API Call via CloudTrail' and \
+                detail.get('eventSource') == 'elasticloadbalancing.amazonaws.com':
+            return self._apply_elb_call(profile, detail)
+        return 'ignored', []
+
+    def _apply_state(self, profile, instance_id, state):
+        """
+        Record an instance's new state, unless it's already in a later one.
+        """
+        if not instance_id or state not in INSTANCE_STATES:
+            return 'ignored', []
+        if not self.redis.hexists(self._key(profile, 'instances'), instance_id):
+            # Launched since the view was listed - its details need looking up.
+            return ('updated', [instance_id]) if state in LAUNCHING_STATES else ('ignored', [])
+        states_key = self._key(profile, 'states')
+        elb_names = self.redis.smembers(self._key(profile, 'elbs')) if state == 'terminated' else []
+
+        def update_state(pipe):
+            """
+            Set the state if it moves the instance forward.
+            """
+            if not self._is_later_state(pipe.hget(states_key, instance_id), state):
+                return
+            pipe.multi()
+            pipe.hset(states_key, instance_id, state)
+            # ELBs deregister terminated instances without an API call to hear about.
+            for name in elb_names:
+                pipe.srem(self._key(profile, 'elb', name), instance_id)
+
+        # Nothing is executed if the state wasn't set.
+        updated = self.redis.transaction(update_state, states_key)
+        return ('updated' if updated else 'ignored'), []
+
+    @staticmethod
+    def _is_later_state(current, state):
+        """
+        Returns whether an instance in the current state can be in another - a stopped instance can be
+        started again, but otherwise instances only move through INSTANCE_STATES in order.
+        """
+        if current not in INSTANCE_STATES:
+            return True
+        return INSTANCE_STATES.index(state) >= INSTANCE_STATES.index(current) or \
+            (current == 'stopped' and state == 'pending')
+
+    def _apply_elb_call(self, profile, detail):
+        """
+        Apply a successful ELB API call which changes the ELBs or their instances.
+        """
+        if detail.get('errorCode'):
+            return 'ignored', []
+        parameters = detail.get('requestParameters') or {}
+        name = parameters.get('loadBalancerName')
+        event_name = detail.get('eventName')
+        if not name:
+            return 'ignored', []
+        instance_ids = [instance.get('instanceId') for instance in parameters.get('instances') or []]
+        elb_key = self._key(profile, 'elb', name)
+        pipe = self.redis.pipeline(transaction=True)
+        if event_name == 'CreateLoadBalancer':
+            pipe.sadd(self._key(profile, 'elbs'), name)
+        elif event_name == 'DeleteLoadBalancer':
+            pipe.srem(self._key(profile, 'elbs'), name)
+            pipe.delete(elb_key)
+        elif event_name == 'RegisterInstancesWithLoadBalancer' and instance_ids:
+            pipe.sadd(self._key(profile, 'elbs'), name)
+            pipe.sadd(elb_key, *instance_ids)
+        elif event_name == 'DeregisterInstancesWithLoadBalancer' and instance_ids:
+            pipe.srem(elb_key, *instance_ids)
+        else:
+            return 'ignored', []
+        pipe.execute()
+        return 'updated', []
@@ -0,0 +1,74 @@
+"""
+Replay recorded EC2 and ELB change notifications to the inventory webhook of a local bot.
+
+    python -m alton.inventory_replay events.jsonl 'http://localhost/inventory/edx?token=...'
+
+Each line of the file is a CloudWatch event, or an SNS notification of one - as SNS delivers them, or as
+captured from the webhook's log.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import time
+
+import requests
+
+
+def read_events(lines):
+    """
+    Returns the events in lines of JSON, skipping blank lines.
+    """
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+def as_sns_notification(event):
+    """
+    Returns a CloudWatch event wrapped in an SNS notification, as SNS posts it - unless it already is one.
+    """
+    if 'Type' in event:
+        return event
+    return {'Type': 'Notification', 'Message': json.dumps(event)}
+
+
+def replay(events, post, delay=0):
+    """
+    Post events one at a time, in order, returning the result of each post.
+
+    Arguments:
+        events (list): Events to post.
+        post (callable): Posts one event.
+        delay (float): Seconds to wait between events.
+    """
+    results = []
+    for index, event in enumerate(events):
+        if index and delay:
+            time.sleep(delay)
+        results.append(post(as_sns_notification(event)))
+    return results
+
+
+def main():
+    """
+    Replay the events in a file to a webhook, printing the bot's response to each.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('events', type=argparse.FileType('r'), help='file of events, one JSON object per line')
+    parser.add_argument('url', help='inventory webhook URL, including the profile and token')
+    parser.add_argument('--delay', type=float, default=0, help='seconds to wait between events')
+    args = parser.parse_args()
+
+    def post(event):
+        """
+        Post an event as SNS does, returning the response.
+        """
+        response = requests.post(args.url, data=json.dumps(event), headers={'Content-Type': 'text/plain'})
+        response.raise_for_status()
+        return response.text
+
+    for result in replay(read_events(args.events), post, delay=args.delay):
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""
+Counts, error rates and latency histograms of chat commands and backend calls, in Prometheus text format.
+
+Will handles chat commands, web routes and scheduled jobs in separate processes, so each process records
+its metrics in memory and a background thread adds them to a Redis hash shared by all the processes every
+FLUSH_INTERVAL_SECONDS. The metrics route renders the shared hash.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import functools
+import logging
+import os
+import re
+import threading
+import time
+
+from alton.tracing import span
+
+
+log = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# The upper bound label of a histogram bucket series, which is always its last label.
+BUCKET_BOUND_PATTERN = re.compile(r',?le="([^"]*)"}$')
+
+# Metric names, and their help text.
+METRIC_HELP = {
+    'alton_command_calls_total': 'Chat commands and web requests handled.',
+    'alton_command_errors_total': 'Chat commands and web requests which raised an exception.',
+    'alton_command_duration_seconds': 'Time taken to handle chat commands and web requests.',
+    'alton_backend_calls_total': 'Calls made to AWS, S3, SQLite, GoCD, Jenkins and git.',
+    'alton_backend_errors_total': 'Calls made to AWS, S3, SQLite, GoCD, Jenkins and git which raised an exception.',
+    'alton_backend_duration_seconds': 'Time taken by calls to AWS, S3, SQLite, GoCD, Jenkins and git.',
+}
+
+
+class MetricsRegistry(object):
+    """
+    Records metrics in memory, and periodically adds them to the metrics shared through Redis.
+    """
+    # Redis hash holding the metrics of all processes.
+    REDIS_KEY = 'alton_metrics'
+
+    # How often each process adds its metrics to the shared hash, in seconds.
+    FLUSH_INTERVAL_SECONDS = 10
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Values recorded since the last flush, by (metric name, sorted label pairs).
+        self.pending = defaultdict(float)
+        self.redis_factory = None
+        self.redis = None
+        self.flusher_pid = None
+
+    def set_redis_factory(self, redis_factory):
+        """
+        Share metrics through the Redis client returned by redis_factory(), called once in each process.
+        Until this is called, metrics are only kept in memory.
+        """
+        self.redis_factory = redis_factory
+
+    def observe_call(self, kind, labels, seconds, failed):
+        """
+        Record one call's outcome and latency - kind is 'command' or 'backend'.
+        """
+        prefix = 'alton_{}_'.format(kind)
+        with self.lock:
+            label_pairs = tuple(sorted(labels.items()))
+            self.pending[(prefix + 'calls_total', label_pairs)] += 1
+            if failed:
+                self.pending[(prefix + 'errors_total', label_pairs)] += 1
+            histogram = prefix + 'duration_seconds'
+            self.pending[(histogram + '_sum', label_pairs)] += seconds
+            self.pending[(histogram + '_count', label_pairs)] += 1
+            for bucket in LATENCY_BUCKETS:
+                if seconds <= bucket:
+                    self.pending[(histogram + '_bucket', label_pairs + (('le', str(bucket)),))] += 1
+            self.pending[(histogram + '_bucket', label_pairs + (('le', '+Inf'),))] += 1
+        self._start_flusher()
+
+    @contextmanager
+    def time_call(self, kind, **labels):
+        """
+        Context manager recording the outcome and latency of the call it wraps.
+        """
+        start = time.time()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.observe_call(kind, labels, time.time() - start, failed)
+
+    def _start_flusher(self):
+        """
+        Start the thread flushing this process's metrics to Redis, if it isn't running yet.
+        """
+        if self.redis_factory is None or self.flusher_pid == os.getpid():
+            return
+        with self.lock:
+            # Threads don't survive a fork - check by process ID, so each process starts its own.
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+            self.redis = None
+        flusher = threading.Thread(target=self._flush_forever, name='metrics-flusher')
+        flusher.daemon = True
+        flusher.start()
+
+    def _flush_forever(self):
+        """
+        Flush metrics to Redis every FLUSH_INTERVAL_SECONDS.
+        """
+        while True:
+            time.sleep(self.FLUSH_INTERVAL_SECONDS)
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Unable to flush metrics to Redis")
+
+    def flush(self):
+        """
+        Add the metrics recorded since the last flush to the shared metrics.
+        """
+        if self.redis_factory is None:
+            return
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(float)
+        if not pending:
+            return
+        if self.redis is None:
+            self.redis = self.redis_factory()
+        pipe = self.redis.pipeline(transaction=False)
+        for (name, label_pairs), value in pending.items():
+            pipe.hincrbyfloat(self.REDIS_KEY, _series_name(name, label_pairs), value)
+        try:
+            pipe.execute()
+        except Exception:
+            # Keep the values, to add them in the next flush.
+            with self.lock:
+                for series, value in pending.items():
+                    self.pending[series] += value
+            raise
+
+    def values(self):
+        """
+        Returns the current value of every metric, by Prometheus series name.
+        """
+        self.flush()
+        if self.redis_factory is None:
+            with self.lock:
+                return {_series_name(name, label_pairs): value for (name, label_pairs), value in self.pending.items()}
+        # flush() only connects when it has something to add.
+        if self.redis is None:
+            self.redis = self.redis_factory()
+        return {series: float(value) for series, value in self.redis.hgetall(self.REDIS_KEY).items()}
+
+    def render(self):
+        """
+        Returns all the metrics, in Prometheus text format.
+        """
+        values = self.values()
+        lines = []
+        for name in sorted(METRIC_HELP):
+            series = sorted((series for series in values if series.split('{')[0] in (
+                name, name + '_bucket', name + '_sum', name + '_count'
+            )), key=_series_sort_key)
+            if not series:
+                continue
+            lines.append('# HELP {} {}'.format(name, METRIC_HELP[name]))
+            lines.append('# TYPE {} {}'.format(name, 'histogram' if name.endswith('_seconds') else 'counter'))
+            for series_name in series:
+                lines.append('{} {}'.format(series_name, _format_value(values[series_name])))
+        return '\n'.join(lines) + '\n'
+
+
+def _series_name(name, label_pairs):
+    """
+    Returns the Prometheus series name of a metric with labels, e.g. name{label="value"}.
+    """
+    if not label_pairs:
+        return name
+    labels = ','.join(
+        '{}="{}"'.format(label, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for label, value in label_pairs
+    )
+    return '{}{{{}}}'.format(name, labels)
+
+
+def _series_sort_key(series_name):
+    """
+    Sort key of a series name, keeping each histogram's buckets together in numeric order, +Inf last.
+    """
+    match = BUCKET_BOUND_PATTERN.search(series_name)
+    if not match:
+        return series_name, 0
+    labels = series_name[:match.start()] + '}'
+    return labels, float(match.group(1))
+
+
+def _format_value(value):
+    """
+    Format a metric value, without a fractional part for whole numbers.
+    """
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+# The registry shared by all of Alton.
+METRICS = MetricsRegistry()
+
+
+def timed_command(func):
+    """
+    Decorator recording the calls, errors and latency of a chat command or web route handler.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        """
+        Handle the command, timing it.
+        """
+        with METRICS.time_call('command', command=func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def backend_call(backend, operation):
+    """
+    Context manager recording the calls, errors and latency of a call to a backend, and a span for it in the
+    current command's trace.
+    """
+    with span('{}.{}'.format(backend, operation)):
+        with METRICS.time_call('backend', backend=backend, operation=operation):
+            yield
+
+
+def timed_backend(backend, operation):
+    """
+    Decorator recording the calls, errors and latency of a call to a backend, e.g. timed_backend('s3', 'get').
+    """
+    def decorator(func):
+        """
+        Wrap func.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            """
+            Make the call, timing it.
+            """
+            with backend_call(backend, operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
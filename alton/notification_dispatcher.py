@@ -0,0 +1,196 @@
+"""
+Background delivery of build notifications to chat rooms.
+"""
+from collections import OrderedDict
+import hashlib
+import logging
+import Queue
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class NotificationDispatcher(object):
+    """
+    Delivers build notifications from a background thread, so the webhook reporting a build can return at once.
+
+    Notifications which arrive close together are batched into one message per room, failed sends are
+    retried, and a build reporting the same message more than once is only announced the first time.
+    """
+    # How long to keep collecting notifications into a batch after the first one arrives, in seconds.
+    BATCH_WINDOW_SECONDS = 1
+
+    # Maximum number of notification lines sent to a room in a single message.
+    MAX_BATCH_LINES = 20
+
+    # Number of times to try sending a message before giving up on it.
+    MAX_SEND_ATTEMPTS = 3
+
+    # Delay before the first retry of a failed send, in seconds - doubled for each further retry.
+    RETRY_DELAY_SECONDS = 2
+
+    # How long a delivered notification is remembered to drop repeated callbacks for it, in seconds.
+    DEDUP_EXPIRE_SECONDS = 3600
+
+    # How long a queued notification is claimed before it's delivered, in seconds - if the process dies with it
+    # still queued, a repeated callback after this is delivered again.
+    PENDING_EXPIRE_SECONDS = 300
+
+    def __init__(self, redis_client, resolve, send):
+        """
+        Arguments:
+            redis_client (redis.Redis):
+                Where accepted notifications are remembered, shared by all bot processes.
+            resolve (callable):
+                resolve(notifications) returns, for each of a list of (build_id, text) notifications, the list
+                of (room, line) pairs to send for it.
+            send (callable):
+                send(room, content) sends a message to a room, raising an exception if it fails.
+        """
+        self.redis = redis_client
+        self.resolve = resolve
+        self.send = send
+        self.queue = Queue.Queue()
+        self.worker = None
+        self.worker_lock = threading.Lock()
+
+    def _dedup_key(self, build_id, text):
+        """
+        Key marking a notification as already queued or delivered.
+        """
+        return 'notify_sent:{}:{}'.format(build_id, hashlib.sha1(text.encode('utf-8')).hexdigest())
+
+    def enqueue(self, build_id, text):
+        """
+        Queue a notification for delivery, unless the same notification has already been queued recently.
+
+        Returns:
+            bool: True if the notification was queued, False if it was a duplicate.
+        """
+        return self.enqueue_many([(build_id, text)]) == 1
+
+    def enqueue_many(self, notifications):
+        """
+        Queue a list of (build_id, text) notifications for delivery, skipping those already queued recently.
+
+        Each notification is claimed for PENDING_EXPIRE_SECONDS while it's queued, and only remembered for
+        DEDUP_EXPIRE_SECONDS once it has been delivered - a notification which can't be delivered is forgotten,
+        so a repeated callback for it is delivered.
+
+        Returns:
+            int: The number of notifications queued.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for build_id, text in notifications:
+            pipe.set(self._dedup_key(build_id, text), 1, ex=self.PENDING_EXPIRE_SECONDS, nx=True)
+        new_notifications = []
+        for (build_id, text), is_new in zip(notifications, pipe.execute()):
+            if is_new:
+                new_notifications.append((build_id, text))
+            else:
+                log.info("Dropping repeated notification for build %s", build_id)
+        if new_notifications:
+            self._start_worker()
+            # Queued as one item, so notifications enqueued together are always delivered together.
+            self.queue.put(new_notifications)
+        return len(new_notifications)
+
+    def wait_until_idle(self):
+        """
+        Block until every queued notification has been delivered or given up on.
+        """
+        self.queue.join()
+
+    def _start_worker(self):
+        """
+        Start the delivery thread, if it isn't running yet.
+        """
+        with self.worker_lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, name='notification-dispatcher')
+                self.worker.daemon = True
+                self.worker.start()
+
+    def _next_batch(self):
+        """
+        Wait for notifications, then collect whatever else arrives within BATCH_WINDOW_SECONDS.
+
+        Returns:
+            list: The queued lists of (build_id, text) notifications.
+        """
+        batch = [self.queue.get()]
+        deadline = time.time() + self.BATCH_WINDOW_SECONDS
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return batch
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except Queue.Empty:
+                return batch
+
+    def _run(self):
+        """
+        Deliver batches of notifications, forever.
+        """
+        while True:
+            batch = self._next_batch()
+            notifications = [notification for queued in batch for notification in queued]
+            try:
+                self._dispatch(notifications)
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Unable to dispatch build notifications")
+                self._settle([], notifications)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _dispatch(self, batch):
+        """
+        Send a batch of (build_id, text) notifications, combining the lines for each room into as few messages
+        as possible.
+        """
+        room_lines = OrderedDict()
+        for notification, lines in zip(batch, self.resolve(batch)):
+            for room, line in lines:
+                room_lines.setdefault(room, []).append((line, notification))
+
+        undelivered = set()
+        for room, lines in room_lines.items():
+            for start in range(0, len(lines), self.MAX_BATCH_LINES):
+                message_lines = lines[start:start + self.MAX_BATCH_LINES]
+                if not self._send_with_retries(room, '\n'.join(line for line, __ in message_lines)):
+                    undelivered.update(notification for __, notification in message_lines)
+        self._settle([notification for notification in batch if notification not in undelivered], undelivered)
+
+    def _settle(self, delivered, undelivered):
+        """
+        Remember delivered notifications for DEDUP_EXPIRE_SECONDS, and forget the claims on undelivered ones.
+        A notification sent to several rooms is undelivered unless it reached all of them.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for build_id, text in delivered:
+            pipe.set(self._dedup_key(build_id, text), 1, ex=self.DEDUP_EXPIRE_SECONDS)
+        for build_id, text in undelivered:
+            pipe.delete(self._dedup_key(build_id, text))
+        pipe.execute()
+
+    def _send_with_retries(self, room, content):
+        """
+        Send a message to a room, retrying with exponential backoff if it fails.
+
+        Returns:
+            bool: True if the message was sent.
+        """
+        for attempt in range(1, self.MAX_SEND_ATTEMPTS + 1):
+            try:
+                self.send(room, content)
+                return True
+            except Exception:  # pylint: disable=broad-except
+                if attempt == self.MAX_SEND_ATTEMPTS:
+                    log.exception("Giving up on sending a build notification to room %s", room)
+                    return False
+                log.warning("Unable to send a build notification to room %s, retrying", room, exc_info=True)
+                time.sleep(self.RETRY_DELAY_SECONDS * 2 ** (attempt - 1))
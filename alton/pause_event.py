@@ -4,18 +4,32 @@ including backing S3 storage and GoCD integration.
 """
 from abc import ABCMeta, abstractmethod
 from collections import defaultdict
+from cStringIO import StringIO
 from datetime import datetime
+import gzip
 import hashlib
+import json
 import logging
+import math
+from multiprocessing.pool import ThreadPool
 import os.path
+import threading
 import yaml
+try:
+    # Use the much faster libyaml-based loader/dumper when available.
+    from yaml import CSafeLoader as YAMLSafeLoader, CSafeDumper as YAMLSafeDumper
+except ImportError:
+    from yaml import SafeLoader as YAMLSafeLoader, SafeDumper as YAMLSafeDumper
 
 import boto
 from boto.exception import S3ResponseError
 from boto.s3.key import Key
+from boto.s3.prefix import Prefix
 from boto.s3.bucketlistresultset import bucket_lister
 
 from alton.gocd_api import GoCDAPI
+from alton.metrics import timed_backend
+from alton.tracing import spanned
 
 
 log = logging.getLogger(__name__)
@@ -33,6 +47,16 @@ PIPELINE_SYSTEM_INFO = {
     ]
 }
 
+# On-disk formats of pause event files, mapped to their file name suffixes.
+# Readers detect the format of each file from its suffix, so formats can be mixed within a bucket.
+PAUSE_FILE_SUFFIXES = {
+    'yaml': '.yml',
+    'json': '.json',
+}
+
+# Version written into JSON pause event files. Files with a newer version are skipped when read.
+JSON_FORMAT_VERSION = 1
+
 # pylint: disable=len-as-condition
 
 
@@ -59,11 +83,103 @@ class MultiplePauseEventsFound(Exception):
 
 class PauseEventOps(object):
     """
-    Abstract interface class for pausing operations.
+    Base class for pausing operations.
+
+    Implements the GoCD pause/unpause operations and the public interface on top of the
+    abstract pause event storage operations, which each storage backend implements.
     """
     __metaclass__ = ABCMeta
 
+    # Common time format to output/parse with strptime/strftime.
+    TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
+
+    # Number of most frequent pausers returned with pipeline statistics.
+    TOP_PAUSERS_COUNT = 3
+
+    # Set by each backend to a GoCD client for pausing/unpausing pipelines.
+    gocd_client = None
+
+    @abstractmethod
+    def _get_current_pause_events(self, pipeline_system=None, event_id=None):
+        """
+        Returns the current pause status of one or all pipeline systems and one or all events.
+
+        Arguments:
+            pipeline_system (str):
+                Pipeline system name for which to return status, e.g. edxapp, ecommerce, etc., None for all systems
+            event_id (str):
+                Event ID for which to return status, None for all events
+
+        Returns:
+            dict(pipeline_system: list()):
+                Dictionary with:
+                    keys: pipeline_system names
+                    values: lists of pipeline events as dicts
+        """
+        return {}
+
+    @abstractmethod
+    def _add_event_state_ops(self, who_paused, pipeline_system, pause_reason):
+        """
+        Store the associated state upon the addition of a pipeline pause event, returning the new event ID.
+        """
+        return
+
     @abstractmethod
+    def _remove_event_state_ops(self, who_removed, event_id):
+        """
+        Store the associated state upon the removal of a pipeline pause event, returning its pipeline system.
+
+        Raises:
+            PauseEventNotFound:
+                When the passed-in event ID is not found.
+            MultiplePauseEventsFound:
+                When the passed-in event ID has multiple stored events.
+        """
+        return
+
+    @abstractmethod
+    def pipeline_history(self, pipeline_system=None, since=None, until=None, check_cancelled=None):
+        """
+        Yields the historical pause events of one or all pipeline systems, oldest first.
+
+        Arguments:
+            pipeline_system (str):
+                Pipeline system name for which to return history, e.g. edxapp, ecommerce, etc., None for all systems
+            since (datetime):
+                Only yield events paused at or after this time, None for no lower bound.
+            until (datetime):
+                Only yield events paused before this time, None for no upper bound.
+            check_cancelled (callable):
+                Called between chunks of reading, to stop the reading by raising - None to read everything.
+
+        Yields:
+            dict: One historical pause event.
+        """
+        return
+
+    def _make_event_id(self, event_time):
+        """
+        Create a unique pause event ID from the time of the event.
+        """
+        # Hash the date/time to create a unique pause event ID - use the datetime obj for msec-uniqueness.
+        return hashlib.sha1(unicode(event_time)).hexdigest()[-8:]
+
+    @spanned
+    def _add_event_pipeline_ops(self, event_id, pipeline_system, pause_reason):
+        """
+        Perform the GoCD pipeline operations to pause a pipeline system upon the addition of a pipeline pause event.
+        """
+        # Always pause the GoCD pipelines, irregardless if the pipeline system is already paused.
+        # Pause each specified pipeline in the pipeline system.
+        for pipeline_name in PIPELINE_SYSTEM_INFO[pipeline_system]:
+            log.info(
+                "Pause event '%s' for pipeline system '%s' - pausing pipeline '%s'.",
+                event_id, pipeline_system, pipeline_name
+            )
+            self.gocd_client.pause_pipeline(pipeline_name, pause_reason)
+
+    @spanned
     def add_pipeline_event(self, who_paused, pipeline_system, pause_reason):
         """
         Pauses a pipeline system, stopping it from releasing.
@@ -77,9 +193,40 @@ class PauseEventOps(object):
             status (dict): Dictionary containing the keys:
                 event_id (str): Event ID of added pause event.
         """
-        return
+        event_id = self._add_event_state_ops(who_paused, pipeline_system, pause_reason)
+        self._add_event_pipeline_ops(event_id, pipeline_system, pause_reason)
 
-    @abstractmethod
+        pause_status = {
+            'event_id': event_id
+        }
+        log.info(
+            "add_pipeline_event: system '%s' with reason '%s' paused by '%s' - status: %s.",
+            pipeline_system, pause_reason, who_paused, pause_status
+        )
+        return pause_status
+
+    @spanned
+    def _remove_event_pipeline_ops(self, event_id, pipeline_system):
+        """
+        Perform the GoCD pipeline operations to perhaps unpause a pipeline system
+        upon the removal of a pipeline pause event.
+        """
+        # Read the current pause events again for this pipeline system.
+        remaining_pause_events = self._get_current_pause_events(pipeline_system)
+        # Count them.
+        num_remaining_events = sum([len(statuses) for __, statuses in remaining_pause_events.items()])
+        # If no more events for the pipeline system, un-pause the GoCD pipelines.
+        if num_remaining_events == 0:
+            # Unpause the pipeline system.
+            for pipeline_name in PIPELINE_SYSTEM_INFO[pipeline_system]:
+                log.info(
+                    "No events remaining for pipeline system '%s' after removing event '%s' - unpausing pipeline '%s'.",
+                    pipeline_system, event_id, pipeline_name
+                )
+                self.gocd_client.unpause_pipeline(pipeline_name)
+        return num_remaining_events
+
+    @spanned
     def remove_pipeline_event(self, who_removed, event_id):
         """
         Removes a previously-created pipeline pause event, which may unpause a pipeline system if no more
@@ -90,18 +237,32 @@ class PauseEventOps(object):
             event_id (str): ID of the pipeline event to remove.
 
         Returns:
-            response (str): Message to display to user
+            status (dict): Dictionary with keys:
+                pipeline_system (str): Pipeline system name associated with event ID.
+                unpaused (bool): True if removing pause event caused pipeline system to be unpaused.
+                num_remaining_events (int): Number of pause events remaining for the pipeline system.
 
         Raises:
             PauseEventNotFound:
                 When the passed-in event ID is not found.
             MultiplePauseEventsFound:
-                When the passed-in event ID has multiple S3 files.
+                When the passed-in event ID has multiple stored events.
         """
-        return
+        pipeline_system = self._remove_event_state_ops(who_removed, event_id)
+        num_remaining_events = self._remove_event_pipeline_ops(event_id, pipeline_system)
+        remove_status = {
+            'pipeline_system': pipeline_system,
+            'unpaused': num_remaining_events == 0,
+            'num_remaining_events': num_remaining_events
+        }
+        log.info(
+            "remove_pipeline_event: event ID '%s' removed by '%s' - status: %s",
+            event_id, who_removed, remove_status
+        )
+        return remove_status
 
-    @abstractmethod
-    def pipeline_status(self, pipeline_system, paused_only):
+    @spanned
+    def pipeline_status(self, pipeline_system=None, paused_only=False):
         """
         Returns the status of one or all pipeline systems, optionally filtered by paused pipeline systems only.
 
@@ -117,7 +278,137 @@ class PauseEventOps(object):
                     keys: pipeline_system names
                     values: lists of pipeline events as dicts
         """
-        return {}
+        pause_status = self._get_current_pause_events(pipeline_system)
+
+        # Always return the status of any specified pipeline system, even if not paused.
+        if pipeline_system and pipeline_system not in pause_status:
+            pause_status[pipeline_system] = []
+
+        if not paused_only:
+            # Add the pipeline systems which had no current pause files - to indicate they are active.
+            for one_system in PIPELINE_SYSTEM_INFO:
+                if one_system not in pause_status:
+                    pause_status[one_system] = []
+
+        log.info(
+            "pipeline_status: system '%s' with paused_only '%s' - returning: %s",
+            pipeline_system, paused_only, dict(pause_status)
+        )
+        return dict(pause_status)
+
+    def _aggregate_pause_events(self, pause_events, now):
+        """
+        Aggregate pause events into per-system statistics which can be merged across months.
+        Unresolved events count as paused up until now.
+        """
+        event_stats = {}
+        for pause_data in pause_events:
+            system_stats = event_stats.setdefault(
+                pause_data['pipeline_system'],
+                {'count': 0, 'paused_seconds': 0, 'resolve_seconds': [], 'pausers': {}}
+            )
+            time_paused = datetime.strptime(pause_data['time_paused'], self.TIME_FORMAT)
+            if pause_data.get('time_cleared'):
+                paused_seconds = int(
+                    (datetime.strptime(pause_data['time_cleared'], self.TIME_FORMAT) - time_paused).total_seconds()
+                )
+                system_stats['resolve_seconds'].append(paused_seconds)
+            else:
+                paused_seconds = int((now - time_paused).total_seconds())
+            system_stats['count'] += 1
+            system_stats['paused_seconds'] += paused_seconds
+            who_paused = pause_data.get('who_paused')
+            system_stats['pausers'][who_paused] = system_stats['pausers'].get(who_paused, 0) + 1
+        return event_stats
+
+    def _merge_pause_stats(self, totals, event_stats, pipeline_system=None):
+        """
+        Merge per-system statistics from _aggregate_pause_events() into the totals, optionally for one system only.
+        """
+        for system, system_stats in event_stats.items():
+            if pipeline_system and pipeline_system != system:
+                continue
+            system_totals = totals.setdefault(
+                system, {'count': 0, 'paused_seconds': 0, 'resolve_seconds': [], 'pausers': {}}
+            )
+            system_totals['count'] += system_stats['count']
+            system_totals['paused_seconds'] += system_stats['paused_seconds']
+            system_totals['resolve_seconds'].extend(system_stats['resolve_seconds'])
+            for who_paused, count in system_stats['pausers'].items():
+                system_totals['pausers'][who_paused] = system_totals['pausers'].get(who_paused, 0) + count
+
+    def _summarize_pause_stats(self, totals, pipeline_system=None):
+        """
+        Turn the merged per-system statistics into the summary returned by pipeline_stats().
+        """
+        pipeline_stats = {}
+        for system, system_totals in totals.items():
+            resolve_seconds = sorted(system_totals['resolve_seconds'])
+            if resolve_seconds:
+                mean_resolve_seconds = float(sum(resolve_seconds)) / len(resolve_seconds)
+                # Nearest-rank percentile.
+                p95_resolve_seconds = resolve_seconds[int(math.ceil(0.95 * len(resolve_seconds))) - 1]
+            else:
+                mean_resolve_seconds = p95_resolve_seconds = None
+            top_pausers = sorted(system_totals['pausers'].items(), key=lambda pauser: (-pauser[1], pauser[0]))
+            pipeline_stats[system] = {
+                'count': system_totals['count'],
+                'paused_seconds': system_totals['paused_seconds'],
+                'resolved': len(resolve_seconds),
+                'mean_resolve_seconds': mean_resolve_seconds,
+                'p95_resolve_seconds': p95_resolve_seconds,
+                'top_pausers': top_pausers[:self.TOP_PAUSERS_COUNT],
+            }
+
+        # Always return the statistics of any specified pipeline system, even if never paused.
+        if pipeline_system and pipeline_system not in pipeline_stats:
+            pipeline_stats[pipeline_system] = {
+                'count': 0, 'paused_seconds': 0, 'resolved': 0,
+                'mean_resolve_seconds': None, 'p95_resolve_seconds': None, 'top_pausers': [],
+            }
+
+        return pipeline_stats
+
+    def pipeline_stats(self, pipeline_system=None, since=None, until=None, now=None, check_cancelled=None):
+        """
+        Returns aggregate pause statistics of one or all pipeline systems over the [since, until) range.
+
+        Arguments:
+            pipeline_system (str):
+                Pipeline system name for which to return statistics, None for all systems
+            since (datetime):
+                Only count events paused at or after this time, None for no lower bound.
+            until (datetime):
+                Only count events paused before this time, None for no upper bound.
+            now (datetime):
+                Current time, used to determine the duration of unresolved events.
+            check_cancelled (callable):
+                Called between chunks of reading, to stop the reading by raising - None to read everything.
+
+        Returns:
+            dict(pipeline_system: dict()):
+                Dictionary with:
+                    keys: pipeline_system names
+                    values: dicts with the keys:
+                        count (int): Number of pause events.
+                        paused_seconds (int): Total time paused by the events.
+                        resolved (int): Number of resolved pause events.
+                        mean_resolve_seconds (float): Mean time to resolve, None if none were resolved.
+                        p95_resolve_seconds (int): 95th percentile time to resolve, None if none were resolved.
+                        top_pausers (list): Up to TOP_PAUSERS_COUNT (who_paused, count) tuples, most frequent first.
+        """
+        now = now or datetime.now()
+        totals = {}
+        event_stats = self._aggregate_pause_events(
+            self.pipeline_history(pipeline_system, since, until, check_cancelled), now
+        )
+        self._merge_pause_stats(totals, event_stats, pipeline_system)
+        pipeline_stats = self._summarize_pause_stats(totals, pipeline_system)
+        log.info(
+            "pipeline_stats: system '%s' from '%s' until '%s' - returning: %s",
+            pipeline_system, since, until, pipeline_stats
+        )
+        return pipeline_stats
 
 
 class S3PauseEventOps(PauseEventOps):
@@ -133,10 +424,34 @@ class S3PauseEventOps(PauseEventOps):
     # Subdirectory holding all the historical pause events.
     HISTORY_DIRECTORY = PAUSE_DIRECTORY + 'history/'
 
-    # Common time format to output/parse with strptime/strftime.
-    TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
+    # Subdirectory holding the compacted monthly rollups of historical pause events.
+    ROLLUP_DIRECTORY = PAUSE_DIRECTORY + 'rollup/'
+
+    # Index of all the compacted months, with the rollup file and per-system event counts of each.
+    ROLLUP_INDEX_FILEPATH = ROLLUP_DIRECTORY + 'index.json'
+
+    # Version of the rollup file/index format.
+    ROLLUP_FORMAT_VERSION = 1
+
+    # Cache of the aggregate pause statistics of each closed, fully-resolved month.
+    STATS_CACHE_FILEPATH = PAUSE_DIRECTORY + 'stats/monthly.json'
+
+    # Version of the statistics cache format.
+    STATS_FORMAT_VERSION = 1
 
-    def __init__(self, bucket_name, gocd_username, gocd_password, gocd_url):
+    # Maximum number of historical pause files fetched from S3 at once.
+    HISTORY_FETCH_CONCURRENCY = 8
+
+    def __init__(self, bucket_name, gocd_username, gocd_password, gocd_url, file_format='yaml'):
+        if file_format not in PAUSE_FILE_SUFFIXES:
+            raise ValueError("Unknown pause file format '{}'. Known formats: {}".format(
+                file_format, ', '.join(sorted(PAUSE_FILE_SUFFIXES))
+            ))
+        # Format in which new pause event files are written.
+        self.file_format = file_format
+        self.bucket_name = bucket_name
+        # The S3 connection of each history fetching thread.
+        self.fetch_local = threading.local()
         self.s3_conn = boto.connect_s3()
         # Get or create the specified bucket.
         try:
@@ -150,6 +465,7 @@ class S3PauseEventOps(PauseEventOps):
         # Create a GoCD client for pausing/unpausing pipelines.
         self.gocd_client = GoCDAPI(gocd_username, gocd_password, gocd_url)
 
+    @timed_backend('s3', 'put')
     def _create_s3_file(self, filepath, str_contents):
         """
         Create an S3 file at the filepath, writing the str_contents string to it.
@@ -157,6 +473,7 @@ class S3PauseEventOps(PauseEventOps):
         s3_file = Key(self.pipeline_bucket, filepath)
         s3_file.set_contents_from_string(str_contents)
 
+    @timed_backend('s3', 'delete')
     def _delete_s3_file(self, filepath):
         """
         Delete an S3 file at the filepath.
@@ -164,12 +481,57 @@ class S3PauseEventOps(PauseEventOps):
         s3_file = Key(self.pipeline_bucket, filepath)
         s3_file.delete()
 
+    @timed_backend('s3', 'head')
     def _s3_file_exists(self, filepath):
         """
         Returns True if filepath exists in the bucket, else False.
         """
         return self.pipeline_bucket.get_key(filepath) is not None
 
+    def _pause_file_format(self, key_name):
+        """
+        Returns the format of a pause event file, detected from its suffix, or None if it isn't a pause event file.
+        """
+        for file_format, suffix in PAUSE_FILE_SUFFIXES.items():
+            if key_name.endswith(suffix):
+                return file_format
+        return None
+
+    def _encode_pause_file(self, key_name, pause_data):
+        """
+        Serialize pause event data into the format of the named pause event file.
+        """
+        if self._pause_file_format(key_name) == 'json':
+            json_data = dict(pause_data, format_version=JSON_FORMAT_VERSION)
+            return json.dumps(json_data, sort_keys=True)
+        return yaml.dump(pause_data, Dumper=YAMLSafeDumper)
+
+    def _decode_pause_file(self, key_name, str_contents):
+        """
+        Parse the contents of the named pause event file, detecting its format from the file name.
+        Returns None if the contents cannot be parsed, or don't hold pause event data.
+        """
+        file_format = self._pause_file_format(key_name)
+        if file_format == 'json':
+            try:
+                pause_data = json.loads(str_contents)
+            except ValueError:
+                pause_data = None
+        else:
+            try:
+                pause_data = yaml.load(str_contents, Loader=YAMLSafeLoader)
+            except yaml.YAMLError:
+                pause_data = None
+        # Pause event data is always a mapping - any other value is as good as unparseable.
+        if not isinstance(pause_data, dict):
+            log.warning('Unable to load file as %s: %s - continuing...', file_format.upper(), key_name)
+            return None
+        if file_format == 'json' and pause_data.pop('format_version', JSON_FORMAT_VERSION) > JSON_FORMAT_VERSION:
+            log.warning('Unsupported pause file format version: %s - continuing...', key_name)
+            return None
+        return pause_data
+
+    @timed_backend('s3', 'list_current')
     def _get_current_pause_events(self, pipeline_system=None, event_id=None):
         """
         Returns the current pause status of one or all pipeline systems and one or all events.
@@ -188,16 +550,11 @@ class S3PauseEventOps(PauseEventOps):
         """
         pause_status = defaultdict(list)
         for key in bucket_lister(self.pipeline_bucket, prefix=self.CURRENT_DIRECTORY):
-            # Only read YAML files - at least, files with a .yml suffix.
-            if not key.name.endswith('.yml'):
-                continue
-            try:
-                pause_data = yaml.safe_load(key.get_contents_as_string())
-            except yaml.YAMLError:
-                log.warning('Unable to load file as YAML: %s - continuing...', key.name)
+            # Only read pause event files - at least, files with a known suffix.
+            if self._pause_file_format(key.name) is None:
                 continue
+            pause_data = self._decode_pause_file(key.name, key.get_contents_as_string())
             if pause_data is None:
-                log.warning('Unable to load file as YAML: %s - continuing...', key.name)
                 continue
             # If pipeline system was specified and this pause file isn't for that system, ignore it.
             if pipeline_system and pipeline_system != pause_data['pipeline_system']:
@@ -222,14 +579,329 @@ class S3PauseEventOps(PauseEventOps):
             pause_file=pause_file_name
         )
 
+    def _history_month_prefixes(self, since=None, until=None):
+        """
+        Yields the historical month directories (e.g. paused/history/2017/04/) in chronological order,
+        skipping any month which cannot hold events paused in the [since, until) range.
+        Only directory prefixes are listed - no pause files are read.
+        """
+        for year_prefix in self._list_subdirectories(self.HISTORY_DIRECTORY):
+            try:
+                year = int(year_prefix[len(self.HISTORY_DIRECTORY):].strip('/'))
+            except ValueError:
+                continue
+            if (since and year < since.year) or (until and year > until.year):
+                continue
+            for month_prefix in self._list_subdirectories(year_prefix):
+                try:
+                    month = int(month_prefix[len(year_prefix):].strip('/'))
+                except ValueError:
+                    continue
+                if since and (year, month) < (since.year, since.month):
+                    continue
+                if until and datetime(year, month, 1) >= until:
+                    continue
+                yield month_prefix
+
+    def _list_subdirectories(self, prefix):
+        """
+        Returns the sorted names of the "directories" directly beneath prefix in the bucket.
+        """
+        return sorted(
+            item.name for item in bucket_lister(self.pipeline_bucket, prefix=prefix, delimiter='/')
+            if isinstance(item, Prefix)
+        )
+
+    def _parse_pause_event_filename(self, key_name):
+        """
+        Split the file name of a pause event file into its pipeline system, pause time and event ID.
+        Returns None if the file name isn't in the expected format.
+        """
+        file_name = os.path.basename(key_name)
+        file_format = self._pause_file_format(file_name)
+        if file_format is None:
+            return None
+        try:
+            file_base = file_name[:-len(PAUSE_FILE_SUFFIXES[file_format])]
+            pipeline_system, date_str, time_str, event_id = file_base.rsplit('_', 3)
+            event_dt = datetime.strptime('{}_{}'.format(date_str, time_str), self.TIME_FORMAT)
+        except ValueError:
+            return None
+        return pipeline_system, event_dt, event_id
+
+    @timed_backend('s3', 'get_history')
+    def _load_history_file(self, key):
+        """
+        Read and parse a single historical pause file, returning None if it cannot be loaded.
+        The file is read over the calling thread's own connection, so it can be called from a fetch pool.
+        """
+        contents = Key(self._fetch_bucket(), key.name).get_contents_as_string()
+        pause_data = self._decode_pause_file(key.name, contents)
+        if pause_data is None:
+            return None
+        pause_data['key_name'] = os.path.basename(key.name)
+        return pause_data
+
+    def _fetch_bucket(self):
+        """
+        Returns the pipeline bucket, over an S3 connection of the calling thread's own.
+        """
+        bucket = getattr(self.fetch_local, 'bucket', None)
+        if bucket is None:
+            bucket = self.fetch_local.bucket = boto.connect_s3().get_bucket(self.bucket_name, validate=False)
+        return bucket
+
+    def _month_history_events(self, month_prefix, pipeline_system, since, until, pool):
+        """
+        Yields the events of one historical month, oldest first, by reading its individual pause files.
+        The pause time is read from each file name so out-of-range files are never fetched,
+        and file bodies are fetched in bounded batches by the pool's threads.
+        """
+        # File names start with the pipeline system, so the listing itself can be narrowed to it.
+        list_prefix = month_prefix + ('{}_'.format(pipeline_system) if pipeline_system else '')
+        month_keys = []
+        for key in bucket_lister(self.pipeline_bucket, prefix=list_prefix):
+            name_parts = self._parse_pause_event_filename(key.name)
+            if name_parts is None:
+                continue
+            key_system, event_dt, __ = name_parts
+            if pipeline_system and pipeline_system != key_system:
+                continue
+            if (since and event_dt < since) or (until and event_dt >= until):
+                continue
+            month_keys.append((event_dt, key.name, key))
+        month_keys.sort(key=lambda month_key: month_key[:2])
+
+        batch_size = self.HISTORY_FETCH_CONCURRENCY
+        for batch_start in range(0, len(month_keys), batch_size):
+            batch = [key for __, ___, key in month_keys[batch_start:batch_start + batch_size]]
+            for pause_data in pool.map(self._load_history_file, batch):
+                if pause_data is not None:
+                    yield pause_data
+
+    def _month_rollup_events(self, rollup_info, pipeline_system, since, until):
+        """
+        Yields the events of one compacted historical month, oldest first, from its rollup file.
+        """
+        # The index records which systems have events in the month - skip the fetch if there's nothing to find.
+        if pipeline_system and pipeline_system not in rollup_info['systems']:
+            return
+        rollup_key = self.pipeline_bucket.get_key(rollup_info['key'])
+        if rollup_key is None:
+            log.warning("Rollup file '%s' is listed in the rollup index but missing.", rollup_info['key'])
+            return
+        with gzip.GzipFile(fileobj=StringIO(rollup_key.get_contents_as_string())) as rollup_file:
+            for line in rollup_file:
+                pause_data = json.loads(line)
+                if pipeline_system and pipeline_system != pause_data['pipeline_system']:
+                    continue
+                event_dt = datetime.strptime(pause_data['time_paused'], self.TIME_FORMAT)
+                if (since and event_dt < since) or (until and event_dt >= until):
+                    continue
+                yield pause_data
+
+    def pipeline_history(self, pipeline_system=None, since=None, until=None, check_cancelled=None):
+        """
+        Yields the historical pause events of one or all pipeline systems, oldest first.
+
+        Only the month directories overlapping the [since, until) range are read. Months which have
+        been compacted by compact_history() are read from their single rollup file; all other months are
+        read file-by-file. At most one month of key names or rollup data is held in memory.
+
+        Arguments:
+            pipeline_system (str):
+                Pipeline system name for which to return history, e.g. edxapp, ecommerce, etc., None for all systems
+            since (datetime):
+                Only yield events paused at or after this time, None for no lower bound.
+            until (datetime):
+                Only yield events paused before this time, None for no upper bound.
+            check_cancelled (callable):
+                Called between chunks of reading, to stop the reading by raising - None to read everything.
+
+        Yields:
+            dict: One historical pause event.
+        """
+        rollup_index = self._load_rollup_index()
+        pool = ThreadPool(self.HISTORY_FETCH_CONCURRENCY)
+        try:
+            for month_prefix in self._history_month_prefixes(since, until):
+                if check_cancelled:
+                    check_cancelled()
+                for pause_data in self._month_events(month_prefix, rollup_index, pipeline_system, since, until, pool):
+                    yield pause_data
+        finally:
+            pool.terminate()
+
+    def _month_events(self, month_prefix, rollup_index, pipeline_system, since, until, pool):
+        """
+        Yields the events of one historical month, oldest first, from its rollup file if it has been compacted.
+        """
+        rollup_info = rollup_index['months'].get(self._month_id(month_prefix))
+        if rollup_info:
+            return self._month_rollup_events(rollup_info, pipeline_system, since, until)
+        return self._month_history_events(month_prefix, pipeline_system, since, until, pool)
+
+    def _month_id(self, month_prefix):
+        """
+        Returns the month ID (e.g. 2017/04) of a historical month directory.
+        """
+        return month_prefix[len(self.HISTORY_DIRECTORY):].strip('/')
+
+    def _load_rollup_index(self):
+        """
+        Read the index of compacted historical months, returning an empty index if none exists yet.
+        """
+        index_key = self.pipeline_bucket.get_key(self.ROLLUP_INDEX_FILEPATH)
+        if index_key is None:
+            return {'version': self.ROLLUP_FORMAT_VERSION, 'months': {}}
+        return json.loads(index_key.get_contents_as_string())
+
+    def compact_history(self, now=None):
+        """
+        Rolls each closed historical month into a single gzipped JSON-lines file, oldest event first,
+        and records it in the rollup index so pipeline_history() reads one file instead of one per event.
+
+        A month is only compacted once it has ended and all of its pause events have been resolved,
+        since resolving an event rewrites its individual history file. The individual files are left in place.
+        Compacted months can no longer change, so their pause statistics are cached for pipeline_stats() too.
+
+        Arguments:
+            now (datetime): Time used to determine which months are closed, defaulting to the current time.
+
+        Returns:
+            list(str): The months (e.g. 2017/04) which were compacted.
+        """
+        now = now or datetime.now()
+        current_month_start = datetime(now.year, now.month, 1)
+        rollup_index = self._load_rollup_index()
+        stats_cache = self._load_stats_cache()
+        compacted = []
+        pool = ThreadPool(self.HISTORY_FETCH_CONCURRENCY)
+        try:
+            for month_prefix in self._history_month_prefixes(until=current_month_start):
+                month_id = self._month_id(month_prefix)
+                rollup_info = rollup_index['months'].get(month_id)
+                if rollup_info:
+                    if month_id not in stats_cache['months']:
+                        # Compacted before its statistics were cached.
+                        month_events = list(self._month_rollup_events(rollup_info, None, None, None))
+                        self._cache_month_stats(stats_cache, month_id, month_events, now)
+                    continue
+                month_events = list(self._month_history_events(month_prefix, None, None, None, pool))
+                if any(pause_data.get('time_cleared') is None for pause_data in month_events):
+                    log.info("compact_history: month '%s' has unresolved pause events - not compacting.", month_id)
+                    continue
+
+                rollup_contents = StringIO()
+                with gzip.GzipFile(fileobj=rollup_contents, mode='wb') as rollup_file:
+                    for pause_data in month_events:
+                        rollup_file.write(json.dumps(pause_data, sort_keys=True) + '\n')
+                rollup_filepath = '{rollup_dir}{month_id}.jsonl.gz'.format(
+                    rollup_dir=self.ROLLUP_DIRECTORY, month_id=month_id
+                )
+                self._create_s3_file(rollup_filepath, rollup_contents.getvalue())
+
+                systems = defaultdict(int)
+                for pause_data in month_events:
+                    systems[pause_data['pipeline_system']] += 1
+                rollup_index['months'][month_id] = {
+                    'key': rollup_filepath,
+                    'count': len(month_events),
+                    'systems': dict(systems),
+                }
+                # Write the index after each month, so an interrupted compaction keeps the finished months.
+                self._create_s3_file(self.ROLLUP_INDEX_FILEPATH, json.dumps(rollup_index, sort_keys=True))
+                self._cache_month_stats(stats_cache, month_id, month_events, now)
+                compacted.append(month_id)
+        finally:
+            pool.terminate()
+
+        log.info("compact_history: compacted months %s.", compacted)
+        return compacted
+
+    def _load_stats_cache(self):
+        """
+        Read the cached per-month pause statistics, returning an empty cache if none exists yet.
+        """
+        cache_key = self.pipeline_bucket.get_key(self.STATS_CACHE_FILEPATH)
+        if cache_key is None:
+            return {'version': self.STATS_FORMAT_VERSION, 'months': {}}
+        return json.loads(cache_key.get_contents_as_string())
+
+    def _cache_month_stats(self, stats_cache, month_id, month_events, now):
+        """
+        Add the pause statistics of a compacted month to the statistics cache, and write the cache.
+        """
+        stats_cache['months'][month_id] = self._aggregate_pause_events(month_events, now)
+        self._create_s3_file(self.STATS_CACHE_FILEPATH, json.dumps(stats_cache, sort_keys=True))
+
+    def pipeline_stats(self, pipeline_system=None, since=None, until=None, now=None, check_cancelled=None):
+        """
+        Returns aggregate pause statistics of one or all pipeline systems over the [since, until) range.
+
+        Statistics are gathered month by month over the history partitions. The aggregates of whole months
+        compacted by compact_history() are read from its statistics cache, rather than from the months' events.
+
+        Arguments:
+            pipeline_system (str):
+                Pipeline system name for which to return statistics, None for all systems
+            since (datetime):
+                Only count events paused at or after this time, None for no lower bound.
+            until (datetime):
+                Only count events paused before this time, None for no upper bound.
+            now (datetime):
+                Current time, used to determine the duration of unresolved events.
+            check_cancelled (callable):
+                Called between chunks of reading, to stop the reading by raising - None to read everything.
+
+        Returns:
+            dict(pipeline_system: dict()): As for PauseEventOps.pipeline_stats().
+        """
+        now = now or datetime.now()
+        rollup_index = self._load_rollup_index()
+        stats_cache = self._load_stats_cache()
+        totals = {}
+        pool = ThreadPool(self.HISTORY_FETCH_CONCURRENCY)
+        try:
+            for month_prefix in self._history_month_prefixes(since, until):
+                if check_cancelled:
+                    check_cancelled()
+                month_id = self._month_id(month_prefix)
+                month_start = datetime.strptime(month_id, '%Y/%m')
+                next_month_start = datetime(
+                    month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1
+                )
+                whole_month = (
+                    (since is None or since <= month_start) and
+                    (until is None or next_month_start <= until)
+                )
+                if whole_month and month_id in stats_cache['months']:
+                    month_stats = stats_cache['months'][month_id]
+                else:
+                    month_events = list(self._month_events(month_prefix, rollup_index, None, since, until, pool))
+                    month_stats = self._aggregate_pause_events(month_events, now)
+
+                self._merge_pause_stats(totals, month_stats, pipeline_system)
+        finally:
+            pool.terminate()
+
+        pipeline_stats = self._summarize_pause_stats(totals, pipeline_system)
+        log.info(
+            "pipeline_stats: system '%s' from '%s' until '%s' - returning: %s",
+            pipeline_system, since, until, pipeline_stats
+        )
+        return pipeline_stats
+
     def _make_pause_event_filename(self, event_id, time_str, pipeline_system):
         """
-        Construct the file name of a YAML file holding pause event data.
+        Construct the file name of a file holding pause event data, in the configured file format.
         """
-        return '{pipeline_system}_{time_str}_{event_id}.yml'.format(
-            event_id=event_id, time_str=time_str, pipeline_system=pipeline_system
+        return '{pipeline_system}_{time_str}_{event_id}{suffix}'.format(
+            event_id=event_id, time_str=time_str, pipeline_system=pipeline_system,
+            suffix=PAUSE_FILE_SUFFIXES[self.file_format]
         )
 
+    @spanned
     def _add_event_state_ops(self, who_paused, pipeline_system, pause_reason):
         """
         Perform the S3 operations to store the associated state upon the addition of a pipeline pause event.
@@ -237,8 +909,7 @@ class S3PauseEventOps(PauseEventOps):
         # Capture the current date/time as a string.
         current_time = datetime.now()
         current_time_str = current_time.strftime(self.TIME_FORMAT)
-        # Hash the date/time to create a unique pause event ID - use the datetime obj for msec-uniqueness.
-        event_id = hashlib.sha1(unicode(current_time)).hexdigest()[-8:]
+        event_id = self._make_event_id(current_time)
         event_contents = {
             'event_id': event_id,
             'pipeline_system': pipeline_system,
@@ -254,52 +925,15 @@ class S3PauseEventOps(PauseEventOps):
             current_dir=self.CURRENT_DIRECTORY,
             pause_file=pause_file_name
         )
-        self._create_s3_file(current_pause_filepath, yaml.safe_dump(event_contents))
+        self._create_s3_file(current_pause_filepath, self._encode_pause_file(pause_file_name, event_contents))
 
         # Create the historical pause file.
         history_pause_filepath = self._make_history_pause_filepath(current_time, pause_file_name)
-        self._create_s3_file(history_pause_filepath, yaml.safe_dump(event_contents))
+        self._create_s3_file(history_pause_filepath, self._encode_pause_file(pause_file_name, event_contents))
 
         return event_id
 
-    def _add_event_pipeline_ops(self, event_id, pipeline_system, pause_reason):
-        """
-        Perform the GoCD pipeline operations to pause a pipeline system upon the addition of a pipeline pause event.
-        """
-        # Always pause the GoCD pipelines, irregardless if the pipeline system is already paused.
-        # Pause each specified pipeline in the pipeline system.
-        for pipeline_name in PIPELINE_SYSTEM_INFO[pipeline_system]:
-            log.info(
-                "Pause event '%s' for pipeline system '%s' - pausing pipeline '%s'.",
-                event_id, pipeline_system, pipeline_name
-            )
-            self.gocd_client.pause_pipeline(pipeline_name, pause_reason)
-
-    def add_pipeline_event(self, who_paused, pipeline_system, pause_reason):
-        """
-        Pauses a pipeline system, stopping it from releasing.
-
-        Arguments:
-            who_paused (str): HipChat username which paused the pipeline.
-            pipeline_system (str): Pipeline system name to pause, e.g. edxapp, ecommerce, etc.
-            pause_reason (str): Reason why pipeline system was paused.
-
-        Returns:
-            status (dict): Dictionary containing the keys:
-                event_id (str): Event ID of added pause event.
-        """
-        event_id = self._add_event_state_ops(who_paused, pipeline_system, pause_reason)
-        self._add_event_pipeline_ops(event_id, pipeline_system, pause_reason)
-
-        pause_status = {
-            'event_id': event_id
-        }
-        log.info(
-            "add_pipeline_event: system '%s' with reason '%s' paused by '%s' - status: %s.",
-            pipeline_system, pause_reason, who_paused, pause_status
-        )
-        return pause_status
-
+    @spanned
     def _remove_event_state_ops(self, who_removed, event_id):
         """
         Perform the S3 operations to store the associated state
@@ -330,7 +964,8 @@ class S3PauseEventOps(PauseEventOps):
 
         pause_data['time_cleared'] = current_time_str
         pause_data['who_cleared'] = who_removed
-        self._create_s3_file(history_pause_filepath, yaml.safe_dump(pause_data))
+        # Keep the historical file in its original format, irrespective of the configured format.
+        self._create_s3_file(history_pause_filepath, self._encode_pause_file(pause_data['key_name'], pause_data))
 
         # Remove the current event.
         current_event_filepath = '{current_dir}{event_filename}'.format(
@@ -350,91 +985,3 @@ class S3PauseEventOps(PauseEventOps):
                 current_event_filepath, event_id
             )
         return pause_data['pipeline_system']
-
-    def _remove_event_pipeline_ops(self, event_id, pipeline_system):
-        """
-        Perform the GoCD pipeline operations to perhaps unpause a pipeline system
-        upon the removal of a pipeline pause event.
-        """
-        # Read the current pause events from S3 again for this pipeline system.
-        remaining_pause_events = self._get_current_pause_events(pipeline_system)
-        # Count them.
-        num_remaining_events = sum([len(statuses) for __, statuses in remaining_pause_events.items()])
-        # If no more events for the pipeline system, un-pause the GoCD pipelines.
-        if num_remaining_events == 0:
-            # Unpause the pipeline system.
-            for pipeline_name in PIPELINE_SYSTEM_INFO[pipeline_system]:
-                log.info(
-                    "No events remaining for pipeline system '%s' after removing event '%s' - unpausing pipeline '%s'.",
-                    pipeline_system, event_id, pipeline_name
-                )
-                self.gocd_client.unpause_pipeline(pipeline_name)
-        return num_remaining_events
-
-    def remove_pipeline_event(self, who_removed, event_id):
-        """
-        Removes a previously-created pipeline pause event, which may unpause a pipeline system if no more
-        pause events remain.
-
-        Arguments:
-            who_removed (str): HipChat username who removed the event.
-            event_id (str): ID of the pipeline event to remove.
-
-        Returns:
-            status (dict): Dictionary with keys:
-                pipeline_system (str): Pipeline system name associated with event ID.
-                unpaused (bool): True if removing pause event caused pipeline system to be unpaused.
-                num_remaining_events (int): Number of pause events remaining for the pipeline system.
-
-        Raises:
-            PauseEventNotFound:
-                When the passed-in event ID is not found.
-            MultiplePauseEventsFound:
-                When the passed-in event ID has multiple S3 files.
-        """
-        pipeline_system = self._remove_event_state_ops(who_removed, event_id)
-        num_remaining_events = self._remove_event_pipeline_ops(event_id, pipeline_system)
-        remove_status = {
-            'pipeline_system': pipeline_system,
-            'unpaused': num_remaining_events == 0,
-            'num_remaining_events': num_remaining_events
-        }
-        log.info(
-            "remove_pipeline_event: event ID '%s' removed by '%s' - status: %s",
-            event_id, who_removed, remove_status
-        )
-        return remove_status
-
-    def pipeline_status(self, pipeline_system=None, paused_only=False):
-        """
-        Returns the status of one or all pipeline systems, optionally filtered by paused pipeline systems only.
-
-        Arguments:
-            pipeline_system (str):
-                Pipeline system name for which to return status, e.g. edxapp, ecommerce, etc., None for all systems
-            paused_only (bool):
-                True to return only the status of paused pipelines, False to return paused & unpaused.
-
-        Returns:
-            dict(pipeline_system: list()):
-                Dictionary with:
-                    keys: pipeline_system names
-                    values: lists of pipeline events as dicts
-        """
-        pause_status = self._get_current_pause_events(pipeline_system)
-
-        # Always return the status of any specified pipeline system, even if not paused.
-        if pipeline_system and pipeline_system not in pause_status:
-            pause_status[pipeline_system] = []
-
-        if not paused_only:
-            # Add the pipeline systems which had no current pause files - to indicate they are active.
-            for one_system in PIPELINE_SYSTEM_INFO:
-                if one_system not in pause_status:
-                    pause_status[one_system] = []
-
-        log.info(
-            "pipeline_status: system '%s' with paused_only '%s' - returning: %s",
-            pipeline_system, paused_only, dict(pause_status)
-        )
-        return dict(pause_status)
@@ -0,0 +1,168 @@
+"""
+Shared limit on the rate of AWS API calls, per account and API, which backs off when AWS throttles us.
+
+EC2 and ELB limit the request rate of each account, and requests over the limit fail with
+RequestLimitExceeded - for every client of the account, not just the bot. So the bot's calls draw on a
+token bucket per (account, API): calls over the rate wait their turn, and a throttling error slows the
+bucket down and retries the call, after which the rate creeps back up as calls succeed.
+"""
+import logging
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+# Error codes AWS returns when throttling requests.
+THROTTLING_ERROR_CODES = ('RequestLimitExceeded', 'Throttling', 'ThrottlingException')
+
+# Calls per second and burst size allowed for each API - a share of the account's limits for the bot.
+API_LIMITS = {
+    'get_all_instances': (5.0, 20),
+    'get_all_load_balancers': (2.0, 10),
+    'get_all_images': (5.0, 20),
+}
+
+# Limits of APIs missing from API_LIMITS.
+DEFAULT_LIMIT = (2.0, 10)
+
+
+class TokenBucket(object):
+    """
+    Token bucket allowing `rate` calls per second on average, and bursts of up to `burst` calls.
+
+    Callers reserve a token and wait until it's due, so they're served in the order they asked.
+    """
+    # Factor applied to the rate on each throttling error.
+    BACKOFF_FACTOR = 0.5
+
+    # Lowest rate backoff can slow to, as a fraction of the configured rate.
+    MIN_RATE_FRACTION = 0.05
+
+    # Fraction of the configured rate restored by each successful call.
+    RECOVERY_FRACTION = 0.05
+
+    def __init__(self, rate, burst):
+        self.lock = threading.Lock()
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        # Number of calls waiting for their token.
+        self.waiting = 0
+
+    def _refill(self):
+        """
+        Add the tokens accrued since the last update.
+        """
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """
+        Take a token, returning how many seconds to wait before making the call.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def throttled(self):
+        """
+        Slow down after a throttling error, and drop any saved-up burst.
+        """
+        with self.lock:
+            self._refill()
+            self.rate = max(self.base_rate * self.MIN_RATE_FRACTION, self.rate * self.BACKOFF_FACTOR)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        """
+        Speed back up towards the configured rate after a successful call.
+        """
+        with self.lock:
+            if self.rate < self.base_rate:
+                self._refill()
+                self.rate = min(self.base_rate, self.rate + self.base_rate * self.RECOVERY_FRACTION)
+
+
+class AwsRateLimiter(object):
+    """
+    Token buckets for each (account, API) the bot calls, shared by all plugins.
+    """
+    # Most times a throttled call is made.
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, limits=None):
+        self.limits = API_LIMITS if limits is None else limits
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def bucket(self, account, api):
+        """
+        Returns the token bucket of an account's API, creating it on first use.
+        """
+        with self.lock:
+            if (account, api) not in self.buckets:
+                self.buckets[(account, api)] = TokenBucket(*self.limits.get(api, DEFAULT_LIMIT))
+            return self.buckets[(account, api)]
+
+    def call(self, account, api, func, *args, **kwargs):
+        """
+        Returns func(*args, **kwargs), once the account's API has a token for it, retrying it on throttling.
+
+        Arguments:
+            account (str): AWS profile the call is made with.
+            api (str): Name of the API called, e.g. 'get_all_instances'.
+            func (callable): Makes the call.
+
+        Raises:
+            Any error func raises, including throttling errors once MAX_ATTEMPTS calls have been throttled.
+        """
+        bucket = self.bucket(account, api)
+        attempt = 1
+        while True:
+            wait = bucket.reserve()
+            if wait > 0:
+                log.info("Waiting %.2fs to call %s for %s", wait, api, account)
+                with bucket.lock:
+                    bucket.waiting += 1
+                try:
+                    time.sleep(wait)
+                finally:
+                    with bucket.lock:
+                        bucket.waiting -= 1
+            try:
+                result = func(*args, **kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                if getattr(exc, 'error_code', None) not in THROTTLING_ERROR_CODES:
+                    raise
+                bucket.throttled()
+                if attempt >= self.MAX_ATTEMPTS:
+                    raise
+                log.warning(
+                    "AWS throttled %s for %s (attempt %d) - slowing to %.2f calls/s", api, account, attempt, bucket.rate
+                )
+                attempt += 1
+            else:
+                bucket.succeeded()
+                return result
+
+    def status(self):
+        """
+        Returns (account, API, current rate, configured rate, calls waiting) for each bucket which has calls
+        waiting, or has been slowed down by throttling.
+        """
+        with self.lock:
+            buckets = sorted(self.buckets.items())
+        return [
+            (account, api, bucket.rate, bucket.base_rate, bucket.waiting)
+            for (account, api), bucket in buckets
+            if bucket.waiting or bucket.rate < bucket.base_rate
+        ]
+
+
+# The limiter shared by all of Alton's AWS calls.
+AWS_RATE_LIMITER = AwsRateLimiter()
@@ -0,0 +1,54 @@
+"""
+Conversion of git remotes, as recorded in AMI version tags, to the URLs of the repos on the web.
+"""
+import re
+import urlparse
+
+
+# Matches scp-style remotes, e.g. git@github.com:edx/edx-platform.git.
+SCP_REMOTE = re.compile(r'^(?:(?P<user>[^@/]+)@)?(?P<host>[^:/]+):(?P<path>.*)$')
+
+# Web URLs of the remotes seen so far, by remote - there are only as many as there are repos in AMIs.
+_WEB_URLS = {}
+
+
+def web_url(remote):
+    """
+    Returns the web URL of the repo at a git remote, e.g. https://github.com/edx/edx-platform for any of
+    git@github.com:edx/edx-platform.git, ssh://git@github.com/edx/edx-platform.git or
+    https://github.com/edx/edx-platform.git.
+
+    Remotes reached over ssh or git are assumed to be served over https. Credentials in the remote are dropped.
+    """
+    url = _WEB_URLS.get(remote)
+    if url is None:
+        url = _WEB_URLS[remote] = _parse_remote(remote)
+    return url
+
+
+def _parse_remote(remote):
+    """
+    Returns the web URL of the repo at a git remote, without caching it.
+    """
+    remote = remote.strip()
+    scp_match = SCP_REMOTE.match(remote)
+    if scp_match and '://' not in remote:
+        scheme, host, path = 'https', scp_match.group('host'), scp_match.group('path')
+    else:
+        parts = urlparse.urlsplit(remote)
+        if not parts.hostname:
+            return _strip_git_suffix(remote)
+        scheme = parts.scheme if parts.scheme in ('http', 'https') else 'https'
+        host = parts.hostname
+        if parts.port and scheme == parts.scheme:
+            host = '{}:{}'.format(host, parts.port)
+        path = parts.path
+    return '{}://{}/{}'.format(scheme, host, _strip_git_suffix(path.strip('/')))
+
+
+def _strip_git_suffix(path):
+    """
+    Remove the .git ending of a repo path, and any trailing slash.
+    """
+    path = path.rstrip('/')
+    return path[:-len('.git')] if path.endswith('.git') else path
@@ -0,0 +1,58 @@
+"""
+Coalescing of identical concurrent calls, so only one of them does the work.
+"""
+import threading
+
+
+class _Call(object):
+    """
+    A call in flight, and its outcome once it has finished.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Shares one execution of a call among all the threads making the same call at the same time.
+
+    The first thread to make a call with a key runs the function; threads making a call with the same key while it's
+    running wait for it and get its result, or its exception. Nothing is cached - once the call has finished, the
+    next call with the key runs the function again.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def call(self, key, func, *args, **kwargs):
+        """
+        Returns func(*args, **kwargs), sharing the call with any in flight for the same key.
+
+        Arguments:
+            key (hashable): Identifies calls which are interchangeable.
+            func (callable): The function to call.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
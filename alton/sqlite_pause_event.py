@@ -0,0 +1,206 @@
+"""
+Class which implements the pause/unpause operations for release pipeline systems,
+including backing SQLite storage and GoCD integration.
+"""
+from collections import defaultdict
+from datetime import datetime
+import logging
+import sqlite3
+import threading
+
+from alton.gocd_api import GoCDAPI
+from alton.metrics import timed_backend
+from alton.pause_event import (
+    MultiplePauseEventsFound,
+    PauseEventNotFound,
+    PauseEventOps,
+)
+from alton.tracing import spanned
+
+
+log = logging.getLogger(__name__)
+
+# pylint: disable=len-as-condition
+
+
+class SQLitePauseEventOps(PauseEventOps):
+    """
+    Encapsulates SQLite operations needed to pause/unpause pipeline systems and list pipeline statuses.
+
+    All pause events, current and historical, are rows of a single table. Current events are the rows
+    which haven't been cleared yet. Suitable for local/on-prem deployments and development, where
+    status queries shouldn't pay for S3 round trips.
+    """
+    # Columns of a pause event, in table order.
+    EVENT_COLUMNS = (
+        'event_id', 'pipeline_system', 'who_paused', 'time_paused', 'who_cleared', 'time_cleared', 'pause_reason'
+    )
+
+    # Maximum number of historical events read from the database at once.
+    HISTORY_BATCH_SIZE = 500
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS pause_events (
+            event_id TEXT NOT NULL,
+            pipeline_system TEXT NOT NULL,
+            who_paused TEXT,
+            time_paused TEXT NOT NULL,
+            who_cleared TEXT,
+            time_cleared TEXT,
+            pause_reason TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS pause_events_event_id ON pause_events (event_id)",
+        "CREATE INDEX IF NOT EXISTS pause_events_system_time ON pause_events (pipeline_system, time_paused)",
+        "CREATE INDEX IF NOT EXISTS pause_events_time ON pause_events (time_paused)",
+        # Status queries only ever look at the (few) uncleared events.
+        "CREATE INDEX IF NOT EXISTS pause_events_current ON pause_events (pipeline_system) WHERE time_cleared IS NULL",
+    )
+
+    def __init__(self, database_path, gocd_username, gocd_password, gocd_url):
+        # Will runs each command in its own thread - share one connection, serialized by a lock.
+        self.db_lock = threading.Lock()
+        self.db_conn = sqlite3.connect(database_path, check_same_thread=False)
+        with self.db_lock, self.db_conn:
+            for statement in self.SCHEMA:
+                self.db_conn.execute(statement)
+        # Create a GoCD client for pausing/unpausing pipelines.
+        self.gocd_client = GoCDAPI(gocd_username, gocd_password, gocd_url)
+
+    def _row_to_event(self, row):
+        """
+        Convert a pause_events row into a pause event dict.
+        """
+        return dict(zip(self.EVENT_COLUMNS, row))
+
+    @timed_backend('sqlite', 'list_current')
+    def _get_current_pause_events(self, pipeline_system=None, event_id=None):
+        """
+        Returns the current pause status of one or all pipeline systems and one or all events.
+
+        Arguments:
+            pipeline_system (str):
+                Pipeline system name for which to return status, e.g. edxapp, ecommerce, etc., None for all systems
+            event_id (str):
+                Event ID for which to return status, None for all events
+
+        Returns:
+            dict(pipeline_system: list()):
+                Dictionary with:
+                    keys: pipeline_system names
+                    values: lists of pipeline events as dicts
+        """
+        query = "SELECT {} FROM pause_events WHERE time_cleared IS NULL".format(', '.join(self.EVENT_COLUMNS))
+        params = []
+        if pipeline_system:
+            query += " AND pipeline_system = ?"
+            params.append(pipeline_system)
+        if event_id:
+            query += " AND event_id = ?"
+            params.append(event_id)
+        query += " ORDER BY time_paused, rowid"
+        with self.db_lock:
+            rows = self.db_conn.execute(query, params).fetchall()
+
+        pause_status = defaultdict(list)
+        for row in rows:
+            pause_data = self._row_to_event(row)
+            pause_status[pause_data['pipeline_system']].append(pause_data)
+        return pause_status
+
+    @spanned
+    @timed_backend('sqlite', 'insert')
+    def _add_event_state_ops(self, who_paused, pipeline_system, pause_reason):
+        """
+        Perform the SQLite operations to store the associated state upon the addition of a pipeline pause event.
+        """
+        current_time = datetime.now()
+        event_id = self._make_event_id(current_time)
+        with self.db_lock, self.db_conn:
+            self.db_conn.execute(
+                "INSERT INTO pause_events ({}) VALUES (?, ?, ?, ?, ?, ?, ?)".format(', '.join(self.EVENT_COLUMNS)),
+                (event_id, pipeline_system, who_paused, current_time.strftime(self.TIME_FORMAT), None, None,
+                 pause_reason)
+            )
+        return event_id
+
+    @spanned
+    @timed_backend('sqlite', 'update')
+    def _remove_event_state_ops(self, who_removed, event_id):
+        """
+        Perform the SQLite operations to store the associated state
+        upon the removal of a pipeline pause event.
+        """
+        current_time_str = datetime.now().strftime(self.TIME_FORMAT)
+        with self.db_lock, self.db_conn:
+            rows = self.db_conn.execute(
+                "SELECT rowid, pipeline_system FROM pause_events WHERE event_id = ? AND time_cleared IS NULL",
+                (event_id,)
+            ).fetchall()
+            # Ensure one and only one event is found.
+            if len(rows) == 0:
+                raise PauseEventNotFound(event_id)
+            elif len(rows) > 1:
+                raise MultiplePauseEventsFound(event_id)
+            rowid, pipeline_system = rows[0]
+            self.db_conn.execute(
+                "UPDATE pause_events SET time_cleared = ?, who_cleared = ? WHERE rowid = ?",
+                (current_time_str, who_removed, rowid)
+            )
+        return pipeline_system
+
+    def pipeline_history(self, pipeline_system=None, since=None, until=None, check_cancelled=None):
+        """
+        Yields the historical pause events of one or all pipeline systems, oldest first.
+
+        Events are read in batches of HISTORY_BATCH_SIZE, so the whole history is never held in memory
+        and the database isn't locked while the caller processes each batch.
+
+        Arguments:
+            pipeline_system (str):
+                Pipeline system name for which to return history, e.g. edxapp, ecommerce, etc., None for all systems
+            since (datetime):
+                Only yield events paused at or after this time, None for no lower bound.
+            until (datetime):
+                Only yield events paused before this time, None for no upper bound.
+            check_cancelled (callable):
+                Called between chunks of reading, to stop the reading by raising - None to read everything.
+
+        Yields:
+            dict: One historical pause event.
+        """
+        query = "SELECT rowid, {} FROM pause_events WHERE 1".format(', '.join(self.EVENT_COLUMNS))
+        params = []
+        if pipeline_system:
+            query += " AND pipeline_system = ?"
+            params.append(pipeline_system)
+        if since:
+            query += " AND time_paused >= ?"
+            params.append(since.strftime(self.TIME_FORMAT))
+        if until:
+            query += " AND time_paused < ?"
+            params.append(until.strftime(self.TIME_FORMAT))
+        # Page through the events in (time_paused, rowid) order, starting after the last event of each batch.
+        query += " AND (time_paused > ? OR (time_paused = ? AND rowid > ?)) ORDER BY time_paused, rowid LIMIT ?"
+
+        last_time_paused, last_rowid = '', 0
+        while True:
+            if check_cancelled:
+                check_cancelled()
+            rows = self._read_history_batch(
+                query, params + [last_time_paused, last_time_paused, last_rowid, self.HISTORY_BATCH_SIZE]
+            )
+            for row in rows:
+                yield self._row_to_event(row[1:])
+            if len(rows) < self.HISTORY_BATCH_SIZE:
+                return
+            last_rowid, last_time_paused = rows[-1][0], rows[-1][1 + self.EVENT_COLUMNS.index('time_paused')]
+
+    @timed_backend('sqlite', 'get_history')
+    def _read_history_batch(self, query, params):
+        """
+        Returns one batch of historical pause event rows.
+        """
+        with self.db_lock:
+            return self.db_conn.execute(query, params).fetchall()
@@ -0,0 +1,82 @@
+"""
+Measurement of how long each plugin takes to import and initialize while the bot starts up.
+"""
+from collections import OrderedDict
+import inspect
+import time
+
+
+class PluginStartupTimer(object):
+    """
+    Times the loading of plugin modules and the creation of plugin instances.
+
+    Will loads each plugin module with imp.load_source() and then creates an instance of each plugin class,
+    so wrapping load_source() is enough to time both: the wrapper times the module's import, and times the
+    __init__ of each plugin class it defines until restore() is called.
+    """
+    def __init__(self):
+        # Seconds taken to import each module, by module name.
+        self.import_seconds = OrderedDict()
+        # Seconds taken to create the instances of each plugin class, by class name.
+        self.init_seconds = OrderedDict()
+        # Plugin classes whose __init__ is being timed, and the __init__ each had of its own (or None).
+        self.timed_classes = []
+
+    def timed_load_source(self, load_source):
+        """
+        Returns a version of imp.load_source which times each module load and its plugins' initialization.
+        """
+        def timed(name, *args, **kwargs):
+            """
+            Load a module, recording the time taken.
+            """
+            start = time.time()
+            module = load_source(name, *args, **kwargs)
+            self.import_seconds[name] = self.import_seconds.get(name, 0) + time.time() - start
+            for __, cls in inspect.getmembers(module, predicate=inspect.isclass):
+                if getattr(cls, 'is_will_plugin', False) and cls.__module__ == module.__name__:
+                    self._time_init(cls)
+            return module
+        return timed
+
+    def _time_init(self, cls):
+        """
+        Replace cls.__init__ with a version recording the time it takes.
+        """
+        original_init = cls.__init__
+        self.timed_classes.append((cls, cls.__dict__.get('__init__')))
+        self.init_seconds.setdefault(cls.__name__, 0)
+
+        def timed_init(instance, *args, **kwargs):
+            """
+            Initialize a plugin instance, recording the time taken.
+            """
+            start = time.time()
+            try:
+                original_init(instance, *args, **kwargs)
+            finally:
+                self.init_seconds[cls.__name__] += time.time() - start
+        cls.__init__ = timed_init
+
+    def restore(self):
+        """
+        Stop timing plugin initialization, putting back each plugin class's own __init__.
+        """
+        for cls, own_init in reversed(self.timed_classes):
+            if own_init is None:
+                del cls.__init__
+            else:
+                cls.__init__ = own_init
+        self.timed_classes = []
+
+    def report(self):
+        """
+        Returns the lines of a report of the startup cost of each plugin module and class, slowest first.
+        """
+        costs = [('import {}'.format(name), seconds) for name, seconds in self.import_seconds.items()]
+        costs += [('init {}'.format(name), seconds) for name, seconds in self.init_seconds.items()]
+        costs.sort(key=lambda cost: -cost[1])
+        total = sum(seconds for __, seconds in costs)
+        lines = ['{:>7.3f}s  {}'.format(seconds, what) for what, seconds in costs]
+        lines.append('{:>7.3f}s  total'.format(total))
+        return lines
@@ -0,0 +1,239 @@
+"""
+Lightweight tracing of the stages of a chat command, e.g. the AMI lookups and Jenkins calls of "cut ami".
+
+A command decorated with @traced records a span for each @spanned method and each timed backend call made
+while it runs, in the thread running it. Ending the command with "verbose" prints the span breakdown back
+into the room - except for commands ending in free text, traced with @traced_quietly - and every trace is
+kept in Redis, as JSON, for offline analysis.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import functools
+import json
+import logging
+import re
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+# Matches commands asking for their span breakdown.
+VERBOSE_SUFFIX = re.compile(r'\sverbose\s*$')
+
+# Most spans to print in a breakdown - a command touching every AWS account can make a lot of calls.
+MAX_BREAKDOWN_SPANS = 40
+
+# The trace of the command running in each thread.
+_CURRENT = threading.local()
+
+
+class Span(object):
+    """
+    A timed stage of a traced command.
+    """
+    def __init__(self, name, depth, start):
+        self.name = name
+        # How many spans this one is nested in.
+        self.depth = depth
+        self.start = start
+        self.duration = None
+        self.failed = False
+
+    def to_dict(self, trace_start):
+        """
+        Returns the span as a dict, with its start relative to the start of the trace.
+        """
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'start': round(self.start - trace_start, 6),
+            'duration': round(self.duration, 6),
+            'failed': self.failed,
+        }
+
+
+class Trace(object):
+    """
+    The spans recorded while a command ran, in the order they started.
+    """
+    def __init__(self, command, user, body):
+        self.command = command
+        self.user = user
+        self.body = body
+        self.started_at = datetime.utcnow()
+        self.root = Span(command, 0, time.time())
+        self.spans = [self.root]
+        # Spans which have started and not finished, innermost last.
+        self.open_spans = [self.root]
+
+    @contextmanager
+    def span(self, name):
+        """
+        Context manager recording a span nested in the innermost open one.
+        """
+        new_span = Span(name, len(self.open_spans), time.time())
+        self.spans.append(new_span)
+        self.open_spans.append(new_span)
+        try:
+            yield new_span
+        except BaseException:
+            new_span.failed = True
+            raise
+        finally:
+            new_span.duration = time.time() - new_span.start
+            self.open_spans.pop()
+
+    def finish(self, failed=False):
+        """
+        End the trace's root span.
+        """
+        self.root.duration = time.time() - self.root.start
+        self.root.failed = failed
+
+    def to_dict(self):
+        """
+        Returns the trace as a JSON-serializable dict.
+        """
+        return {
+            'command': self.command,
+            'user': self.user,
+            'body': self.body,
+            'started_at': self.started_at.isoformat(),
+            'duration': round(self.root.duration, 6),
+            'failed': self.root.failed,
+            'spans': [each.to_dict(self.root.start) for each in self.spans if each.duration is not None],
+        }
+
+    def breakdown(self):
+        """
+        Returns the lines of a report of how long each span took, indented by nesting.
+        """
+        lines = []
+        for each in self.spans[:MAX_BREAKDOWN_SPANS]:
+            if each.duration is None:
+                continue
+            lines.append('{:>8.3f}s  {}{}{}'.format(
+                each.duration, '  ' * each.depth, each.name, ' (failed)' if each.failed else ''
+            ))
+        if len(self.spans) > MAX_BREAKDOWN_SPANS:
+            lines.append('... and {} more spans'.format(len(self.spans) - MAX_BREAKDOWN_SPANS))
+        return lines
+
+
+class TraceStore(object):
+    """
+    Keeps the most recent traces in Redis, as JSON.
+    """
+    # Redis list holding the traces, newest first.
+    REDIS_KEY = 'alton_traces'
+
+    # How many traces to keep.
+    MAX_TRACES = 500
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def add(self, trace):
+        """
+        Store a finished trace, dropping the oldest once there are more than MAX_TRACES.
+        """
+        pipe = self.redis.pipeline()
+        pipe.lpush(self.REDIS_KEY, json.dumps(trace.to_dict()))
+        pipe.ltrim(self.REDIS_KEY, 0, self.MAX_TRACES - 1)
+        pipe.execute()
+
+    def recent(self, limit=None, command=None):
+        """
+        Returns the stored traces as dicts, newest first.
+
+        Arguments:
+            limit (int): Most traces to return.
+            command (str): Only return traces of this command.
+        """
+        traces = [json.loads(trace) for trace in self.redis.lrange(self.REDIS_KEY, 0, -1)]
+        if command is not None:
+            traces = [trace for trace in traces if trace['command'] == command]
+        return traces[:limit]
+
+
+def current_trace():
+    """
+    Returns the trace of the command running in this thread, or None.
+    """
+    return getattr(_CURRENT, 'trace', None)
+
+
+@contextmanager
+def span(name):
+    """
+    Context manager recording a span in the current thread's trace, if it has one.
+    """
+    trace = current_trace()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name) as new_span:
+        yield new_span
+
+
+def spanned(func):
+    """
+    Decorator recording a span, named after the function, for each call made while a command is traced.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        """
+        Make the call in a span.
+        """
+        with span(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def traced(func):
+    """
+    Decorator tracing a plugin command, printing the span breakdown into the room if it ends with "verbose".
+
+    The trace is stored in the plugin's Redis storage. Apply it below @pooled, so time spent waiting for a
+    slot in the command pool isn't counted.
+    """
+    return _trace_command(func, print_breakdown=True)
+
+
+def traced_quietly(func):
+    """
+    Decorator tracing a plugin command which ends in free text, e.g. a pause reason. "verbose" may just be the
+    text's last word, so the span breakdown is never printed - the trace is only stored, as by @traced.
+    """
+    return _trace_command(func, print_breakdown=False)
+
+
+def _trace_command(func, print_breakdown):
+    """
+    Wraps a plugin command to trace it.
+    """
+    @functools.wraps(func)
+    def wrapper(plugin, message, *args, **kwargs):
+        """
+        Run the command, tracing it.
+        """
+        trace = Trace(func.__name__, message.sender.nick, message['body'])
+        _CURRENT.trace = trace
+        failed = False
+        try:
+            return func(plugin, message, *args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _CURRENT.trace = None
+            trace.finish(failed)
+            if print_breakdown and VERBOSE_SUFFIX.search(message['body']):
+                plugin.say('/code {}'.format('\n'.join(trace.breakdown())), message=message)
+            try:
+                plugin.bootstrap_storage()
+                TraceStore(plugin.storage.redis).add(trace)
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Unable to store the trace of %s", func.__name__)
+    return wrapper
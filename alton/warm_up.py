@@ -0,0 +1,38 @@
+"""
+Warm-up of plugin state in the background, after the bot has started.
+"""
+import logging
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+def warm_up_plugins(plugins):
+    """
+    Run the warm_up() method of each plugin which has one, one after the other, and log how long each took.
+
+    Warm-up failures are logged and otherwise ignored - the plugin will just do the work on its first command.
+    """
+    for plugin in plugins:
+        warm_up = getattr(plugin, 'warm_up', None)
+        if warm_up is None:
+            continue
+        start = time.time()
+        try:
+            warm_up()
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Unable to warm up %s", plugin.__class__.__name__)
+        else:
+            log.info("Warmed up %s in %.2fs", plugin.__class__.__name__, time.time() - start)
+
+
+def start_warm_up(plugins):
+    """
+    Warm up the plugins in a background thread, returning the thread.
+    """
+    thread = threading.Thread(target=warm_up_plugins, args=(list(plugins),), name='warm-up')
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -0,0 +1,523 @@
+#!/usr/bin/env python
+"""
+Benchmark of the AWS, S3, GoCD and Jenkins calls made by the show and release commands.
+
+Builds a large synthetic fleet - instances, ELBs and AMIs spread over several AWS profiles, and a bucket
+of current pause events - behind local stand-ins for the boto, GoCD and Jenkins clients, each of which
+counts its calls and sleeps for a configurable latency. Then runs each scenario against them and reports
+the wall time and the number of calls of each kind.
+
+With --check, exits with an error if any scenario makes more calls of a kind than its budget, so a
+change which fans out to more API calls is caught before it is deployed.
+
+Usage:
+    python benchmarks/backend_fanout.py [--latency SECONDS] [--profiles N] [--instances N] [--elbs N]
+                                        [--amis N] [--pause-events N] [--check]
+"""
+from __future__ import print_function
+
+import argparse
+from collections import Counter, namedtuple
+import logging
+import os
+import sys
+import threading
+import time
+
+from boto.exception import EC2ResponseError
+import jenkins
+from will import settings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# pylint: disable=wrong-import-position
+from alton import pause_event
+from alton.ami_cache import AmiCache
+from alton.build_plans import BuildPlans
+from alton.gocd_api import GoCDAPI
+from plugins.show import ShowPlugin
+
+
+ENVIRONMENTS = ('prod', 'stage', 'loadtest')
+PLAYS = ('edxapp', 'worker', 'forum', 'xqueue', 'notifier', 'insights', 'analytics_api', 'ecommerce',
+         'credentials', 'discovery', 'programs', 'notes', 'certs', 'jenkins_worker', 'rabbitmq')
+
+# Every tenth instance of a cluster is stopped.
+STOPPED_EVERY = 10
+
+# Most keys S3 returns in one page of a listing.
+S3_PAGE_SIZE = 1000
+
+
+class ApiCalls(object):
+    """
+    Counts the calls made to the stand-in backends, each of which takes `latency` seconds.
+    """
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def make(self, backend, operation):
+        """
+        Record a call, and wait as long as the real backend would.
+        """
+        with self.lock:
+            self.counts['{}.{}'.format(backend, operation)] += 1
+        time.sleep(self.latency)
+
+
+Instance = namedtuple('Instance', 'id state image_id private_dns_name tags')
+Reservation = namedtuple('Reservation', 'instances')
+LoadBalancer = namedtuple('LoadBalancer', 'name instances')
+Image = namedtuple('Image', 'id tags')
+
+
+class Fleet(object):
+    """
+    Synthetic instances, ELBs and AMIs of several AWS profiles, one per deployment.
+
+    Each cluster (environment-deployment-play) runs one AMI behind one ELB.
+    """
+    def __init__(self, num_profiles, num_instances, num_elbs, num_amis):
+        self.profiles = ['deployment{}'.format(index) for index in range(num_profiles)]
+        self.instances = {profile: [] for profile in self.profiles}
+        self.elbs = {}
+        self.images = {}
+        clusters = [(env, play) for play in PLAYS for env in ENVIRONMENTS]
+        for profile_index, profile in enumerate(self.profiles):
+            elbs = [
+                LoadBalancer('{}-elb-{}'.format(profile, index), [])
+                for index in range(max(1, num_elbs // num_profiles))
+            ]
+            images = [
+                self._make_image(profile_index, index) for index in range(max(1, num_amis // num_profiles))
+            ]
+            self.elbs[profile] = elbs
+            self.images[profile] = {image.id: image for image in images}
+            for index in range(num_instances // num_profiles):
+                cluster_index = index % len(clusters)
+                env, play = clusters[cluster_index]
+                instance = Instance(
+                    id='i-{:04x}{:08x}'.format(profile_index, index),
+                    state='stopped' if index // len(clusters) % STOPPED_EVERY == STOPPED_EVERY - 1 else 'running',
+                    image_id=images[cluster_index % len(images)].id,
+                    private_dns_name='ip-10-{}-{}-{}.ec2.internal'.format(profile_index, index // 256, index % 256),
+                    tags={'environment': env, 'deployment': profile, 'play': play},
+                )
+                self.instances[profile].append(instance)
+                elbs[cluster_index % len(elbs)].instances.append(instance)
+
+    @staticmethod
+    def _make_image(profile_index, index):
+        """
+        Returns an AMI tagged with the versions it was built from, like those built by Abbey.
+        """
+        tags = {'environment': 'prod', 'play': PLAYS[index % len(PLAYS)]}
+        for repo in ('configuration', 'configuration_secure', 'edx_platform', 'forum', 'xqueue', 'notifier'):
+            tags['version:{}'.format(repo)] = 'https://github.com/edx/{}.git {:07x}'.format(
+                repo, profile_index * 7919 + index
+            )
+        return Image('ami-{:04x}{:04x}'.format(profile_index, index), tags)
+
+    def cluster(self, play_index=0, profile_index=0):
+        """
+        Returns the environment, deployment and play of a cluster.
+        """
+        return ENVIRONMENTS[0], self.profiles[profile_index], PLAYS[play_index]
+
+    def running_instances(self, env, dep, play):
+        """
+        Returns the number of running instances in a cluster.
+        """
+        return len([
+            instance for instance in self.instances[dep]
+            if instance.tags == {'environment': env, 'deployment': dep, 'play': play} and instance.state == 'running'
+        ])
+
+
+class FakeEC2Connection(object):
+    """
+    Stand-in for the boto EC2 connection of one profile.
+    """
+    def __init__(self, fleet, profile, calls):
+        self.fleet = fleet
+        self.profile = profile
+        self.calls = calls
+
+    def get_all_instances(self, instance_ids=None, filters=None):
+        """
+        Returns the profile's instances with the given IDs, or all of them, matching the tag and state
+        filters, one per reservation.
+        """
+        self.calls.make('ec2', 'get_all_instances')
+        matching = []
+        for instance in self.fleet.instances[self.profile]:
+            if instance_ids is not None and instance.id not in instance_ids:
+                continue
+            for name, value in (filters or {}).items():
+                if name == 'instance-state-name' and instance.state != value:
+                    break
+                if name.startswith('tag:') and instance.tags.get(name[4:]) != value:
+                    break
+            else:
+                matching.append(Reservation([instance]))
+        return matching
+
+    def get_all_images(self, image_ids=None, filters=None):
+        """
+        Returns the AMI with the given ID, failing like EC2 if the profile doesn't have it - or the profile's
+        AMIs matching an image-id filter.
+        """
+        self.calls.make('ec2', 'get_all_images')
+        images = self.fleet.images[self.profile]
+        if filters is not None:
+            return [images[ami_id] for ami_id in filters['image-id'] if ami_id in images]
+        if image_ids not in images:
+            raise EC2ResponseError(400, 'Bad Request', 'InvalidAMIID.NotFound')
+        return [images[image_ids]]
+
+
+class FakeELBConnection(object):
+    """
+    Stand-in for the boto ELB connection of one profile.
+    """
+    def __init__(self, fleet, profile, calls):
+        self.fleet = fleet
+        self.profile = profile
+        self.calls = calls
+
+    def get_all_load_balancers(self):
+        """
+        Returns all the profile's ELBs.
+        """
+        self.calls.make('elb', 'get_all_load_balancers')
+        return self.fleet.elbs[self.profile]
+
+
+class FakeKey(object):
+    """
+    Stand-in for a boto S3 key.
+    """
+    def __init__(self, name, contents, calls):
+        self.name = name
+        self.contents = contents
+        self.calls = calls
+
+    def get_contents_as_string(self):
+        """
+        Returns the key's contents.
+        """
+        self.calls.make('s3', 'get')
+        return self.contents
+
+
+class KeyPage(list):
+    """
+    One page of an S3 listing.
+    """
+    is_truncated = False
+    next_marker = None
+
+
+class FakeBucket(object):
+    """
+    Stand-in for a boto S3 bucket, listed a page at a time as by boto's bucket_lister.
+    """
+    def __init__(self, keys, calls):
+        self.keys = sorted(keys, key=lambda key: key.name)
+        self.calls = calls
+
+    def get_all_keys(self, prefix='', marker='', **kwargs):  # pylint: disable=unused-argument
+        """
+        Returns the next page of keys with the prefix after the marker.
+        """
+        self.calls.make('s3', 'list')
+        matching = [key for key in self.keys if key.name.startswith(prefix) and key.name > marker]
+        page = KeyPage(matching[:S3_PAGE_SIZE])
+        page.is_truncated = len(matching) > S3_PAGE_SIZE
+        return page
+
+
+class FakeGoCDPipelines(object):
+    """
+    Stand-in for the yagocd pipeline manager.
+    """
+    def __init__(self, calls):
+        self.calls = calls
+
+    def pause(self, pipeline_name, cause):  # pylint: disable=unused-argument
+        """
+        Pause a pipeline.
+        """
+        self.calls.make('gocd', 'pause')
+
+    def unpause(self, pipeline_name):  # pylint: disable=unused-argument
+        """
+        Unpause a pipeline.
+        """
+        self.calls.make('gocd', 'unpause')
+
+
+class FakeJenkins(object):
+    """
+    Stand-in for the python-jenkins client.
+    """
+    calls = None
+
+    def __init__(self, *args):
+        pass
+
+    def get_job_info(self, name):  # pylint: disable=unused-argument
+        """
+        Returns the job's next build number.
+        """
+        self.calls.make('jenkins', 'get_job_info')
+        return {'nextBuildNumber': 1}
+
+    def build_job(self, name, parameters=None):  # pylint: disable=unused-argument
+        """
+        Start a build.
+        """
+        self.calls.make('jenkins', 'build_job')
+
+
+class NullRedis(object):
+    """
+    Redis client which ignores every command, for the build subscriptions and traces the commands store -
+    except for keeping the values SET, for the build plans.
+    """
+    def __init__(self):
+        self.values = {}
+
+    def set(self, key, value, **kwargs):  # pylint: disable=unused-argument
+        """
+        Keep a value.
+        """
+        self.values[key] = value
+        return True
+
+    def get(self, key):
+        """
+        Returns a value kept.
+        """
+        return self.values.get(key)
+
+    def delete(self, key):
+        """
+        Forget a value.
+        """
+        return int(self.values.pop(key, None) is not None)
+
+    def pipeline(self, *args, **kwargs):  # pylint: disable=unused-argument
+        """
+        Returns a pipeline, running each command as it's queued.
+        """
+        return NullPipeline(self)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: []
+
+
+class NullPipeline(object):
+    """
+    Pipeline of a NullRedis.
+    """
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.results = []
+
+    def execute(self):
+        """
+        Returns the results of the commands queued.
+        """
+        results, self.results = self.results, []
+        return results
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+        return lambda *args, **kwargs: self.results.append(command(*args, **kwargs))
+
+
+class Message(dict):
+    """
+    A chat message from the benchmark.
+    """
+    class sender(object):  # pylint: disable=invalid-name
+        """
+        The user sending the message.
+        """
+        nick = 'benchmark'
+
+
+def make_show_plugin(fleet, calls):
+    """
+    Returns a ShowPlugin looking at the fleet through stand-in AWS and Jenkins clients, and saying nothing.
+    """
+    settings.BOTO_PROFILES = ';'.join(fleet.profiles)
+    settings.JENKINS_URL = settings.JENKINS_API_USER = settings.JENKINS_API_KEY = 'benchmark'
+    settings.NOTIFY_CALLBACK_URL = 'http://localhost/notify/'
+    FakeJenkins.calls = calls
+    jenkins.Jenkins = FakeJenkins
+    plugin = ShowPlugin()
+    for profile in fleet.profiles:
+        plugin.aws_connections[('ec2', profile)] = FakeEC2Connection(fleet, profile, calls)
+        plugin.aws_connections[('elb', profile)] = FakeELBConnection(fleet, profile, calls)
+    plugin.say = lambda *args, **kwargs: None
+    plugin.get_room_from_message = lambda message: {'name': 'benchmark'}
+    plugin.storage = type('Storage', (object,), {'redis': NullRedis()})()
+    return plugin
+
+
+def make_pause_ops(num_events, calls):
+    """
+    Returns S3PauseEventOps reading num_events current pause events from a stand-in bucket and pausing
+    pipelines through a stand-in GoCD client.
+    """
+    # pylint: disable=protected-access
+    pause_ops = pause_event.S3PauseEventOps.__new__(pause_event.S3PauseEventOps)
+    pause_ops.file_format = 'json'
+    keys = []
+    for index in range(num_events):
+        time_str = '2017-01-01_{:02d}:{:02d}:{:02d}'.format(index // 3600 % 24, index // 60 % 60, index % 60)
+        name = pause_ops._make_pause_event_filename('{:08x}'.format(index), time_str, 'edxapp')
+        contents = pause_ops._encode_pause_file(name, {
+            'event_id': '{:08x}'.format(index),
+            'pipeline_system': 'edxapp',
+            'who_paused': 'user{}'.format(index % 17),
+            'time_paused': time_str,
+            'pause_reason': 'Paused because of bug number {}.'.format(index),
+        })
+        keys.append(FakeKey(pause_ops.CURRENT_DIRECTORY + name, contents, calls))
+    pause_ops.pipeline_bucket = FakeBucket(keys, calls)
+    pause_ops.gocd_client = GoCDAPI.__new__(GoCDAPI)
+    pause_ops.gocd_client.client = type('GoCD', (object,), {'pipelines': FakeGoCDPipelines(calls)})()
+    return pause_ops
+
+
+def scenarios(fleet, plugin, pause_ops, num_events):
+    """
+    Returns the benchmark scenarios, as (name, function, budget) - the budget being the most calls of each
+    kind the scenario should make.
+    """
+    # pylint: disable=protected-access
+    num_profiles = len(fleet.profiles)
+    env, dep, play = fleet.cluster()
+    other_env, other_dep, other_play = fleet.cluster(play_index=1, profile_index=num_profiles - 1)
+    first_ami = plugin._ami_for_edp(None, env, dep, play)
+    second_ami = plugin._ami_for_edp(None, other_env, other_dep, other_play)
+    running = fleet.running_instances(env, dep, play)
+    s3_pages = num_events // S3_PAGE_SIZE + 1
+    cut_ami = 'cut ami for {}-{}-{} from {}-{}-{}'.format(env, dep, play, other_env, other_dep, other_play)
+    plan_token = BuildPlans(plugin.storage.redis).create(Message.sender.nick, {
+        'env': env, 'dep': dep, 'play': play, 'versions': plugin._get_ami_versions(second_ami).to_dict(),
+        'ami_id': first_ami, 'verbose': False,
+    })
+    return [
+        (
+            'show e-d-p',
+            lambda: plugin._show_edp(None, env, dep, play),
+            {'ec2.get_all_instances': 1, 'elb.get_all_load_balancers': 1, 'ec2.get_all_images': running * num_profiles},
+        ),
+        (
+            'show e-d summary',
+            lambda: plugin._show_summary(None, env, dep),
+            {'ec2.get_all_instances': 1, 'elb.get_all_load_balancers': 1, 'ec2.get_all_images': num_profiles},
+        ),
+        (
+            'drift e-d',
+            lambda: plugin._show_drift(None, env, dep),
+            {'ec2.get_all_instances': 1, 'elb.get_all_load_balancers': 1, 'ec2.get_all_images': num_profiles},
+        ),
+        (
+            '_ami_for_edp',
+            lambda: plugin._ami_for_edp(None, env, dep, play),
+            {'ec2.get_all_instances': 1, 'elb.get_all_load_balancers': 1},
+        ),
+        (
+            'diff ami ami',
+            lambda: plugin._diff_amis(first_ami, second_ami, None),
+            {'ec2.get_all_images': 2 * num_profiles},
+        ),
+        (
+            'cut ami',
+            lambda: plugin.cut_from_edp(Message(body=cut_ami), cut_ami),
+            {
+                'ec2.get_all_instances': 2, 'elb.get_all_load_balancers': 2, 'ec2.get_all_images': 2 * num_profiles,
+                'jenkins.get_job_info': 1, 'jenkins.build_job': 1,
+            },
+        ),
+        (
+            'cut ami confirm',
+            lambda: plugin.cut_confirm(Message(body='cut ami confirm ' + plan_token), plan_token),
+            {'jenkins.get_job_info': 1, 'jenkins.build_job': 1},
+        ),
+        (
+            '_get_current_pause_events',
+            pause_ops._get_current_pause_events,
+            {'s3.list': s3_pages, 's3.get': num_events},
+        ),
+        (
+            'pipeline status',
+            pause_ops.pipeline_status,
+            {'s3.list': s3_pages, 's3.get': num_events},
+        ),
+        (
+            'pause GoCD pipelines',
+            lambda: pause_ops._add_event_pipeline_ops('00000000', 'edxapp', 'benchmark'),
+            {'gocd.pause': len(pause_event.PIPELINE_SYSTEM_INFO['edxapp'])},
+        ),
+    ]
+
+
+def main():
+    """
+    Run each scenario, print its time and calls, and check them against their budgets if asked to.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds taken by each backend call')
+    parser.add_argument('--profiles', type=int, default=3, help='number of AWS profiles')
+    parser.add_argument('--instances', type=int, default=3000, help='number of EC2 instances')
+    parser.add_argument('--elbs', type=int, default=300, help='number of ELBs')
+    parser.add_argument('--amis', type=int, default=150, help='number of AMIs')
+    parser.add_argument('--pause-events', type=int, default=2000, help='number of current pause events')
+    parser.add_argument('--check', action='store_true', help='fail if a scenario makes more calls than budgeted')
+    parser.add_argument(
+        '--warm-cache', action='store_true',
+        help='keep the AMIs found by each scenario cached for the next, as after a restart with AMI_CACHE_PATH set'
+    )
+    args = parser.parse_args()
+    # The commands log every instance and pipeline they look at.
+    logging.disable(logging.CRITICAL)
+
+    calls = ApiCalls(args.latency)
+    fleet = Fleet(args.profiles, args.instances, args.elbs, args.amis)
+    plugin = make_show_plugin(fleet, calls)
+    pause_ops = make_pause_ops(args.pause_events, calls)
+
+    print('{} instances, {} ELBs and {} AMIs in {} profiles; {} pause events; {:.3f}s per call'.format(
+        args.instances, args.elbs, args.amis, args.profiles, args.pause_events, args.latency
+    ))
+    print('{:<28} {:>9}  {}'.format('scenario', 'time (s)', 'calls'))
+    over_budget = []
+    for name, scenario, budget in scenarios(fleet, plugin, pause_ops, args.pause_events):
+        if not args.warm_cache:
+            plugin.ami_cache = AmiCache(':memory:')
+        calls.counts.clear()
+        start = time.time()
+        scenario()
+        elapsed = time.time() - start
+        print('{:<28} {:>9.3f}  {}'.format(
+            name, elapsed, ', '.join('{}={}'.format(call, count) for call, count in sorted(calls.counts.items()))
+        ))
+        for call, count in sorted(calls.counts.items()):
+            if count > budget.get(call, 0):
+                over_budget.append('{}: {} {} calls, budget {}'.format(name, count, call, budget.get(call, 0)))
+
+    if args.check and over_budget:
+        print('\nOver budget:\n  ' + '\n  '.join(over_budget))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
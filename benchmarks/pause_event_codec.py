@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Benchmark of the pause event file codecs.
+
+Encodes and decodes a few thousand synthetic pause event files with the pure-Python YAML
+codec as a baseline, then with the YAML and JSON codecs used by S3PauseEventOps - the YAML
+codec uses libyaml when it is available.
+
+Usage:
+    python benchmarks/pause_event_codec.py [num_events]
+"""
+from __future__ import print_function
+
+from datetime import datetime, timedelta
+import os
+import sys
+import timeit
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from alton import pause_event  # pylint: disable=wrong-import-position
+
+
+def make_events(num_events):
+    """
+    Build num_events synthetic pause events, half of them resolved.
+    """
+    start = datetime(2017, 1, 1)
+    events = []
+    for index in range(num_events):
+        time_paused = start + timedelta(hours=index)
+        time_cleared = time_paused + timedelta(minutes=90)
+        events.append({
+            'event_id': '{:08x}'.format(index),
+            'pipeline_system': 'edxapp',
+            'who_paused': 'user{}'.format(index % 17),
+            'time_paused': time_paused.strftime(pause_event.S3PauseEventOps.TIME_FORMAT),
+            'who_cleared': 'user{}'.format(index % 13) if index % 2 else None,
+            'time_cleared': time_cleared.strftime(pause_event.S3PauseEventOps.TIME_FORMAT) if index % 2 else None,
+            'pause_reason': 'Paused because of bug number {} found during release testing.'.format(index),
+        })
+    return events
+
+
+def time_codec(events, encode, decode):
+    """
+    Returns the best-of-three times taken to encode all the events and to decode them again.
+    """
+    encoded = [encode(event) for event in events]
+    encode_time = min(timeit.repeat(lambda: [encode(event) for event in events], number=1, repeat=3))
+    decode_time = min(timeit.repeat(lambda: [decode(contents) for contents in encoded], number=1, repeat=3))
+    return encode_time, decode_time
+
+
+def main(num_events=3000):
+    """
+    Time each codec over num_events events and print the results.
+    """
+    # pylint: disable=protected-access
+    events = make_events(num_events)
+    # The codecs don't touch S3, so skip connecting to it.
+    pause_ops = pause_event.S3PauseEventOps.__new__(pause_event.S3PauseEventOps)
+    using_libyaml = pause_event.YAMLSafeLoader is getattr(yaml, 'CSafeLoader', None)
+    codecs = [
+        (
+            'yaml (pure Python)',
+            lambda data: yaml.dump(data, Dumper=yaml.SafeDumper),
+            lambda contents: yaml.load(contents, Loader=yaml.SafeLoader),
+        ),
+        (
+            'yaml (libyaml)' if using_libyaml else 'yaml (no libyaml)',
+            lambda data: pause_ops._encode_pause_file('event.yml', data),
+            lambda contents: pause_ops._decode_pause_file('event.yml', contents),
+        ),
+        (
+            'json',
+            lambda data: pause_ops._encode_pause_file('event.json', data),
+            lambda contents: pause_ops._decode_pause_file('event.json', contents),
+        ),
+    ]
+
+    print('{} pause events'.format(num_events))
+    print('{:<20} {:>12} {:>12}'.format('codec', 'encode (s)', 'decode (s)'))
+    for name, encode, decode in codecs:
+        print('{:<20} {:>12.3f} {:>12.3f}'.format(name, *time_codec(events, encode, decode)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
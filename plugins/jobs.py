@@ -0,0 +1,63 @@
+"""
+Jobs plugin
+"""
+from will.plugin import WillPlugin
+from will.decorators import respond_to
+
+from alton.command_pool import COMMAND_POOL
+from alton.rate_limiter import AWS_RATE_LIMITER
+
+
+class JobsPlugin(WillPlugin):
+    """
+    Jobs plugin
+    """
+    def _format_elapsed(self, elapsed):
+        """
+        Formats a timedelta as e.g. '1h 02m 05s'.
+        """
+        minutes, seconds = divmod(int(elapsed.total_seconds()), 60)
+        hours, minutes = divmod(minutes, 60)
+        if hours:
+            return '{}h {:02d}m {:02d}s'.format(hours, minutes, seconds)
+        return '{}m {:02d}s'.format(minutes, seconds)
+
+    @respond_to(r"^jobs$")
+    def jobs(self, message):
+        """
+        jobs: list the long-running commands in progress or waiting to run
+        """
+        commands = COMMAND_POOL.commands()
+        if not commands:
+            self.reply(message, "No commands running.")
+            return
+        output = ["{:>5} {:<12} {:<8} {:>11}  {}".format('Job', 'User', 'State', 'Elapsed', 'Command')]
+        for command in commands:
+            output.append("{:>5} {:<12} {:<8} {:>11}  {}".format(
+                command.command_id,
+                command.user,
+                command.state,
+                self._format_elapsed(command.elapsed()),
+                command.description
+            ))
+        queued = len([command for command in commands if command.state == 'queued'])
+        output.append("{} running, {} queued".format(len(commands) - queued, queued))
+        # Commands may also be held up waiting for their turn to call AWS.
+        for account, api, rate, base_rate, waiting in AWS_RATE_LIMITER.status():
+            output.append("AWS {} {}: {} call(s) waiting, {:.2f}/{:.2f} calls/s".format(
+                account, api, waiting, rate, base_rate
+            ))
+        self.say("/code {}".format("\n".join(output)), message)
+
+    @respond_to(r"^cancel job (?P<command_id>\d+)$")
+    def cancel_job(self, message, command_id):
+        """
+        cancel job [id]: cancel one of your commands - running commands stop at their next checkpoint
+        """
+        command = COMMAND_POOL.cancel(int(command_id), user=message.sender.nick)
+        if command is None:
+            self.reply(message, "You don't have a job {}.".format(command_id), color='red')
+        elif command.state == 'queued':
+            self.reply(message, "OK, job {} won't run.".format(command_id))
+        else:
+            self.reply(message, "OK, job {} will stop at its next checkpoint.".format(command_id))
@@ -0,0 +1,50 @@
+"""
+Metrics plugin
+"""
+import hmac
+
+from will import settings
+from will.plugin import WillPlugin
+from will.decorators import route
+import bottle
+
+from alton.metrics import METRICS
+from alton.tracing import TraceStore
+
+# Most traces served at once.
+MAX_TRACES_SERVED = 100
+
+
+class MetricsPlugin(WillPlugin):
+    """
+    Metrics plugin
+    """
+    @route("/metrics")
+    def metrics(self):
+        """
+        Serve the command and backend metrics of all of Alton's processes, in Prometheus text format.
+        """
+        bottle.response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        return METRICS.render()
+
+    @route("/traces")
+    def traces(self):
+        """
+        Serve the most recent command traces as JSON, optionally only those of ?command=<name>, up to ?limit=<n>.
+
+        Traces include the chat commands' text, so they're only served if the TRACES_TOKEN setting is passed as
+        the token query parameter.
+        """
+        if not hasattr(settings, 'TRACES_TOKEN'):
+            raise bottle.HTTPError(404)
+        query = bottle.request.query
+        token = query.get('token', '')  # pylint: disable=no-member
+        if not hmac.compare_digest(str(token), str(settings.TRACES_TOKEN)):  # pylint: disable=no-member
+            raise bottle.HTTPError(403)
+        try:
+            limit = min(int(query.get('limit', MAX_TRACES_SERVED)), MAX_TRACES_SERVED)  # pylint: disable=no-member
+        except ValueError:
+            raise bottle.HTTPError(400, 'limit must be a number')
+        self.bootstrap_storage()
+        command = query.get('command')  # pylint: disable=no-member
+        return {'traces': TraceStore(self.storage.redis).recent(limit, command)}
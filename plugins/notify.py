@@ -1,36 +1,133 @@
 """
 Notify plugin.
 """
+import json
+import threading
+
+from will import settings
 from will.plugin import WillPlugin
 from will.decorators import respond_to, route
+from will.mixins.hipchat import ROOM_NOTIFICATION_URL
+import bottle
+import requests
+
+from alton.build_notifications import BuildSubscriptions
+from alton.notification_dispatcher import NotificationDispatcher
 
 
 class NotifyPlugin(WillPlugin):
     """
     Notify plugin.
     """
-    @route("/notify/<build_id>/<text>")
-    def send_notification(self, build_id, text):
+    # Guards creation of the notification dispatcher shared by the web server's request threads.
+    dispatcher_lock = threading.Lock()
+
+    # Delivers build notifications in the background - created on first use, in the web server process.
+    notification_dispatcher = None
+
+    def _build_subscriptions(self):
         """
-        Send a build notification.
+        Returns the build subscription store, kept in the bot's Redis storage.
+        """
+        self.bootstrap_storage()
+        return BuildSubscriptions(self.storage.redis)
+
+    def _notification_dispatcher(self):
+        """
+        Returns the dispatcher delivering build notifications, starting it on first use.
+
+        Will creates a plugin instance for each route, so the dispatcher is kept on the class - every /notify
+        route queues to the same dispatcher, and their notifications to a room are batched together.
+        """
+        plugin_class = type(self)
+        with plugin_class.dispatcher_lock:
+            if plugin_class.notification_dispatcher is None:
+                self.bootstrap_storage()
+                plugin_class.notification_dispatcher = NotificationDispatcher(
+                    self.storage.redis, self._notification_lines, self._send_room_notification
+                )
+        return plugin_class.notification_dispatcher
+
+    def _notification_lines(self, notifications):
+        """
+        Returns, for each of a list of (build_id, text) notifications, the (room, line) pairs announcing it -
+        a room of None is the default room.
         """
-        if '@' in build_id:
-            # We're using this to handle the edge case of a notification list
-            # that's passed in through jenkins instead of registered in alton.
-            notification_list = build_id
-            self.say("{} Message: {}".format(notification_list, text), notify=True)
-        else:
-            notification_list = self.load("notify_" + build_id, {})
-            for room in notification_list:
-                self.say(
+        subscriptions = self._build_subscriptions().bulk_subscriptions(
+            build_id for build_id, __ in notifications if '@' not in build_id
+        )
+        notification_lines = []
+        for build_id, text in notifications:
+            if '@' in build_id:
+                # We're using this to handle the edge case of a notification list
+                # that's passed in through jenkins instead of registered in alton.
+                notification_list = build_id
+                notification_lines.append([(None, "{} Message: {}".format(notification_list, text))])
+                continue
+
+            notification_list = subscriptions[build_id]
+            notification_lines.append([
+                (
+                    room,
                     "{} BuildID: {}, Message: {}".format(
                         ' '.join('@' + user for user in notification_list.get(room, [])),
                         build_id,
                         text
-                    ),
-                    room=self.get_room_from_name_or_id(room),
-                    notify=True
+                    )
                 )
+                for room in notification_list
+            ])
+        return notification_lines
+
+    def _send_room_notification(self, room, content):
+        """
+        Send a notification to a room, raising an exception if HipChat doesn't accept it.
+        """
+        room_id = self.get_room_from_name_or_id(room or settings.DEFAULT_ROOM)['room_id']  # pylint: disable=no-member
+        url = ROOM_NOTIFICATION_URL % {
+            'server': settings.HIPCHAT_SERVER,  # pylint: disable=no-member
+            'room_id': room_id,
+            'token': settings.V2_TOKEN,  # pylint: disable=no-member
+        }
+        data = {
+            'message': content,
+            'message_format': 'text',
+            'color': 'green',
+            'notify': True,
+        }
+        headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
+        response = requests.post(url, headers=headers, data=json.dumps(data), **settings.REQUESTS_OPTIONS)
+        response.raise_for_status()
+
+    @route("/notify/<build_id>/<text>")
+    def send_notification(self, build_id, text):
+        """
+        Send a build notification.
+
+        The notification is queued and delivered in the background, so the build reporting it doesn't wait
+        on the chat server.
+        """
+        self._notification_dispatcher().enqueue(build_id, text)
+
+    @route("/notify", method="POST")
+    def send_notifications(self):
+        """
+        Send a batch of build notifications, posted as JSON:
+
+            {"notifications": [{"build_id": "...", "text": "..."}, ...]}
+
+        The notifications are queued together, so each room gets one message covering all the builds it
+        subscribed to.
+        """
+        try:
+            notifications = [
+                (unicode(notification['build_id']), unicode(notification['text']))
+                for notification in bottle.request.json['notifications']  # pylint: disable=unsubscriptable-object
+            ]
+        except (KeyError, TypeError, ValueError):
+            raise bottle.HTTPError(400, 'Expected {"notifications": [{"build_id": ..., "text": ...}, ...]}')
+        queued = self._notification_dispatcher().enqueue_many(notifications)
+        return {'queued': queued, 'duplicates': len(notifications) - queued}
 
     @respond_to(r"^subscribe (@?)(?P<users>(\S+ )+)to(?P<build_ids>( \S+)+)")
     def subscribe(self, message, users, build_ids):
@@ -39,29 +136,22 @@ class NotifyPlugin(WillPlugin):
         """
         channel = self.get_room_from_message(message)['name']
         users = users.split()
-        build_ids = {build_id: None for build_id in build_ids.split()}
+        # Keep the order the build IDs were given in, without duplicates.
+        build_ids = sorted(set(build_ids.split()), key=build_ids.split().index)
 
         users = [message.sender.nick if user == "me" else user for user in users]
 
-        for build_id in build_ids:
-            notification_list = self.load("notify_" + build_id, None)
-            if not notification_list:
-                self.reply(message, "Sorry, I don't know about a token named {}".format(build_id), color='red')
-                return
-            else:
-                build_ids[build_id] = notification_list
-
-        for user in users:
-            for build_id, notification_list in build_ids.iteritems():
-                notification_list[channel] = notification_list.get(channel, [])
-                notification_list[channel].append(user)
-                notification_list[channel] = list(set(notification_list.get(channel, [])))
-                build_ids[build_id] = notification_list
-                self.save('notify_' + build_id, notification_list, expire=259200)
+        subscriptions = self._build_subscriptions()
+        unknown_build_ids = subscriptions.unknown_builds(build_ids)
+        if unknown_build_ids:
+            self.reply(message, "Sorry, I don't know about a token named {}".format(unknown_build_ids[0]), color='red')
+            return
+
+        subscribed_users = subscriptions.subscribe(build_ids, channel, users)
 
         for build_id in build_ids:
             self.reply(message, "OK, I'll tell {} when I hear about {}".format(
-                ', '.join(user for user in notification_list.get(channel, [])),
+                ', '.join(sorted(subscribed_users[build_id])),
                 build_id))
 
     @respond_to(r"^who is subscribed to (?P<build_id>\S+)")
@@ -69,7 +159,31 @@ class NotifyPlugin(WillPlugin):
         """
         who is subscribed to [buildid]: see the notification list for a token
         """
-        notification_list = self.load("notify_" + build_id, {})
+        notification_list = self._build_subscriptions().subscriptions(build_id)
         self.reply(message, "Subscription list:")
         for room in notification_list:
             self.reply(message, "{}:  {}".format(room, ', '.join(notification_list.get(room, []))))
+
+    @respond_to(r"^my subscriptions")
+    def my_subscriptions(self, message):
+        """
+        my subscriptions: list the builds you'll be notified about
+        """
+        subscriptions = self._build_subscriptions().user_subscriptions(message.sender.nick)
+        if not subscriptions:
+            self.reply(message, "You aren't subscribed to any builds.")
+            return
+        self.reply(message, "You're subscribed to:")
+        for build_id in sorted(subscriptions):
+            self.reply(message, "{}:  {}".format(build_id, ', '.join(subscriptions[build_id])))
+
+    @respond_to(r"^unsubscribe me from all")
+    def unsubscribe_all(self, message):
+        """
+        unsubscribe me from all: stop being notified about any builds
+        """
+        build_ids = self._build_subscriptions().unsubscribe_all(message.sender.nick)
+        if not build_ids:
+            self.reply(message, "You aren't subscribed to any builds.")
+            return
+        self.reply(message, "OK, I won't tell you about {}".format(', '.join(build_ids)))
@@ -1,22 +1,36 @@
 """
 Commands to pause/unpause release pipeline systems.
 """
+from datetime import datetime, timedelta
 import pprint
 import logging
+import threading
 
 from will import settings
 from will.plugin import WillPlugin
-from will.decorators import respond_to
+from will.decorators import respond_to, periodic
 
+from alton.command_pool import COMMAND_POOL, pooled
 from alton.pause_event import (
     PIPELINE_SYSTEM_INFO,
     S3PauseEventOps,
     PauseEventNotFound,
     MultiplePauseEventsFound
 )
+from alton.sqlite_pause_event import SQLitePauseEventOps
+from alton.tracing import traced, traced_quietly
 
 log = logging.getLogger(__name__)
 
+# Maximum number of lines sent back in a single HipChat message.
+OUTPUT_CHUNK_SIZE = 50
+
+# Number of days in each unit of a stats window, e.g. 30d, 12w, 6m, 1y.
+WINDOW_UNIT_DAYS = {'d': 1, 'w': 7, 'm': 30, 'y': 365}
+
+# Longest stats window, in days - far longer than the pause history, and short enough to subtract from a date.
+MAX_WINDOW_DAYS = 100 * 365
+
 # pylint: disable=len-as-condition
 
 
@@ -25,17 +39,51 @@ class ReleasePlugin(WillPlugin):
     Plugin containing commands to pause/unpause release pipeline systems.
     """
     def __init__(self):
-        for required_var in ['PIPELINE_BUCKET_NAME', 'GOCD_USERNAME', 'GOCD_PASSWORD', 'GOCD_SERVER_URL']:
+        # Pause events are stored in S3 by default, or in a local SQLite database.
+        self.pause_backend = getattr(settings, 'PIPELINE_PAUSE_BACKEND', 's3')
+        if self.pause_backend == 'sqlite':
+            storage_vars = ['PIPELINE_SQLITE_PATH']
+        else:
+            storage_vars = ['PIPELINE_BUCKET_NAME']
+        for required_var in storage_vars + ['GOCD_USERNAME', 'GOCD_PASSWORD', 'GOCD_SERVER_URL']:
             if not hasattr(settings, required_var):
                 msg = "Error: {} not defined in the environment".format(required_var)
                 self._say_error(msg)
-        # pylint: disable=no-member
-        self.pause_ops = S3PauseEventOps(
-            settings.PIPELINE_BUCKET_NAME,
-            settings.GOCD_USERNAME,
-            settings.GOCD_PASSWORD,
-            settings.GOCD_SERVER_URL
-        )
+        # The pause event backend connects to its storage, so it's only created when first used -
+        # loading the plugin mustn't wait on (or fail because of) an unreachable S3 endpoint.
+        self._pause_ops = None
+        self._pause_ops_lock = threading.Lock()
+
+    @property
+    def pause_ops(self):
+        """
+        The pause event backend, created on first use.
+        """
+        with self._pause_ops_lock:
+            if self._pause_ops is None:
+                # pylint: disable=no-member
+                if self.pause_backend == 'sqlite':
+                    self._pause_ops = SQLitePauseEventOps(
+                        settings.PIPELINE_SQLITE_PATH,
+                        settings.GOCD_USERNAME,
+                        settings.GOCD_PASSWORD,
+                        settings.GOCD_SERVER_URL
+                    )
+                else:
+                    self._pause_ops = S3PauseEventOps(
+                        settings.PIPELINE_BUCKET_NAME,
+                        settings.GOCD_USERNAME,
+                        settings.GOCD_PASSWORD,
+                        settings.GOCD_SERVER_URL,
+                        file_format=getattr(settings, 'PIPELINE_PAUSE_FILE_FORMAT', 'yaml')
+                    )
+            return self._pause_ops
+
+    def warm_up(self):
+        """
+        Load the current pause events, so the first pipeline command doesn't pay for connecting to the backend.
+        """
+        self.pause_ops.pipeline_status()
 
     def _say(self, msg, message=None):
         """
@@ -67,7 +115,7 @@ class ReleasePlugin(WillPlugin):
 
     def _format_status_output(self, pipeline_system, statuses, paused_only=False):
         """
-        Takes the pipeline pause event output read from S3 and formats it into a string to return.
+        Takes the pipeline pause event output and formats it into a string to return.
         """
         if pipeline_system:
             # Output for a single pipeline system.
@@ -97,10 +145,80 @@ class ReleasePlugin(WillPlugin):
                 cmd_output += "     All systems ({}) active.".format(', '.join(PIPELINE_SYSTEM_INFO.keys()))
         return cmd_output
 
+    def _parse_history_date(self, date_str, end=False):
+        """
+        Parses a YYYY-MM or YYYY-MM-DD date passed to the history command.
+        If end is True, returns the start of the following month/day, so that the range includes the whole period.
+        """
+        if date_str is None:
+            return None
+        if len(date_str) == len('YYYY-MM'):
+            period_start = datetime.strptime(date_str, '%Y-%m')
+            if end:
+                return (period_start + timedelta(days=31)).replace(day=1)
+            return period_start
+        period_start = datetime.strptime(date_str, '%Y-%m-%d')
+        if end:
+            return period_start + timedelta(days=1)
+        return period_start
+
+    def _format_history_event(self, pause_event):
+        """
+        Formats a single historical pause event as one line of output.
+        """
+        if pause_event.get('time_cleared'):
+            cleared = "resolved {} by {}".format(pause_event['time_cleared'], pause_event.get('who_cleared'))
+        else:
+            cleared = "UNRESOLVED"
+        return "{} {:>10} {} paused by {}, {}: {}".format(
+            pause_event.get('time_paused'),
+            pause_event.get('pipeline_system'),
+            pause_event.get('event_id'),
+            pause_event.get('who_paused'),
+            cleared,
+            pause_event.get('pause_reason')
+        )
+
+    def _format_duration(self, seconds):
+        """
+        Formats a number of seconds as e.g. '2d 3h 15m'.
+        """
+        if seconds is None:
+            return '-'
+        minutes, __ = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        days, hours = divmod(hours, 24)
+        if days:
+            return '{}d {}h {}m'.format(days, hours, minutes)
+        if hours:
+            return '{}h {}m'.format(hours, minutes)
+        return '{}m'.format(minutes)
+
+    def _format_stats_output(self, stats):
+        """
+        Takes the pipeline pause statistics and formats them into a string to return.
+        """
+        cmd_output = "{:>10} {:>7} {:>14} {:>14} {:>14}  {}\n".format(
+            'System', 'Pauses', 'Time paused', 'Mean resolve', 'p95 resolve', 'Top pausers'
+        )
+        for system in sorted(stats):
+            system_stats = stats[system]
+            cmd_output += "{:>10} {:>7} {:>14} {:>14} {:>14}  {}\n".format(
+                system,
+                system_stats['count'],
+                self._format_duration(system_stats['paused_seconds']),
+                self._format_duration(system_stats['mean_resolve_seconds']),
+                self._format_duration(system_stats['p95_resolve_seconds']),
+                ', '.join('{} ({})'.format(who, count) for who, count in system_stats['top_pausers'])
+            )
+        return cmd_output
+
     @respond_to(r"^pipeline[\s]+pause[\s]+"
                 r"(?P<pipeline_system>\w*)[\s]+"  # Pipeline system to pause
                 r"because[\s]+"
                 r"(?P<pause_reason>.*)")  # Reason for pausing
+    @pooled
+    @traced_quietly
     def pause(self, message, pipeline_system, pause_reason):
         """
         pipeline pause [pipeline_system] because [reason]
@@ -118,9 +236,11 @@ class ReleasePlugin(WillPlugin):
 
     @respond_to(r"^pipeline[\s]+resolve[\s]+"
                 r"(?P<event_id>\w*)")  # Pipeline event to remove
+    @pooled
+    @traced
     def remove_event(self, message, event_id):
         """
-        pipeline resolve [event_id]
+        pipeline resolve [event_id] [verbose]
             : Remove the specified pipeline pause event.
         """
         try:
@@ -129,7 +249,9 @@ class ReleasePlugin(WillPlugin):
             self._say_error("Event '{}' was not found.".format(event_id), message)
         except MultiplePauseEventsFound:
             self._say_error(
-                "Multiple events found with ID '{}'? Should not happen - check the S3 bucket.".format(event_id),
+                "Multiple events found with ID '{}'? Should not happen - check the pause event storage.".format(
+                    event_id
+                ),
                 message
             )
         else:
@@ -156,3 +278,83 @@ class ReleasePlugin(WillPlugin):
         statuses = self.pause_ops.pipeline_status(pipeline_system)
         cmd_output = self._format_status_output(pipeline_system, statuses)
         self._say(cmd_output, message)
+
+    @respond_to(r"^pipeline[\s]+history"
+                r"(?:[\s]+(?P<pipeline_system>[a-zA-Z_]\w*))?"  # Pipeline system for which to retrieve history.
+                r"(?:[\s]+(?P<since>\d{4}-\d{2}(?:-\d{2})?))?"  # Earliest date, YYYY-MM or YYYY-MM-DD.
+                r"(?:[\s]+(?P<until>\d{4}-\d{2}(?:-\d{2})?))?"  # Latest date, YYYY-MM or YYYY-MM-DD.
+                r"[\s]*$")
+    @pooled
+    def history(self, message, pipeline_system, since, until):
+        """
+        pipeline history [pipeline_system] [since] [until]
+            : Lists the pause events of one or all pipeline systems, optionally between two dates (YYYY-MM[-DD]).
+        """
+        if not self._check_pipeline_system(pipeline_system, message):
+            return
+
+        try:
+            since_dt = self._parse_history_date(since)
+            until_dt = self._parse_history_date(until, end=True)
+        except (ValueError, OverflowError) as exc:
+            # OverflowError is the end of 9999-12, which is past the latest datetime.
+            self._say_error("Invalid date: {}".format(exc), message)
+            return
+
+        # Send the events back in chunks as they're read, rather than collecting the whole history first.
+        num_events = 0
+        output_lines = []
+        # Reading history can take a while - stop as soon as the command is cancelled.
+        history = self.pause_ops.pipeline_history(
+            pipeline_system or None, since_dt, until_dt, check_cancelled=COMMAND_POOL.check_cancelled
+        )
+        for pause_event in history:
+            num_events += 1
+            output_lines.append(self._format_history_event(pause_event))
+            if len(output_lines) >= OUTPUT_CHUNK_SIZE:
+                self._say('\n'.join(output_lines), message)
+                output_lines = []
+        if output_lines:
+            self._say('\n'.join(output_lines), message)
+        if num_events == 0:
+            self._say("No pause events found.", message)
+
+    @periodic(hour=4, minute=0)
+    def compact_history(self):
+        """
+        Nightly job which rolls closed months of pause history into single rollup files.
+        """
+        # Only S3 stores history as one file per event.
+        if isinstance(self.pause_ops, S3PauseEventOps):
+            self.pause_ops.compact_history()
+
+    @respond_to(r"^pipeline[\s]+stats"
+                r"(?:[\s]+(?P<pipeline_system>[a-zA-Z_]\w*))?"  # Pipeline system for which to retrieve stats.
+                r"(?:[\s]+(?P<window>\d+[dwmy]))?"  # Window to report on, e.g. 30d, 12w, 6m, 1y.
+                r"[\s]*$")
+    @pooled
+    def stats(self, message, pipeline_system, window):
+        """
+        pipeline stats [pipeline_system] [window]
+            : Pause count, time paused, time-to-resolve and top pausers, optionally over a window like 30d or 6m.
+        """
+        if not self._check_pipeline_system(pipeline_system, message):
+            return
+
+        since = None
+        if window:
+            window_days = int(window[:-1]) * WINDOW_UNIT_DAYS[window[-1]]
+            if window_days > MAX_WINDOW_DAYS:
+                self._say_error(
+                    "Window '{}' is too long - windows are at most {} days.".format(window, MAX_WINDOW_DAYS), message
+                )
+                return
+            since = datetime.now() - timedelta(days=window_days)
+
+        stats = self.pause_ops.pipeline_stats(
+            pipeline_system or None, since=since, check_cancelled=COMMAND_POOL.check_cancelled
+        )
+        if not stats:
+            self._say("No pause events found.", message)
+            return
+        self._say(self._format_stats_output(stats), message)
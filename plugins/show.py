@@ -1,28 +1,43 @@
 """
 Show AWS data plugin
 """
+import hmac
+import json
 import logging
+import threading
 import time
 import urllib2
+from collections import Counter, OrderedDict, defaultdict
 from itertools import izip_longest
 from pprint import pformat
-import jenkins
-import yaml
 from will import settings
 from will.plugin import WillPlugin
-from will.decorators import respond_to
-import boto
-from boto.exception import EC2ResponseError
-from pyparsing import (
-    Word, Combine, Suppress, OneOrMore, Optional, StringStart,
-    StringEnd, alphanums, printables, Group, Regex, Literal, ParseException
-)
+from will.decorators import respond_to, periodic, route
+import bottle
+# boto, jenkins, yaml and pyparsing are slow to import, so they're imported where they're used,
+# to keep them off the bot's startup path.
+from alton.ami_cache import AmiCache
+from alton.build_notifications import BuildSubscriptions
+from alton.build_plans import PLAN_EXPIRE_SECONDS, BuildPlans
+from alton.command_pool import COMMAND_POOL, pooled
+from alton.git_mirrors import GitMirrors
+from alton.inventory import Inventory
+from alton.metrics import backend_call
+from alton.rate_limiter import AWS_RATE_LIMITER
+from alton.repo_urls import web_url
+from alton.single_flight import SingleFlight
+from alton.tracing import spanned, traced
 
 
 class Versions(object):
     """
     Encapsulates versions associated with an AMI.
+
+    Version vars are stored once, by lower-case name - some plays use upper-case version vars and some
+    lower-case, so play_versions has both.
     """
+    __slots__ = ('configuration', 'configuration_secure', 'versions', 'repos')
+
     def __init__(self, configuration_ref, configuration_secure_ref, versions,
                  repos=None):
         """
@@ -32,32 +47,147 @@ class Versions(object):
         """
         self.configuration = configuration_ref
         self.configuration_secure = configuration_secure_ref
-        self.play_versions = versions
+        self.versions = {var.lower(): ref for var, ref in versions.items()}
         self.repos = repos
 
+    @classmethod
+    def from_tags(cls, tags):
+        """
+        Returns the versions recorded in an AMI's 'version:<repo>' tags.
+        """
+        configuration_ref = None
+        configuration_secure_ref = None
+        versions = {}
+        repos = {}
+        for tag, value in tags.items():
+            if tag.startswith('version:'):
+                key = tag[8:].strip()
+                repo, shorthash = value.split()
+                repos[key] = {
+                    'url': repo,
+                    'shorthash': shorthash
+                }
+
+                if key == 'configuration':
+                    configuration_ref = shorthash
+                elif key == 'configuration_secure':
+                    configuration_secure_ref = shorthash
+                else:
+                    versions["{}_version".format(key)] = shorthash
+        return cls(configuration_ref, configuration_secure_ref, versions, repos)
+
+    @property
+    def play_versions(self):
+        """
+        A dict mapping each version var, in both lower and upper case, to its gitref.
+        """
+        play_versions = {}
+        for var, ref in self.versions.items():
+            play_versions[var] = ref
+            play_versions[var.upper()] = ref
+        return play_versions
+
+    def set_version(self, var, ref):
+        """
+        Set the gitref of a version var, in whichever case it's given.
+        """
+        self.versions[var.lower()] = ref
+
+    def to_dict(self):
+        """
+        Returns the versions as a JSON-serializable dict.
+        """
+        return {
+            'configuration': self.configuration,
+            'configuration_secure': self.configuration_secure,
+            'versions': self.versions,
+            'repos': self.repos,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Returns the versions in a dict returned by to_dict().
+        """
+        return cls(data['configuration'], data['configuration_secure'], data['versions'], data['repos'])
+
+    def copy(self):
+        """
+        Returns a copy which can be changed without changing these versions.
+        """
+        return Versions(self.configuration, self.configuration_secure, self.versions, self.repos)
+
+    def refs(self):
+        """
+        Returns the repo refs, e.g. ['configuration=abc1234', 'edx_platform_version=def5678', ...].
+        """
+        refs = []
+        for key, repo_data in (self.repos or {}).items():
+            if key in ('configuration', 'configuration_secure') or key.endswith(('_version', '_VERSION')):
+                refs.append("{}={}".format(key, repo_data['shorthash']))
+            else:
+                refs.append("{}_version={}".format(key, repo_data['shorthash']))
+        return refs
+
 
 class ShowPlugin(WillPlugin):
     """
     Show plugin.
     """
+    # Most AMI ids looked up in one request.
+    IMAGE_FILTER_BATCH_SIZE = 100
+
+    # Most AMIs whose parsed versions are kept.
+    AMI_VERSIONS_CACHE_SIZE = 1000
+
     def __init__(self):
         if not hasattr(settings, "BOTO_PROFILES"):
             msg = "Error: BOTO_PROFILES not defined in the environment"
             self._say_error(msg)
         self.aws_profiles = settings.BOTO_PROFILES.split(";")  # pylint: disable=no-member
+        # Identical AWS lookups made by concurrent commands share one request.
+        self.aws_lookups = SingleFlight()
+        # AWS connections, by (service, profile name) - reused so only the first command pays for connecting.
+        self.aws_connections = {}
+        self.aws_connections_lock = threading.Lock()
+        # Versions parsed from the tags of each AMI, by AMI id, least recently used first.
+        self.ami_versions = OrderedDict()
+        self.ami_versions_lock = threading.Lock()
+        # AMIs found in AWS, kept on disk across restarts if AMI_CACHE_PATH is set.
+        self.ami_cache = AmiCache(getattr(settings, 'AMI_CACHE_PATH', ':memory:'))
+        # Change notifications keep a view of the instances and ELBs in Redis - only if the webhook has a token.
+        self.inventory_enabled = hasattr(settings, 'INVENTORY_WEBHOOK_TOKEN')
+        # Mirrors of the repos in AMIs, for summarizing the commits between versions - only if configured.
+        self.git_mirrors = None
+        if hasattr(settings, 'GIT_MIRROR_DIR'):
+            self.git_mirrors = GitMirrors(settings.GIT_MIRROR_DIR)  # pylint: disable=no-member
 
     @respond_to(r"^show (?!ami-)"  # Negative lookahead to exclude ami strings
-                r"(?P<env>\w*)(-(?P<dep>\w*))(-(?P<play>\w*))?")
-    def show(self, message, env, dep, play):
+                r"(?P<env>\w*)(-(?P<dep>\w*))(-(?P<play>\w*))?"
+                r"(?:\s+(?P<summary>summary))?")  # Group instances rather than listing them
+    @pooled
+    @traced
+    def show(self, message, env, dep, play, summary=None):
         """
-        show [e-d-p]: show the instances in a VPC cluster
+        show [e-d-p] [summary] [verbose]: show the instances in a VPC cluster, or counts of them by AMI, ELBs and state
         """
 
-        if play is None:
+        if summary:
+            self._show_summary(message, env, dep, play)
+        elif play is None:
             self._show_plays(message, env, dep)
         else:
             self._show_edp(message, env, dep, play)
 
+    @respond_to(r"^drift (?P<env>\w*)-(?P<dep>\w*)")
+    @pooled
+    @traced
+    def drift(self, message, env, dep):
+        """
+        drift [e-d] [verbose]: list the plays in an environment-deployment with more than one AMI in service
+        """
+        self._show_drift(message, env, dep)
+
     @respond_to(r"^show (?P<deployment>\w*) (?P<ami_id>ami-\w*)")
     def show_ami_deprecated(self, message, deployment, ami_id):  # pylint: disable=unused-argument
         """
@@ -68,9 +198,11 @@ class ShowPlugin(WillPlugin):
                  message=message, color='yellow')
 
     @respond_to(r"^show (?P<ami_id>ami-\w*)")
+    @pooled
+    @traced
     def show_ami(self, message, ami_id):
         """
-        show [ami_id]: show tags for the ami
+        show [ami_id] [verbose]: show tags for the ami
         """
 
         ami = self._get_ami(ami_id, message=message)
@@ -84,65 +216,90 @@ class ShowPlugin(WillPlugin):
                 r" "
                 r"(?P<second_env>\w*)-"  # Second Environment
                 r"(?P<second_dep>\w*)-"  # Second Deployment
-                r"(?P<second_play>\w*)")  # Second Play(Cluster)
+                r"(?P<second_play>\w*)"  # Second Play(Cluster)
+                r"(?:\s+(?P<commits>commits))?")
+    @pooled
+    @traced
     def diff_edps(self, message, first_env, first_dep, first_play,
-                  second_env, second_dep, second_play):
+                  second_env, second_dep, second_play, commits=None):
         """
-        diff [e-d-p] [e-d-p] : Show the differences between two EDPs
+        diff [e-d-p] [e-d-p] [commits] [verbose] : Show the differences between two EDPs
         """
         first_ami = self._ami_for_edp(
             message, first_env, first_dep, first_play)
         second_ami = self._ami_for_edp(
             message, second_env, second_dep, second_play)
 
-        self._diff_amis(first_ami, second_ami, message)
+        self._diff_amis(first_ami, second_ami, message, commits=bool(commits))
 
     @respond_to(r"^diff "
                 r"(?P<first_env>\w*)-"  # First Environment
                 r"(?P<first_dep>\w*)-"  # First Deployment
                 r"(?P<first_play>\w*)"  # First Play(Cluster)
                 r" "
-                r"(?P<second_ami>ami-\w*)")  # AMI
+                r"(?P<second_ami>ami-\w*)"  # AMI
+                r"(?:\s+(?P<commits>commits))?")
+    @pooled
+    @traced
     def diff_edp_ami_id(self, message, first_env, first_dep, first_play,
-                        second_ami):
+                        second_ami, commits=None):
         """
-        diff [ami-id] [e-d-p] : Show the differences between an EDP and an AMI
+        diff [ami-id] [e-d-p] [commits] [verbose] : Show the differences between an EDP and an AMI
         """
         first_ami = self._ami_for_edp(
             message, first_env, first_dep, first_play)
-        self._diff_amis(first_ami, second_ami, message)
+        self._diff_amis(first_ami, second_ami, message, commits=bool(commits))
 
     @respond_to(r"^diff "
                 r"(?P<first_ami>ami-\w*)"  # AMI
                 r" "
                 r"(?P<second_env>\w*)-"  # Second Environment
                 r"(?P<second_dep>\w*)-"  # Second Deployment
-                r"(?P<second_play>\w*)")  # Second Play(Cluster)
+                r"(?P<second_play>\w*)"  # Second Play(Cluster)
+                r"(?:\s+(?P<commits>commits))?")
+    @pooled
+    @traced
     def diff_ami_id_edp(self, message, first_ami,
-                        second_env, second_dep, second_play):
+                        second_env, second_dep, second_play, commits=None):
         """
-        diff [e-d-p] [ami-id] : Show the differences between an AMI and an EDP
+        diff [e-d-p] [ami-id] [commits] [verbose] : Show the differences between an AMI and an EDP
         """
         second_ami = self._ami_for_edp(
             message, second_env, second_dep, second_play)
-        self._diff_amis(first_ami, second_ami, message)
+        self._diff_amis(first_ami, second_ami, message, commits=bool(commits))
 
     @respond_to(r"^diff "
                 r"(?P<first_ami>ami-\w*)"
                 r" "
-                r"(?P<second_ami>ami-\w*)")
-    def diff_ami_ids(self, message, first_ami, second_ami):
+                r"(?P<second_ami>ami-\w*)"
+                r"(?:\s+(?P<commits>commits))?")
+    @pooled
+    @traced
+    def diff_ami_ids(self, message, first_ami, second_ami, commits=None):
         """
-        diff [ami-id1] [ami-id2] : Show the difference between two AMIs
+        diff [ami-id1] [ami-id2] [commits] [verbose] : Show the difference between two AMIs
         """
-        self._diff_amis(first_ami, second_ami, message)
+        self._diff_amis(first_ami, second_ami, message, commits=bool(commits))
 
-    @respond_to(r"^(?P<body>cut\s+ami.*)")
+    @periodic(minute='*/15')
+    def refresh_git_mirrors(self):
+        """
+        Job which fetches the latest commits into the git mirrors "diff ... commits" reads.
+        """
+        if self.git_mirrors is not None:
+            self.git_mirrors.refresh()
+
+    @respond_to(r"^(?P<body>cut\s+ami(?!\s+confirm\b).*)")
+    @pooled
+    @traced
     def cut_from_edp(self, message, body):
         """
         cut ami [noop] [verbose] for <e-d-c> from <e-d-c> [with <var1>=<value> <var2>=<version> ...] [using <ami-id>] :
-            Build an AMI for one EDC using the versions from a different EDC with verions overrides
+            Build an AMI for one EDC using the versions from a different EDC with verions overrides.
+            With noop, the build is planned but not started - "cut ami confirm" starts it.
         """
+        from pyparsing import ParseException
+
         try:
             logging.info('Parsing: "{}"'.format(body))
             parsed = self._parse_cut_ami(body)
@@ -248,13 +405,41 @@ class ShowPlugin(WillPlugin):
             self.say(msg, message=message, color='yellow')
             self.say(example_command, message=message, color='yellow')
 
+        # Last chance to cancel before the build starts.
+        COMMAND_POOL.check_cancelled()
         self._notify_abbey(message, dest_env, dest_dep, dest_play,
                            final_versions, noop, dest_running_ami, verbose)
 
+    @respond_to(r"^cut\s+ami\s+confirm\s+(?P<token>[0-9a-f]+)(?:\s+verbose)?\s*$")
+    @pooled
+    @traced
+    def cut_confirm(self, message, token):
+        """
+        cut ami confirm <token> [verbose] : Build the AMI you planned with a "cut ami noop", as it was planned
+        """
+        self.bootstrap_storage()
+        plan = BuildPlans(self.storage.redis).pop(message.sender.nick, token)
+        if plan is None:
+            msg = (
+                "I don't have a build plan {} of yours - plans can be confirmed once, "
+                "by whoever made them, for {} minutes."
+            ).format(token, PLAN_EXPIRE_SECONDS // 60)
+            self._say_error(msg, message=message)
+            return
+
+        COMMAND_POOL.check_cancelled()
+        self._notify_abbey(message, plan['env'], plan['dep'], plan['play'],
+                           Versions.from_dict(plan['versions']), False, plan['ami_id'], plan['verbose'])
+
     @staticmethod
     def _parse_cut_ami(text):
         """Parse "cut ami" command using pyparsing"""
 
+        from pyparsing import (
+            Word, Combine, Suppress, OneOrMore, Optional, StringStart,
+            StringEnd, alphanums, printables, Group, Regex, Literal
+        )
+
         # Word == single token
         edctoken = Word(alphanums + '_')
         withtoken = Word(printables.replace('=', ''))
@@ -281,7 +466,10 @@ class ShowPlugin(WillPlugin):
         # 0-1 verbose and noop options in any order (as above)
         options = Optional(Literal('verbose')('verbose')) & Optional(Literal('noop')('noop'))
 
-        pattern = StringStart() + preamble + options + for_from + modifiers + StringEnd()
+        # e.g. ... verbose, the suffix asking any traced command for its span breakdown
+        verbose_suffix = Optional(Literal('verbose')('verbose_suffix'))
+
+        pattern = StringStart() + preamble + options + for_from + modifiers + verbose_suffix + StringEnd()
 
         parsed = pattern.parseString(text)
         return {
@@ -293,7 +481,7 @@ class ShowPlugin(WillPlugin):
             'source_play': parsed.from_edc.cluster,
             'base_ami': parsed.using_stmt.ami_id if parsed.using_stmt else None,
             'version_overrides': {i.key: i.value for i in parsed.with_stmt.overrides} if parsed.with_stmt else None,
-            'verbose': bool(parsed.verbose),
+            'verbose': bool(parsed.verbose or parsed.verbose_suffix),
             'noop': bool(parsed.noop),
         }
 
@@ -302,13 +490,12 @@ class ShowPlugin(WillPlugin):
         Gets all plays in an environment-deployment.
         """
         logging.info("Getting all plays in {}-{}".format(env, dep))
-        ec2 = boto.connect_ec2(profile_name=dep)
 
         instance_filter = {
             "tag:environment": env,
             "tag:deployment": dep,
         }
-        instances = ec2.get_all_instances(filters=instance_filter)
+        instances = self._get_instances(dep, instance_filter)
 
         plays = set()
         for reservation in instances:
@@ -322,33 +509,172 @@ class ShowPlugin(WillPlugin):
         output.extend(list(plays))
         self.say("/code {}".format("\n".join(output)), message)
 
+    def _aws_connection(self, service, profile_name):
+        """
+        Returns the boto connection to an AWS service ('ec2' or 'elb') for a profile, connecting on first use.
+        """
+        import boto
+
+        with self.aws_connections_lock:
+            key = (service, profile_name)
+            if key not in self.aws_connections:
+                connect = {'ec2': boto.connect_ec2, 'elb': boto.connect_elb}[service]
+                self.aws_connections[key] = connect(profile_name=profile_name)
+            return self.aws_connections[key]
+
+    def warm_up(self):
+        """
+        Connect to every AWS account and make the lookups the first commands would otherwise make from cold.
+        """
+        for profile in self.aws_profiles:
+            self._aws_connection('ec2', profile)
+            if self.inventory_enabled:
+                self._sync_inventory(profile)
+            else:
+                self._get_load_balancers(profile)
+                self._get_instances(profile, {'instance-state-name': 'running'})
+
+    def _inventory(self):
+        """
+        Returns the view of the instances and ELBs kept by change notifications, or None if it isn't enabled.
+        """
+        if not self.inventory_enabled:
+            return None
+        self.bootstrap_storage()
+        return Inventory(self.storage.redis)
+
+    def _sync_inventory(self, profile_name):
+        """
+        Replace the inventory of an account with a listing of all its instances and ELBs.
+        """
+        self._inventory().replace(
+            profile_name, self._list_instances(profile_name, {}), self._list_load_balancers(profile_name)
+        )
+
+    @periodic(minute=0)
+    def sync_inventory(self):
+        """
+        Hourly job which lists every account's instances and ELBs into the inventory, in case it missed an event.
+        """
+        if self.inventory_enabled:
+            for profile in self.aws_profiles:
+                self._sync_inventory(profile)
+
+    @route("/inventory/<profile_name>", method="POST")
+    def inventory_event(self, profile_name):
+        """
+        Apply an EC2 or ELB change notification for an account to the inventory, posted by SNS as:
+
+            {"Type": "Notification", "Message": "<CloudWatch event, as JSON>", ...}
+
+        The INVENTORY_WEBHOOK_TOKEN setting must be passed as the token query parameter.
+        """
+        inventory = self._inventory()
+        if inventory is None or profile_name not in self.aws_profiles:
+            raise bottle.HTTPError(404)
+        token = bottle.request.query.get('token', '')  # pylint: disable=no-member
+        if not hmac.compare_digest(str(token), str(settings.INVENTORY_WEBHOOK_TOKEN)):  # pylint: disable=no-member
+            raise bottle.HTTPError(403)
+        try:
+            event = json.loads(bottle.request.body.read())
+            result, launched_ids = inventory.apply(profile_name, event)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise bottle.HTTPError(400, 'Expected a CloudWatch event, or an SNS notification of one')
+
+        if launched_ids:
+            from boto.exception import EC2ResponseError
+
+            try:
+                reservations = self._list_instances(profile_name, {}, instance_ids=launched_ids)
+            except EC2ResponseError:
+                logging.exception("Unable to look up launched instances %s", launched_ids)
+                inventory.invalidate(profile_name)
+                return {'result': 'invalidated'}
+            inventory.add_instances(
+                profile_name, [instance for reservation in reservations for instance in reservation.instances]
+            )
+        return {'result': result}
+
+    def _get_instances(self, profile_name, filters):
+        """
+        Returns the EC2 reservations matching filters, from the inventory if it's enabled and up to date.
+        """
+        inventory = self._inventory()
+        if inventory is not None:
+            reservations = inventory.reservations(profile_name, filters)
+            if reservations is not None:
+                return reservations
+        return self._list_instances(profile_name, filters)
+
+    def _list_instances(self, profile_name, filters, instance_ids=None):
+        """
+        Returns the EC2 reservations matching filters, sharing the request with identical concurrent lookups.
+        """
+        def lookup():
+            """
+            Make the request.
+            """
+            with backend_call('ec2', 'get_all_instances'):
+                return AWS_RATE_LIMITER.call(
+                    profile_name, 'get_all_instances',
+                    self._aws_connection('ec2', profile_name).get_all_instances,
+                    instance_ids=instance_ids, filters=filters
+                )
+        return self.aws_lookups.call(
+            ('instances', profile_name, tuple(sorted(filters.items())), tuple(instance_ids or ())), lookup
+        )
+
+    def _get_load_balancers(self, profile_name):
+        """
+        Returns all the ELBs of an account, from the inventory if it's enabled and up to date.
+        """
+        inventory = self._inventory()
+        if inventory is not None:
+            elbs = inventory.load_balancers(profile_name)
+            if elbs is not None:
+                return elbs
+        return self._list_load_balancers(profile_name)
+
+    def _list_load_balancers(self, profile_name):
+        """
+        Returns all the ELBs of an account, sharing the request with identical concurrent lookups.
+        """
+        def lookup():
+            """
+            Make the request.
+            """
+            with backend_call('elb', 'get_all_load_balancers'):
+                return AWS_RATE_LIMITER.call(
+                    profile_name, 'get_all_load_balancers',
+                    self._aws_connection('elb', profile_name).get_all_load_balancers
+                )
+        return self.aws_lookups.call(('load_balancers', profile_name), lookup)
+
     def _instance_elbs(self, instance_id, profile_name=None, elbs=None):
         """
         Generator returning all ELBs.
         """
         if elbs is None:
-            elb = boto.connect_elb(profile_name=profile_name)
-            elbs = elb.get_all_load_balancers()
+            elbs = self._get_load_balancers(profile_name)
 
         for elb in elbs:
             lb_instance_ids = [inst.id for inst in elb.instances]
             if instance_id in lb_instance_ids:
                 yield elb
 
+    @spanned
     def _ami_for_edp(self, message, env, dep, play):
         """
         Given an EDP, return its active AMI.
         """
-        ec2 = boto.connect_ec2(profile_name=dep)
-        elb = boto.connect_elb(profile_name=dep)
-        all_elbs = elb.get_all_load_balancers()
+        all_elbs = self._get_load_balancers(dep)
 
         edp_filter = {
             "tag:environment": env,
             "tag:deployment": dep,
             "tag:play": play,
         }
-        reservations = ec2.get_all_instances(filters=edp_filter)
+        reservations = self._get_instances(dep, edp_filter)
         amis = set()
         for reservation in reservations:
             for instance in reservation.instances:
@@ -377,15 +703,13 @@ class ShowPlugin(WillPlugin):
         Show info about a particular EDP.
         """
         self.say("Reticulating splines...", message)
-        ec2 = boto.connect_ec2(profile_name=dep)
-        elb = boto.connect_elb(profile_name=dep)
         edp_filter = {
             "tag:environment": env,
             "tag:deployment": dep,
             "tag:play": play,
         }
-        instances = ec2.get_all_instances(filters=edp_filter)
-        elbs = elb.get_all_load_balancers()
+        instances = self._get_instances(dep, edp_filter)
+        elbs = self._get_load_balancers(dep)
         if not instances:
             self.say('No instances found. The input may be misspelled.', message, color='red')
             return
@@ -400,25 +724,14 @@ class ShowPlugin(WillPlugin):
             for instance in reservation.instances:
                 if instance.state != 'running':
                     continue
+                COMMAND_POOL.check_cancelled()
                 msg = "Getting info for: {}"
                 logging.info(msg.format(instance.private_dns_name))
-                refs = []
                 ami_id = instance.image_id
                 ami = self._get_ami(ami_id, message=message)
                 if not ami:
                     return None
-                for name, value in ami.tags.items():
-                    if name.startswith('version:'):
-                        key = name[8:]
-                        if key == "configuration" or \
-                           key == "configuration_secure" or \
-                           key.endswith("_version") or \
-                           key.endswith("_VERSION"):
-                            refs.append(
-                                "{}={}".format(key, value.split()[1]))
-                        else:
-                            refs.append(
-                                "{}_version={}".format(key, value.split()[1]))
+                refs = self._ami_versions(ami).refs()
 
                 elb_list = []
                 for elb in elbs:
@@ -462,6 +775,131 @@ class ShowPlugin(WillPlugin):
             self.say("/code {}".format("\n".join(output)), message)
         logging.error(output_table)
 
+    def _elbs_by_instance(self, elbs):
+        """
+        Returns the sorted names of the ELBs each instance is in, by instance ID.
+        """
+        instance_elbs = defaultdict(list)
+        for elb in elbs:
+            for inst in elb.instances:
+                instance_elbs[inst.id].append(elb.name)
+        return {instance_id: tuple(sorted(names)) for instance_id, names in instance_elbs.items()}
+
+    def _resolve_amis(self, ami_ids):
+        """
+        Returns the AMIs with the given ids, by id - leaving out any not found in exactly one account.
+        """
+        amis = self.ami_cache.get_many(ami_ids)
+        ami_ids = tuple(sorted(set(ami_ids) - set(amis)))
+        if not ami_ids:
+            return amis
+        found_amis = self.aws_lookups.call(('images', ami_ids), self._find_images_batch, ami_ids)
+        new_amis = [images[0] for images in found_amis.values() if len(images) == 1]
+        self.ami_cache.put_many(new_amis)
+        amis.update((ami.id, ami) for ami in new_amis)
+        return amis
+
+    def _show_summary(self, message, env, dep, play=None):
+        """
+        Show the instances of an environment-deployment, or of one of its plays, grouped by play, AMI,
+        ELBs and state - with the size and versions of each group.
+        """
+        self.say("Reticulating splines...", message)
+        instance_filter = {
+            "tag:environment": env,
+            "tag:deployment": dep,
+        }
+        if play is not None:
+            instance_filter["tag:play"] = play
+        reservations = self._get_instances(dep, instance_filter)
+        instance_elbs = self._elbs_by_instance(self._get_load_balancers(dep))
+
+        groups = Counter()
+        for reservation in reservations:
+            for instance in reservation.instances:
+                groups[(
+                    instance.tags.get("play", ""),
+                    instance.image_id,
+                    instance_elbs.get(instance.id, ()),
+                    instance.state,
+                )] += 1
+        if not groups:
+            self.say('No instances found. The input may be misspelled.', message, color='red')
+            return
+
+        amis = self._resolve_amis(set(ami_id for __, ami_id, __, __ in groups))
+        output_table = [
+            ["Count", "Play", "State", "AMI", "ELBs", "Versions"],
+            ["-----", "----", "-----", "---", "----", "--------"],
+        ]
+        # Largest groups of each play first.
+        ordered_groups = sorted(groups.items(), key=lambda item: (item[0][0], -item[1], item[0]))
+        for (group_play, ami_id, elbs, state), count in ordered_groups:
+            ami = amis.get(ami_id)
+            output_table.append([
+                str(count), group_play, state, ami_id, ",".join(elbs) or "-",
+                " ".join(sorted(self._ami_versions(ami).refs())) if ami else "(AMI not found)",
+            ])
+        if play is not None:
+            # Every group is of the same play.
+            output_table = [row[:1] + row[2:] for row in output_table]
+
+        widths = [max(len(row[column]) for row in output_table) for column in range(len(output_table[0]))]
+        output = [
+            " ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+            for row in output_table
+        ]
+        output.append("{} instances in {} groups".format(sum(groups.values()), len(groups)))
+        for chunk in self._get_chunks(output, 65):
+            self.say("/code {}".format("\n".join(chunk)), message)
+
+    def _show_drift(self, message, env, dep):
+        """
+        Show the plays of an environment-deployment whose running, in-service instances don't all have the
+        same AMI - with the versions which differ between the AMIs.
+        """
+        self.say("Reticulating splines...", message)
+        reservations = self._get_instances(dep, {
+            "tag:environment": env,
+            "tag:deployment": dep,
+        })
+        instance_elbs = self._elbs_by_instance(self._get_load_balancers(dep))
+
+        # Count of in-service instances running each AMI, by play.
+        play_amis = defaultdict(Counter)
+        for reservation in reservations:
+            for instance in reservation.instances:
+                if instance.state == 'running' and instance.id in instance_elbs:
+                    play_amis[instance.tags.get("play", "")][instance.image_id] += 1
+        if not play_amis:
+            self.say('No instances in service found. The input may be misspelled.', message, color='red')
+            return
+
+        drifted = {play: ami_counts for play, ami_counts in play_amis.items() if len(ami_counts) > 1}
+        if not drifted:
+            self.say("All {} plays in {}-{} have a single AMI in service.".format(len(play_amis), env, dep), message)
+            return
+
+        amis = self._resolve_amis(set(ami_id for ami_counts in drifted.values() for ami_id in ami_counts))
+        output = ["{} of {} plays in {}-{} have more than one AMI in service:".format(
+            len(drifted), len(play_amis), env, dep
+        )]
+        for play in sorted(drifted):
+            ami_refs = {
+                ami_id: set(self._ami_versions(amis[ami_id]).refs()) if ami_id in amis else set()
+                for ami_id in drifted[play]
+            }
+            # Only show the versions which differ.
+            common_refs = set.intersection(*ami_refs.values())
+            output.append(play)
+            for ami_id, count in drifted[play].most_common():
+                output.append("  {} {:>4} instances  {}".format(
+                    ami_id, count,
+                    " ".join(sorted(ami_refs[ami_id] - common_refs)) if ami_id in amis else "(AMI not found)"
+                ))
+        for chunk in self._get_chunks(output, 65):
+            self.say("/code {}".format("\n".join(chunk)), message)
+
     def _get_chunks(self, data, size):
         """
         Yields sized chunks for the data
@@ -472,50 +910,39 @@ class ShowPlugin(WillPlugin):
         for items in range(0, len(data), size):
             yield data[items:items + size]
 
+    @spanned
     def _get_ami_versions(self, ami_id, message=None):
         """
         Given an AMI, return the associated repo versions.
         """
-        versions_dict = {}
         ami = self._get_ami(ami_id, message=message)
         if not ami:
             return None
-        configuration_ref = None
-        configuration_secure_ref = None
-        repos = {}
-        # Build the versions_dict to have all versions defined in the ami tags
-        for tag, value in ami.tags.items():
-            if tag.startswith('version:'):
-                key = tag[8:].strip()
-                repo, shorthash = value.split()
-                repos[key] = {
-                    'url': repo,
-                    'shorthash': shorthash
-                }
+        # Callers may override versions, so give them their own copy.
+        return self._ami_versions(ami).copy()
 
-                if key == 'configuration':
-                    configuration_ref = shorthash
-                elif key == 'configuration_secure':
-                    configuration_secure_ref = shorthash
-                else:
-                    key = "{}_version".format(key)
-                    # This is to deal with the fact that some
-                    # versions are upper case and some are lower case.
-                    versions_dict[key.lower()] = shorthash
-                    versions_dict[key.upper()] = shorthash
-
-        return Versions(
-            configuration_ref,
-            configuration_secure_ref,
-            versions_dict,
-            repos,
-        )
+    def _ami_versions(self, ami):
+        """
+        Returns the versions an AMI was built with, parsing its tags only the first time the AMI is seen.
+        The versions returned are shared, so mustn't be changed.
+        """
+        with self.ami_versions_lock:
+            versions = self.ami_versions.pop(ami.id, None)
+            if versions is not None:
+                self.ami_versions[ami.id] = versions
+                return versions
+        versions = Versions.from_tags(ami.tags)
+        with self.ami_versions_lock:
+            self.ami_versions[ami.id] = versions
+            while len(self.ami_versions) > self.AMI_VERSIONS_CACHE_SIZE:
+                self.ami_versions.popitem(last=False)
+        return versions
 
     def _diff_url_from(self, first_data, second_data):
         """
         Diff repo URLs.
         """
-        if first_data['url'] != second_data['url']:
+        if web_url(first_data['url']) != web_url(second_data['url']):
             msg = "clusters use different repos for this: {} vs {}".format(
                 self._hash_url_from(first_data),
                 self._hash_url_from(second_data))
@@ -533,6 +960,22 @@ class ShowPlugin(WillPlugin):
 
         return url
 
+    def _commit_summary(self, first_data, second_data):
+        """
+        Returns lines summarizing the commits from one version of a repo to another, read from its mirror.
+        """
+        if web_url(first_data['url']) != web_url(second_data['url']) or \
+           first_data['shorthash'] == second_data['shorthash']:
+            return []
+        commit_range = self.git_mirrors.commits(first_data['url'], first_data['shorthash'], second_data['shorthash'])
+        if commit_range is None:
+            return ["    (commits not found in the mirror of {})".format(first_data['url'])]
+        lines = ["    {} commit(s) added, {} removed".format(commit_range.added, commit_range.removed)]
+        lines += ["      {}".format(subject) for subject in commit_range.subjects]
+        if commit_range.added > len(commit_range.subjects):
+            lines.append("      ... and {} more".format(commit_range.added - len(commit_range.subjects)))
+        return lines
+
     def _hash_url_from(self, repo_data):
         """
         Get the hash url from a repo.
@@ -547,13 +990,7 @@ class ShowPlugin(WillPlugin):
         """
         Get the web url from a repo.
         """
-        url = repo_data['url']
-        # for both git and http links remove .git
-        # so that /compare links work
-        url = url.replace('.git', '')
-        if url.startswith('git@'):
-            url = url.replace(':', '/').replace('git@', 'http://')
-        return url
+        return web_url(repo_data['url'])
 
     def _update_from_versions_string(self, defaults, versions, message):
         """Update with any version overrides defined in the versions_string."""
@@ -566,15 +1003,18 @@ class ShowPlugin(WillPlugin):
                 elif var == 'configuration_secure':
                     defaults.configuration_secure = value
                 else:
-                    defaults.play_versions[var.lower()] = value
-                    defaults.play_versions[var.upper()] = value
+                    defaults.set_version(var, value)
         return defaults
 
+    @spanned
     def _notify_abbey(self, message, env, dep, play, versions,
                       noop=False, ami_id=None, verbose=False):
         """
         Interface with Abbey, where AMIs are built.
         """
+        import jenkins
+        import yaml
+
         if not (
                 hasattr(settings, 'JENKINS_URL') or
                 hasattr(settings, 'JENKINS_API_KEY') or
@@ -600,9 +1040,8 @@ class ShowPlugin(WillPlugin):
             params['callback_url'] = settings.NOTIFY_CALLBACK_URL  # pylint: disable=no-member
 
             channel = self.get_room_from_message(message)['name']
-            notification_list = {}
-            notification_list[channel] = [message.sender.nick]
-            self.save('notify_{}'.format(params['jobid']), notification_list, expire=259200)
+            self.bootstrap_storage()
+            BuildSubscriptions(self.storage.redis).create(params['jobid'], channel, [message.sender.nick])
 
             if ami_id:
                 params['base_ami'] = ami_id
@@ -624,26 +1063,45 @@ class ShowPlugin(WillPlugin):
 
             if noop:
                 self.say("would have requested: {}".format(params), message)
+                token = BuildPlans(self.storage.redis).create(message.sender.nick, {
+                    'env': env,
+                    'dep': dep,
+                    'play': play,
+                    'versions': versions.to_dict(),
+                    'ami_id': ami_id,
+                    'verbose': verbose,
+                })
+                self.say(
+                    "To build this AMI, say \"cut ami confirm {}\" within {} minutes.".format(
+                        token, PLAN_EXPIRE_SECONDS // 60
+                    ), message
+                )
             else:
                 j = jenkins.Jenkins(
                     settings.JENKINS_URL, settings.JENKINS_API_USER, settings.JENKINS_API_KEY  # pylint: disable=no-member
                 )
-                jenkins_job_id = j.get_job_info('build-ami')['nextBuildNumber']
+                with backend_call('jenkins', 'get_job_info'):
+                    jenkins_job_id = j.get_job_info('build-ami')['nextBuildNumber']
                 self.say(
                     "starting job 'build-ami' Job number {}, build token {}".format(
                         jenkins_job_id, params['jobid']
                     ), message
                 )
                 try:
-                    j.build_job('build-ami', parameters=params)
+                    with backend_call('jenkins', 'build_job'):
+                        j.build_job('build-ami', parameters=params)
                 except urllib2.HTTPError as exc:
                     self.say("Sent request got {}: {}".format(exc.code, exc.reason),
                              message, color='red')
 
-    def _diff_amis(self, first_ami, second_ami, message):
+    def _diff_amis(self, first_ami, second_ami, message, commits=False):
         """
-        Diff two AMIs to see repo differences.
+        Diff two AMIs to see repo differences, summarizing the commits between them if commits is True.
         """
+        if commits and self.git_mirrors is None:
+            self._say_error("GIT_MIRROR_DIR isn't set, so I can't summarize commits.", message=message)
+            commits = False
+
         first_ami_versions = self._get_ami_versions(first_ami, message=message)
         second_ami_versions = self._get_ami_versions(second_ami,
                                                      message=message)
@@ -674,7 +1132,10 @@ class ShowPlugin(WillPlugin):
 
         msgs = []
         for repo_name, url in diff_urls.items():
-            msgs.append("{}: {}".format(repo_name, url))
+            msg = "{}: {}".format(repo_name, url)
+            if commits:
+                msg = "\n".join([msg] + self._commit_summary(first_versions[repo_name], second_versions[repo_name]))
+            msgs.append(msg)
 
         for repo_name, url in repos_added.items():
             msgs.append("Added {}: {}".format(repo_name, url))
@@ -685,21 +1146,17 @@ class ShowPlugin(WillPlugin):
         for line in msgs:
             self.say(line, message)
 
+    @spanned
     def _get_ami(self, ami_id, message=None):
         """
         Looks for the given ami id accross all accounts
         Returns the AMI found
         """
+        ami = self.ami_cache.get(ami_id)
+        if ami is not None:
+            return ami
         logging.info("looking up ami: {}".format(ami_id))
-        found_amis = []
-        for profile in self.aws_profiles:
-            ec2 = boto.connect_ec2(profile_name=profile)
-            try:
-                images = ec2.get_all_images(ami_id)
-            except EC2ResponseError:
-                # failures expected for other accounts
-                images = []
-            found_amis.extend(images)
+        found_amis = self.aws_lookups.call(('images', ami_id), self._find_images, ami_id)
         if len(found_amis) != 1:
             msg = ("Error: {num_amis} AMI(s) returned for {ami_id}, "
                    "for aws profiles {profiles}")
@@ -708,8 +1165,44 @@ class ShowPlugin(WillPlugin):
                 ami_id=ami_id,
                 profiles='/'.join(self.aws_profiles)), message=message)
             return None
+        self.ami_cache.put(found_amis[0])
         return found_amis[0]
 
+    def _find_images(self, ami_id):
+        """
+        Returns the images with the given ami id in all accounts.
+        """
+        from boto.exception import EC2ResponseError
+
+        found_amis = []
+        for profile in self.aws_profiles:
+            ec2 = self._aws_connection('ec2', profile)
+            try:
+                with backend_call('ec2', 'get_all_images'):
+                    images = AWS_RATE_LIMITER.call(profile, 'get_all_images', ec2.get_all_images, ami_id)
+            except EC2ResponseError:
+                # failures expected for other accounts
+                images = []
+            found_amis.extend(images)
+        return found_amis
+
+    def _find_images_batch(self, ami_ids):
+        """
+        Returns the images with the given ami ids in all accounts, as lists by ami id - looking them all up with
+        one request per account, rather than one per account and AMI.
+        """
+        found_amis = defaultdict(list)
+        for profile in self.aws_profiles:
+            ec2 = self._aws_connection('ec2', profile)
+            for start in range(0, len(ami_ids), self.IMAGE_FILTER_BATCH_SIZE):
+                # Filtering by id, unlike asking for ids, doesn't fail for AMIs in other accounts.
+                image_filter = {'image-id': list(ami_ids[start:start + self.IMAGE_FILTER_BATCH_SIZE])}
+                with backend_call('ec2', 'get_all_images'):
+                    images = AWS_RATE_LIMITER.call(profile, 'get_all_images', ec2.get_all_images, filters=image_filter)
+                for image in images:
+                    found_amis[image.id].append(image)
+        return found_amis
+
     def _say_error(self, msg, message=None):
         """
         Reports an error
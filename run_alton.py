@@ -2,8 +2,69 @@
 """
 Run script for Alton.
 """
+import imp
+
+from clint.textui import indent, puts
+from will import settings
 from will.main import WillBot
 
+from alton.metrics import METRICS, timed_command
+from alton.startup_report import PluginStartupTimer
+from alton.warm_up import start_warm_up
+
+
+class AltonBot(WillBot):
+    """
+    WillBot which reports how long its plugins take to load, can warm them up once the chat client has started,
+    and records metrics of the commands and web requests they handle.
+    """
+    # The plugin instances handling chat commands.
+    plugin_instances = []
+
+    def bootstrap_plugins(self):
+        timer = PluginStartupTimer()
+        load_source = imp.load_source
+        imp.load_source = timer.timed_load_source(load_source)
+        try:
+            super(AltonBot, self).bootstrap_plugins()
+        finally:
+            imp.load_source = load_source
+            timer.restore()
+        puts("Plugin startup time:")
+        with indent(2):
+            for line in timer.report():
+                puts(line)
+        self._time_handlers()
+
+    def _time_handlers(self):
+        """
+        Record the calls, errors and latency of every chat command and web route, and share them through Redis.
+        """
+        # Keep the plugin instances, as the timed handlers are no longer bound methods of them.
+        plugins = {id(listener['fn'].__self__): listener['fn'].__self__ for listener in self.message_listeners}
+        self.plugin_instances = list(plugins.values())
+        for listener in self.message_listeners:
+            listener['fn'] = timed_command(listener['fn'])
+        # Will creates the web route instances in the web server's process, so time the route methods of the class.
+        for cls, function_name in set(self.bottle_routes):
+            setattr(cls, function_name, timed_command(getattr(cls, function_name)))
+
+        def redis_client():
+            """
+            Returns the Redis client of the bot's storage.
+            """
+            self.bootstrap_storage()
+            return self.storage.redis
+        METRICS.set_redis_factory(redis_client)
+
+    def bootstrap_xmpp(self):
+        # Will runs the chat client in a process of its own, so warm up the plugin instances living in it.
+        # The warm-up runs in the background, so it doesn't delay the bot coming online.
+        if str(getattr(settings, 'STARTUP_WARM_UP', '')).lower() in ('1', 'true', 'yes'):
+            start_warm_up(self.plugin_instances)
+        super(AltonBot, self).bootstrap_xmpp()
+
+
 if __name__ == '__main__':
-    BOT = WillBot()
+    BOT = AltonBot()
     BOT.bootstrap()
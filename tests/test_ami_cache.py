@@ -0,0 +1,54 @@
+"""
+Tests for the on-disk cache of AMIs.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from alton.ami_cache import AmiCache, CachedAmi
+
+
+class TestAmiCache(unittest.TestCase):
+    """
+    Test caching AMIs in SQLite.
+    """
+    def setUp(self):
+        super(TestAmiCache, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'amis.sqlite')
+        self.cache = AmiCache(self.path)
+
+    def test_get(self):
+        self.assertIsNone(self.cache.get('ami-11111111'))
+        self.cache.put(mock.Mock(id='ami-11111111', tags={'play': 'edxapp'}))
+        self.assertEqual(self.cache.get('ami-11111111'), CachedAmi('ami-11111111', {'play': 'edxapp'}))
+
+    def test_get_many(self):
+        self.cache.put_many([mock.Mock(id='ami-{}'.format(index), tags={'index': str(index)}) for index in range(1200)])
+        amis = self.cache.get_many(['ami-{}'.format(index) for index in range(0, 1400, 2)])
+        self.assertEqual(sorted(amis), sorted('ami-{}'.format(index) for index in range(0, 1200, 2)))
+        self.assertEqual(amis['ami-42'].tags, {'index': '42'})
+
+    def test_kept_across_restarts(self):
+        self.cache.put(mock.Mock(id='ami-11111111', tags={'play': 'edxapp'}))
+        self.assertEqual(AmiCache(self.path).get('ami-11111111').tags, {'play': 'edxapp'})
+
+    def test_evicts_least_recently_used(self):
+        self.cache.MAX_ENTRIES = 2
+        with mock.patch('alton.ami_cache.time.time', side_effect=range(100)):
+            self.cache.put(mock.Mock(id='ami-1', tags={}))
+            self.cache.put(mock.Mock(id='ami-2', tags={}))
+            self.cache.get('ami-1')
+            self.cache.put(mock.Mock(id='ami-3', tags={}))
+        self.assertEqual(sorted(self.cache.get_many(['ami-1', 'ami-2', 'ami-3'])), ['ami-1', 'ami-3'])
+
+    def test_reconnects_after_fork(self):
+        self.cache.put(mock.Mock(id='ami-11111111', tags={}))
+        first_connection = self.cache.db_conn
+        with mock.patch('alton.ami_cache.os.getpid', return_value=-1):
+            self.assertIsNotNone(self.cache.get('ami-11111111'))
+        self.assertIsNot(self.cache.db_conn, first_connection)
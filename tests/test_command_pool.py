@@ -0,0 +1,158 @@
+"""
+Tests for the pool which runs long chat commands.
+"""
+import threading
+import unittest
+
+import mock
+
+from alton import command_pool as command_pool_module
+from alton.command_pool import CommandCancelled, CommandPool, TooManyCommands, pooled
+
+
+class TestCommandPool(unittest.TestCase):
+    """
+    Test admission, ordering and cancellation of pooled commands.
+    """
+    def setUp(self):
+        super(TestCommandPool, self).setUp()
+        self.pool = CommandPool(max_running=1, max_per_user=2)
+        self.threads = []
+
+    def tearDown(self):
+        for thread in self.threads:
+            thread.join(5)
+        super(TestCommandPool, self).tearDown()
+
+    def _start(self, user, description, func, results):
+        """
+        Run a command in the pool from a new thread, recording its result or exception in results.
+        """
+        queued = threading.Event()
+
+        def run():
+            """
+            Run the command.
+            """
+            try:
+                results[description] = self.pool.run(user, description, func, on_queued=lambda *args: queued.set())
+            except Exception as exc:  # pylint: disable=broad-except
+                results[description] = exc
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.threads.append(thread)
+        return queued
+
+    def _blocking_command(self):
+        """
+        Returns a command which runs until released, and events for its start and release.
+        """
+        started, release = threading.Event(), threading.Event()
+
+        def command():
+            """
+            Wait to be released, checking for cancellation.
+            """
+            started.set()
+            while not release.wait(0.01):
+                self.pool.check_cancelled()
+            return 'done'
+        return command, started, release
+
+    def test_run(self):
+        self.assertEqual(self.pool.run('jdoe', 'show', lambda: 'shown'), 'shown')
+        self.assertEqual(self.pool.commands(), [])
+
+    def test_commands_wait_for_a_slot(self):
+        results = {}
+        command, started, release = self._blocking_command()
+        self._start('jdoe', 'first', command, results)
+        self.assertTrue(started.wait(5))
+        queued = self._start('asmith', 'second', lambda: 'done', results)
+        self.assertTrue(queued.wait(5))
+
+        commands = self.pool.commands()
+        self.assertEqual(
+            [(cmd.description, cmd.state) for cmd in commands], [('first', 'running'), ('second', 'queued')]
+        )
+        self.assertEqual(self.pool.queue_depth(), 1)
+
+        release.set()
+        self.tearDown()
+        self.assertEqual(results, {'first': 'done', 'second': 'done'})
+        self.assertEqual(self.pool.commands(), [])
+
+    def test_per_user_limit(self):
+        results = {}
+        command, started, release = self._blocking_command()
+        self._start('jdoe', 'first', command, results)
+        self.assertTrue(started.wait(5))
+        self.assertTrue(self._start('jdoe', 'second', lambda: 'done', results).wait(5))
+        with self.assertRaises(TooManyCommands):
+            self.pool.run('jdoe', 'third', lambda: 'done')
+        release.set()
+
+    def test_cancel_queued(self):
+        results = {}
+        command, started, release = self._blocking_command()
+        self._start('jdoe', 'first', command, results)
+        self.assertTrue(started.wait(5))
+        self.assertTrue(self._start('asmith', 'second', lambda: 'done', results).wait(5))
+        second_id = self.pool.commands()[1].command_id
+
+        self.assertIsNone(self.pool.cancel(second_id, user='jdoe'))
+        self.assertEqual(self.pool.cancel(second_id, user='asmith').state, 'queued')
+        self.threads[1].join(5)
+        self.assertIsInstance(results['second'], CommandCancelled)
+        release.set()
+
+    def test_cancel_running(self):
+        results = {}
+        command, started, __ = self._blocking_command()
+        self._start('jdoe', 'first', command, results)
+        self.assertTrue(started.wait(5))
+        self.pool.cancel(self.pool.commands()[0].command_id)
+        self.threads[0].join(5)
+        self.assertIsInstance(results['first'], CommandCancelled)
+        self.assertEqual(self.pool.commands(), [])
+
+
+class TestPooled(unittest.TestCase):
+    """
+    Test the decorator which runs plugin commands in the pool.
+    """
+    def setUp(self):
+        super(TestPooled, self).setUp()
+        patcher = mock.patch.object(command_pool_module, 'COMMAND_POOL', CommandPool(max_running=1, max_per_user=1))
+        self.addCleanup(patcher.stop)
+        self.pool = patcher.start()
+        self.plugin = mock.Mock()
+        self.message = mock.MagicMock()
+        self.message.sender.nick = 'jdoe'
+
+    def test_runs_command(self):
+        def command(plugin, message, env):
+            """
+            Return the arguments.
+            """
+            return plugin, message, env
+        self.assertEqual(pooled(command)(self.plugin, self.message, env='prod'), (self.plugin, self.message, 'prod'))
+
+    def test_cancelled(self):
+        def command(plugin, message):  # pylint: disable=unused-argument
+            """
+            Cancel itself.
+            """
+            self.pool.cancel(self.pool.current_command().command_id)
+            self.pool.check_cancelled()
+        pooled(command)(self.plugin, self.message)
+        self.plugin.reply.assert_called_once_with(self.message, "Cancelled job 1.", color='yellow')
+
+    def test_too_many_commands(self):
+        def command(plugin, message):
+            """
+            Run another command while this one is in flight.
+            """
+            pooled(lambda plugin, message: None)(plugin, message)
+        pooled(command)(self.plugin, self.message)
+        self.assertIn('You already have 1 commands running or queued: job(s) 1.', self.plugin.reply.call_args[0][1])
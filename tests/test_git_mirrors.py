@@ -0,0 +1,89 @@
+"""
+Tests for summarizing commits from local git mirrors.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import mock
+
+from alton.git_mirrors import GitMirrors
+
+
+class TestGitMirrors(unittest.TestCase):
+    """
+    Test reading commit ranges from mirrors of a repo served from a local directory.
+    """
+    def setUp(self):
+        super(TestGitMirrors, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.origin = os.path.join(self.tmp_dir, 'origin.git')
+        self.work_dir = os.path.join(self.tmp_dir, 'work')
+        self._git('init', '--quiet', '--bare', self.origin)
+        self._git('clone', '--quiet', self.origin, self.work_dir)
+        self.remote = 'file://' + self.origin
+        self.mirrors = GitMirrors(os.path.join(self.tmp_dir, 'mirrors'))
+
+    def _git(self, *args):
+        """
+        Run git, returning its output.
+        """
+        return subprocess.check_output(
+            ('git', '-c', 'user.name=Test', '-c', 'user.email=test@example.com') + args, stderr=subprocess.STDOUT
+        ).strip()
+
+    def _commit(self, subject):
+        """
+        Commit to the repo and push it, returning the commit's short hash.
+        """
+        self._git('-C', self.work_dir, 'commit', '--quiet', '--allow-empty', '-m', subject)
+        self._git('-C', self.work_dir, 'push', '--quiet', 'origin', 'HEAD:master')
+        return self._git('-C', self.work_dir, 'rev-parse', '--short', 'HEAD')
+
+    def test_commits(self):
+        first = self._commit('First')
+        second = self._commit('Second')
+        third = self._commit('Third')
+
+        commit_range = self.mirrors.commits(self.remote, first, third)
+        self.assertEqual(commit_range.added, 2)
+        self.assertEqual(commit_range.removed, 0)
+        self.assertEqual(commit_range.subjects, [u'{} Third'.format(third), u'{} Second'.format(second)])
+        self.assertTrue(os.path.isdir(self.mirrors.mirror_path(self.remote)))
+
+        rolled_back = self.mirrors.commits(self.remote, third, first)
+        self.assertEqual((rolled_back.added, rolled_back.removed, rolled_back.subjects), (0, 2, []))
+
+    def test_fetches_missing_commits(self):
+        first = self._commit('First')
+        second = self._commit('Second')
+        self.mirrors.commits(self.remote, first, second)
+        third = self._commit('Third')
+
+        commit_range = self.mirrors.commits(self.remote, second, third)
+        self.assertEqual(commit_range.subjects, [u'{} Third'.format(third)])
+
+    def test_refresh(self):
+        first = self._commit('First')
+        self.mirrors.commits(self.remote, first, first)
+        second = self._commit('Second')
+        self.mirrors.refresh()
+        with mock.patch.object(self.mirrors, 'fetch') as fetch:
+            self.assertEqual(self.mirrors.commits(self.remote, first, second).added, 1)
+        self.assertFalse(fetch.called)
+
+    def test_cached(self):
+        first = self._commit('First')
+        second = self._commit('Second')
+        commit_range = self.mirrors.commits(self.remote, first, second)
+        with mock.patch('subprocess.check_output') as check_output:
+            self.assertEqual(self.mirrors.commits(self.remote, first, second), commit_range)
+        self.assertFalse(check_output.called)
+
+    def test_unknown_commits(self):
+        first = self._commit('First')
+        self.assertIsNone(self.mirrors.commits(self.remote, first, 'deadbeef'))
+        self.assertIsNone(self.mirrors.commits(self.remote, first, '--upload-pack=touch'))
@@ -0,0 +1,258 @@
+"""
+Tests for the inventory of instances and ELBs kept by change notifications.
+"""
+import json
+import unittest
+
+import fakeredis
+import mock
+import bottle
+
+from alton.inventory import Inventory, InventoryInstance, InventoryInstanceRef, InventoryReservation
+from alton.inventory_replay import as_sns_notification, read_events, replay
+from plugins import show
+from plugins.show import ShowPlugin
+
+
+def _instance(instance_id, play, state='running'):
+    """
+    Returns a mock boto Instance.
+    """
+    return mock.Mock(
+        id=instance_id, image_id='ami-11111111', state=state, private_dns_name='{}.ec2.internal'.format(instance_id),
+        tags={'environment': 'prod', 'deployment': 'edx', 'play': play},
+    )
+
+
+def _elb(name, instances):
+    """
+    Returns a mock boto LoadBalancer.
+    """
+    elb = mock.Mock(instances=instances)
+    elb.name = name
+    return elb
+
+
+def _state_change(instance_id, state):
+    """
+    Returns a CloudWatch EC2 instance state-change event.
+    """
+    return {
+        'detail-type': 'EC2 Instance State-change Notification',
+        'source': 'aws.ec2',
+        'detail': {'instance-id': instance_id, 'state': state},
+    }
+
+
+def _launch_successful(instance_id):
+    """
+    Returns a CloudWatch Auto Scaling instance launch event.
+    """
+    return {
+        'detail-type': 'EC2 Instance Launch Successful',
+        'source': 'aws.autoscaling',
+        'detail': {'EC2InstanceId': instance_id},
+    }
+
+
+def _elb_call(event_name, elb_name, instance_ids, error_code=None):
+    """
+    Returns a CloudWatch event of an ELB API call, recorded by CloudTrail.
+    """
+    detail = {
+        'eventSource': 'elasticloadbalancing.amazonaws.com',
+        'eventName': event_name,
+        'requestParameters': {
+            'loadBalancerName': elb_name,
+            'instances': [{'instanceId': instance_id} for instance_id in instance_ids],
+        },
+    }
+    if error_code:
+        detail['errorCode'] = error_code
+    return {'detail-type': 'AWS API Call via CloudTrail', 'source': 'aws.elasticloadbalancing', 'detail': detail}
+
+
+class TestInventory(unittest.TestCase):
+    """
+    Test keeping the view of an account up to date.
+    """
+    def setUp(self):
+        super(TestInventory, self).setUp()
+        self.redis = fakeredis.FakeStrictRedis()
+        self.redis.flushall()
+        self.inventory = Inventory(self.redis)
+        self.instances = [_instance('i-1', 'edxapp'), _instance('i-2', 'edxapp'), _instance('i-3', 'worker')]
+        self.inventory.replace(
+            'edx', [mock.Mock(instances=self.instances[:2]), mock.Mock(instances=self.instances[2:])],
+            [_elb('edxapp', self.instances[:2]), _elb('worker', [])]
+        )
+
+    def _instance_ids(self, filters):
+        """
+        Returns the ids of the instances in the view matching filters.
+        """
+        return [instance.id for reservation in self.inventory.reservations('edx', filters) for instance in
+                reservation.instances]
+
+    def _elb_instance_ids(self):
+        """
+        Returns the ids of the instances in each ELB in the view.
+        """
+        return {elb.name: [instance.id for instance in elb.instances] for elb in self.inventory.load_balancers('edx')}
+
+    def test_listing(self):
+        self.assertEqual(self.inventory.reservations('edx', {'tag:play': 'worker'}), [InventoryReservation([
+            InventoryInstance('i-3', 'ami-11111111', 'running', self.instances[2].tags, 'i-3.ec2.internal')
+        ])])
+        self.assertEqual(self._instance_ids({'tag:environment': 'prod', 'tag:play': 'edxapp'}), ['i-1', 'i-2'])
+        self.assertEqual(self.inventory.reservations('edx', {'tag:play': 'forum'}), [])
+        self.assertEqual(self.inventory.load_balancers('edx')[0].instances, [
+            InventoryInstanceRef('i-1'), InventoryInstanceRef('i-2')
+        ])
+        self.assertEqual(self._elb_instance_ids(), {'edxapp': ['i-1', 'i-2'], 'worker': []})
+
+    def test_unusable(self):
+        self.assertIsNone(self.inventory.reservations('edx', {'image-id': 'ami-11111111'}))
+        self.assertIsNone(self.inventory.reservations('edge', {}))
+        self.assertIsNone(self.inventory.load_balancers('edge'))
+        self.inventory.invalidate('edx')
+        self.assertIsNone(self.inventory.reservations('edx', {}))
+        self.assertIsNone(self.inventory.load_balancers('edx'))
+
+    def test_state_change(self):
+        self.assertEqual(self.inventory.apply('edx', _state_change('i-1', 'stopping')), ('updated', []))
+        self.assertEqual(self._instance_ids({'instance-state-name': 'running'}), ['i-2', 'i-3'])
+        self.assertEqual(self._elb_instance_ids()['edxapp'], ['i-1', 'i-2'])
+
+    def test_terminated_leaves_elbs(self):
+        self.inventory.apply('edx', as_sns_notification(_state_change('i-1', 'terminated')))
+        self.assertEqual(self._instance_ids({'instance-state-name': 'terminated'}), ['i-1'])
+        self.assertEqual(self._elb_instance_ids()['edxapp'], ['i-2'])
+
+    def test_launch(self):
+        self.assertEqual(self.inventory.apply('edx', _state_change('i-4', 'pending')), ('updated', ['i-4']))
+        self.assertEqual(self.inventory.apply('edx', _launch_successful('i-5')), ('updated', ['i-5']))
+        self.assertEqual(self.inventory.apply('edx', _launch_successful('i-1')), ('ignored', []))
+        self.assertEqual(self.inventory.apply('edx', _state_change('i-6', 'terminated')), ('ignored', []))
+        self.inventory.add_instances('edx', [_instance('i-4', 'worker', state='pending')])
+        self.assertEqual(self._instance_ids({'tag:play': 'worker'}), ['i-3', 'i-4'])
+
+    def test_out_of_order_states(self):
+        self.inventory.apply('edx', _state_change('i-1', 'stopped'))
+        self.assertEqual(self.inventory.apply('edx', _state_change('i-1', 'stopping')), ('ignored', []))
+        self.assertEqual(self.inventory.apply('edx', _state_change('i-1', 'pending')), ('updated', []))
+        self.inventory.apply('edx', _state_change('i-2', 'terminated'))
+        for state in ('running', 'shutting-down', 'pending'):
+            self.assertEqual(self.inventory.apply('edx', _state_change('i-2', state)), ('ignored', []))
+        self.assertEqual(self._instance_ids({'instance-state-name': 'pending'}), ['i-1'])
+        self.assertEqual(self._instance_ids({'instance-state-name': 'terminated'}), ['i-2'])
+
+    def test_elb_calls(self):
+        self.inventory.apply('edx', _elb_call('RegisterInstancesWithLoadBalancer', 'worker', ['i-3']))
+        self.inventory.apply('edx', _elb_call('DeregisterInstancesWithLoadBalancer', 'edxapp', ['i-1']))
+        self.inventory.apply('edx', _elb_call('CreateLoadBalancer', 'forum', []))
+        self.assertEqual(
+            self.inventory.apply('edx', _elb_call('RegisterInstancesWithLoadBalancer', 'edxapp', ['i-3'], 'Throttled')),
+            ('ignored', [])
+        )
+        self.assertEqual(self._elb_instance_ids(), {'edxapp': ['i-2'], 'worker': ['i-3'], 'forum': []})
+        self.inventory.apply('edx', _elb_call('DeleteLoadBalancer', 'edxapp', []))
+        self.assertEqual(self._elb_instance_ids(), {'worker': ['i-3'], 'forum': []})
+
+    def test_other_events(self):
+        self.assertEqual(self.inventory.apply('edx', {'detail-type': 'Scheduled Event'}), ('ignored', []))
+        self.assertEqual(
+            self.inventory.apply('edx', {'Type': 'SubscriptionConfirmation', 'SubscribeURL': 'https://sns'}),
+            ('subscribe', [])
+        )
+
+
+class TestInventoryWebhook(unittest.TestCase):
+    """
+    Test replaying change notifications to the show plugin's inventory webhook.
+    """
+    def setUp(self):
+        super(TestInventoryWebhook, self).setUp()
+        redis = fakeredis.FakeStrictRedis()
+        redis.flushall()
+        with mock.patch.object(ShowPlugin, '__init__', return_value=None):
+            self.show_plugin = ShowPlugin()
+        self.show_plugin.aws_profiles = ['edx']
+        self.show_plugin.inventory_enabled = True
+        self.show_plugin.storage = mock.Mock(redis=redis)
+        self.instances = [_instance('i-1', 'edxapp'), _instance('i-2', 'edxapp'), _instance('i-3', 'edxapp')]
+        self.list_instances = mock.Mock(side_effect=lambda profile, filters, instance_ids=None: [
+            mock.Mock(instances=[
+                instance for instance in self.instances if instance_ids is None or instance.id in instance_ids
+            ])
+        ])
+        self.request = mock.Mock()
+        for patcher in (
+                mock.patch.object(self.show_plugin, '_list_instances', self.list_instances),
+                mock.patch.object(self.show_plugin, '_list_load_balancers', side_effect=AssertionError),
+                mock.patch.object(show.settings, 'INVENTORY_WEBHOOK_TOKEN', 's3cret', create=True),
+                mock.patch.object(show.bottle, 'request', self.request),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        Inventory(redis).replace('edx', [mock.Mock(instances=self.instances[:2])], [_elb('edxapp', self.instances[:2])])
+
+    def _post(self, event, token='s3cret', profile_name='edx'):
+        """
+        Post an event to the webhook as SNS would, returning the response.
+        """
+        self.request.query = {'token': token}
+        self.request.body.read.return_value = json.dumps(event)
+        return self.show_plugin.inventory_event(profile_name)
+
+    def test_replay_deploy(self):
+        events = read_events([json.dumps(event) for event in (
+            _state_change('i-3', 'pending'),
+            _state_change('i-3', 'running'),
+            _elb_call('RegisterInstancesWithLoadBalancer', 'edxapp', ['i-3']),
+            _elb_call('DeregisterInstancesWithLoadBalancer', 'edxapp', ['i-1']),
+            _state_change('i-1', 'shutting-down'),
+            _state_change('i-1', 'terminated'),
+        )] + [''])
+        results = replay(events, self._post)
+        self.assertEqual([result['result'] for result in results], ['updated'] * 6)
+        self.assertEqual(self.list_instances.call_args_list, [mock.call('edx', {}, instance_ids=['i-3'])])
+
+        reservations = self.show_plugin._get_instances('edx', {  # pylint: disable=protected-access
+            'tag:play': 'edxapp', 'instance-state-name': 'running'
+        })
+        self.assertEqual([instance.id for instance in reservations[0].instances], ['i-2', 'i-3'])
+        elbs = self.show_plugin._get_load_balancers('edx')  # pylint: disable=protected-access
+        self.assertEqual([instance.id for instance in elbs[0].instances], ['i-2', 'i-3'])
+        self.assertEqual(self.list_instances.call_count, 1)
+
+    def test_replay_late_launch(self):
+        events = read_events([json.dumps(event) for event in (
+            _state_change('i-3', 'pending'),
+            _state_change('i-3', 'running'),
+            _launch_successful('i-3'),
+        )])
+        results = replay(events, self._post)
+        self.assertEqual([result['result'] for result in results], ['updated', 'updated', 'ignored'])
+        self.assertEqual(self.list_instances.call_count, 1)
+        reservations = self.show_plugin._get_instances('edx', {  # pylint: disable=protected-access
+            'instance-state-name': 'running'
+        })
+        self.assertEqual([instance.id for instance in reservations[0].instances], ['i-1', 'i-2', 'i-3'])
+
+    def test_rejected(self):
+        for kwargs, status in (
+                ({'token': 'guess'}, 403),
+                ({'profile_name': 'edge'}, 404),
+        ):
+            with self.assertRaises(bottle.HTTPError) as context:
+                self._post(_state_change('i-1', 'stopped'), **kwargs)
+            self.assertEqual(context.exception.status_code, status)
+        with self.assertRaises(bottle.HTTPError) as context:
+            self._post({'Type': 'Notification', 'Message': 'not JSON'})
+        self.assertEqual(context.exception.status_code, 400)
+
+    def test_stale_inventory_lists_instances(self):
+        Inventory(self.show_plugin.storage.redis).invalidate('edx')
+        self.show_plugin._get_instances('edx', {'tag:play': 'edxapp'})  # pylint: disable=protected-access
+        self.list_instances.assert_called_once_with('edx', {'tag:play': 'edxapp'})
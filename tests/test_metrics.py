@@ -0,0 +1,165 @@
+"""
+Tests for command and backend metrics.
+"""
+import unittest
+
+import fakeredis
+import mock
+import bottle
+
+from alton import metrics
+from alton.metrics import MetricsRegistry, timed_backend, timed_command
+from alton.tracing import Trace, TraceStore
+from plugins import metrics as metrics_plugin
+from plugins.metrics import MetricsPlugin
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    """
+    Test recording and rendering metrics.
+    """
+    def setUp(self):
+        super(TestMetricsRegistry, self).setUp()
+        self.metrics = MetricsRegistry()
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        patcher = mock.patch.object(metrics, 'METRICS', self.metrics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_counts_calls_and_errors(self):
+        self.metrics.observe_call('command', {'command': 'show'}, 0.2, False)
+        self.metrics.observe_call('command', {'command': 'show'}, 0.3, True)
+        values = self.metrics.values()
+        self.assertEqual(values['alton_command_calls_total{command="show"}'], 2)
+        self.assertEqual(values['alton_command_errors_total{command="show"}'], 1)
+        self.assertAlmostEqual(values['alton_command_duration_seconds_sum{command="show"}'], 0.5)
+        self.assertEqual(values['alton_command_duration_seconds_count{command="show"}'], 2)
+
+    def test_histogram_buckets_are_cumulative(self):
+        self.metrics.observe_call('backend', {'backend': 's3'}, 0.07, False)
+        self.metrics.observe_call('backend', {'backend': 's3'}, 400, False)
+        values = self.metrics.values()
+        bucket = 'alton_backend_duration_seconds_bucket{{backend="s3",le="{}"}}'
+        self.assertNotIn(bucket.format('0.05'), values)
+        self.assertEqual(values[bucket.format('0.1')], 1)
+        self.assertEqual(values[bucket.format('300')], 1)
+        self.assertEqual(values[bucket.format('+Inf')], 2)
+
+    def test_render(self):
+        self.metrics.observe_call('command', {'command': 'show'}, 1.5, False)
+        rendered = self.metrics.render().splitlines()
+        self.assertIn('# HELP alton_command_calls_total Chat commands and web requests handled.', rendered)
+        self.assertIn('# TYPE alton_command_calls_total counter', rendered)
+        self.assertIn('# TYPE alton_command_duration_seconds histogram', rendered)
+        self.assertIn('alton_command_calls_total{command="show"} 1', rendered)
+        self.assertIn('alton_command_duration_seconds_sum{command="show"} 1.5', rendered)
+        self.assertNotIn('# TYPE alton_backend_calls_total counter', rendered)
+
+    def test_render_buckets_in_order(self):
+        self.metrics.observe_call('command', {'command': 'show'}, 1.5, False)
+        bucket_bounds = [
+            line.split('le="')[1].split('"')[0] for line in self.metrics.render().splitlines()
+            if line.startswith('alton_command_duration_seconds_bucket')
+        ]
+        self.assertEqual(bucket_bounds, ['2.5', '5', '10', '30', '60', '120', '300', '+Inf'])
+
+    def test_escapes_label_values(self):
+        self.metrics.observe_call('command', {'command': 'say "hi"'}, 1, False)
+        self.assertIn('alton_command_calls_total{command="say \\"hi\\""}', self.metrics.values())
+
+    def test_flush_adds_to_shared_metrics(self):
+        self.metrics.set_redis_factory(lambda: self.redis)
+        other_process = MetricsRegistry()
+        other_process.set_redis_factory(lambda: self.redis)
+        with mock.patch.object(MetricsRegistry, '_start_flusher'):
+            self.metrics.observe_call('command', {'command': 'show'}, 1, False)
+            other_process.observe_call('command', {'command': 'show'}, 1, True)
+        other_process.flush()
+        values = self.metrics.values()
+        self.assertEqual(values['alton_command_calls_total{command="show"}'], 2)
+        self.assertEqual(values['alton_command_errors_total{command="show"}'], 1)
+        self.assertEqual(self.metrics.pending, {})
+
+    def test_render_nothing_recorded(self):
+        self.metrics.set_redis_factory(lambda: self.redis)
+        self.assertEqual(self.metrics.render(), '\n')
+
+    def test_failed_flush_keeps_values(self):
+        broken_redis = mock.MagicMock()
+        broken_redis.pipeline.return_value.execute.side_effect = IOError('Connection refused')
+        self.metrics.set_redis_factory(lambda: broken_redis)
+        with mock.patch.object(MetricsRegistry, '_start_flusher'):
+            self.metrics.observe_call('command', {'command': 'show'}, 1, False)
+        with self.assertRaises(IOError):
+            self.metrics.flush()
+        self.assertEqual(self.metrics.pending[('alton_command_calls_total', (('command', 'show'),))], 1)
+
+    def test_timed_command(self):
+        @timed_command
+        def show(message):
+            """
+            Fail on an unknown command.
+            """
+            if message == 'unknown':
+                raise ValueError(message)
+            return message
+
+        self.assertEqual(show('edx'), 'edx')
+        with self.assertRaises(ValueError):
+            show('unknown')
+        values = self.metrics.values()
+        self.assertEqual(values['alton_command_calls_total{command="show"}'], 2)
+        self.assertEqual(values['alton_command_errors_total{command="show"}'], 1)
+
+    def test_timed_backend(self):
+        @timed_backend('gocd', 'pause_pipeline')
+        def pause_pipeline(name):
+            """
+            Pause a pipeline.
+            """
+            return name
+
+        self.assertEqual(pause_pipeline('prod_edx'), 'prod_edx')
+        self.assertEqual(self.metrics.values()[
+            'alton_backend_calls_total{backend="gocd",operation="pause_pipeline"}'
+        ], 1)
+
+
+class TestTracesRoute(unittest.TestCase):
+    """
+    Test serving stored traces.
+    """
+    def setUp(self):
+        super(TestTracesRoute, self).setUp()
+        redis = fakeredis.FakeRedis()
+        redis.flushall()
+        trace = Trace('show', 'jdoe', 'show prod-edx-edxapp')
+        trace.finish()
+        TraceStore(redis).add(trace)
+        with mock.patch.object(MetricsPlugin, '__init__', return_value=None):
+            self.plugin = MetricsPlugin()
+        self.plugin.storage = mock.Mock(redis=redis)
+        self.request = mock.Mock()
+        for patcher in (
+                mock.patch.object(self.plugin, 'bootstrap_storage'),
+                mock.patch.object(metrics_plugin.settings, 'TRACES_TOKEN', 's3cret', create=True),
+                mock.patch.object(metrics_plugin.bottle, 'request', self.request),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_traces(self):
+        self.request.query = {'token': 's3cret'}
+        self.assertEqual([trace['command'] for trace in self.plugin.traces()['traces']], ['show'])
+
+    def test_rejected(self):
+        self.request.query = {'token': 'guess'}
+        with self.assertRaises(bottle.HTTPError) as context:
+            self.plugin.traces()
+        self.assertEqual(context.exception.status_code, 403)
+        # Traces aren't served at all without a token configured.
+        with mock.patch.object(metrics_plugin, 'settings', mock.Mock(spec=[])), \
+                self.assertRaises(bottle.HTTPError) as context:
+            self.plugin.traces()
+        self.assertEqual(context.exception.status_code, 404)
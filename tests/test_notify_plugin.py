@@ -0,0 +1,323 @@
+"""
+Tests for build notification subscriptions.
+"""
+import pickle
+import unittest
+
+import fakeredis
+import mock
+import bottle
+
+from alton.build_notifications import BuildSubscriptions, SUBSCRIPTION_EXPIRE_SECONDS
+from alton.notification_dispatcher import NotificationDispatcher
+from plugins.notify import NotifyPlugin
+
+
+class TestBuildSubscriptions(unittest.TestCase):
+    """
+    Test the Redis store of build subscriptions.
+    """
+    def setUp(self):
+        super(TestBuildSubscriptions, self).setUp()
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        self.subscriptions = BuildSubscriptions(self.redis)
+
+    def test_create(self):
+        self.subscriptions.create('1234', 'release pipeline', ['jdoe'])
+        self.assertEqual(self.subscriptions.subscriptions('1234'), {'release pipeline': ['jdoe']})
+        self.assertEqual(self.subscriptions.unknown_builds(['1234', '5678']), ['5678'])
+
+    def test_subscribe_keeps_existing_subscribers(self):
+        self.subscriptions.create('1234', 'release pipeline', ['jdoe'])
+        subscribed = self.subscriptions.subscribe(['1234'], 'release pipeline', ['asmith', 'jdoe'])
+        self.assertEqual(subscribed, {'1234': {'asmith', 'jdoe'}})
+        subscribed = self.subscriptions.subscribe(['1234'], 'ops', ['bjones'])
+        self.assertEqual(subscribed, {'1234': {'bjones'}})
+        self.assertEqual(
+            self.subscriptions.subscriptions('1234'),
+            {'release pipeline': ['asmith', 'jdoe'], 'ops': ['bjones']}
+        )
+
+    def test_migrates_legacy_subscriptions(self):
+        self.redis.set('notify_1234', pickle.dumps({'release pipeline': ['jdoe'], 'ops': ['bjones']}), ex=60)
+        self.assertEqual(self.subscriptions.unknown_builds(['1234', '5678']), ['5678'])
+        self.assertIsNone(self.redis.get('notify_1234'))
+        self.assertEqual(
+            self.subscriptions.subscriptions('1234'),
+            {'release pipeline': ['jdoe'], 'ops': ['bjones']}
+        )
+        self.assertEqual(self.subscriptions.user_subscriptions('jdoe'), {'1234': ['release pipeline']})
+        # Migrated subscriptions expire when the legacy ones would have.
+        for key in ('notify_rooms:1234', 'notify_users:1234:ops'):
+            self.assertLessEqual(self.redis.ttl(key), 60)
+
+    def test_subscribe_multiple_builds(self):
+        self.subscriptions.create('1234', 'release pipeline', ['jdoe'])
+        self.subscriptions.create('5678', 'release pipeline', ['asmith'])
+        subscribed = self.subscriptions.subscribe(['1234', '5678'], 'release pipeline', ['bjones'])
+        self.assertEqual(subscribed, {'1234': {'jdoe', 'bjones'}, '5678': {'asmith', 'bjones'}})
+
+    def test_subscribe_refreshes_expiry(self):
+        self.subscriptions.create('1234', 'release pipeline', ['jdoe'])
+        for key in self.redis.keys('notify_*'):
+            self.redis.expire(key, 10)
+        self.subscriptions.subscribe(['1234'], 'ops', ['bjones'])
+        for key in ('notify_rooms:1234', 'notify_users:1234:ops'):
+            self.assertGreater(self.redis.ttl(key), SUBSCRIPTION_EXPIRE_SECONDS - 10)
+        # The other room's subscribers keep their own expiry.
+        self.assertLessEqual(self.redis.ttl('notify_users:1234:release pipeline'), 10)
+
+    def test_expired_room_is_skipped(self):
+        self.subscriptions.create('1234', 'release pipeline', ['jdoe'])
+        self.subscriptions.subscribe(['1234'], 'ops', ['bjones'])
+        self.redis.delete('notify_users:1234:release pipeline')
+        self.assertEqual(self.subscriptions.subscriptions('1234'), {'ops': ['bjones']})
+
+    def test_no_subscriptions(self):
+        self.assertEqual(self.subscriptions.subscriptions('1234'), {})
+
+    def test_user_subscriptions(self):
+        self.subscriptions.create('1234', 'release pipeline', ['jdoe'])
+        self.subscriptions.subscribe(['1234', '5678'], 'ops', ['jdoe', 'asmith'])
+        self.assertEqual(
+            self.subscriptions.user_subscriptions('jdoe'),
+            {'1234': ['ops', 'release pipeline'], '5678': ['ops']}
+        )
+        self.assertEqual(self.subscriptions.user_subscriptions('bjones'), {})
+
+    def test_user_subscriptions_skip_expired(self):
+        self.subscriptions.create('1234', 'release pipeline', ['jdoe'])
+        self.subscriptions.create('5678', 'release pipeline', ['jdoe'])
+        self.redis.delete('notify_users:1234:release pipeline')
+        self.assertEqual(self.subscriptions.user_subscriptions('jdoe'), {'5678': ['release pipeline']})
+        # The expired subscription is dropped from the index.
+        self.assertEqual(self.redis.scard('notify_user_builds:jdoe'), 1)
+
+    def test_unsubscribe_all(self):
+        self.subscriptions.create('1234', 'release pipeline', ['jdoe', 'asmith'])
+        self.subscriptions.subscribe(['1234'], 'ops', ['jdoe'])
+        self.subscriptions.create('5678', 'release pipeline', ['jdoe'])
+        self.assertEqual(self.subscriptions.unsubscribe_all('jdoe'), ['1234', '5678'])
+        self.assertEqual(self.subscriptions.bulk_subscriptions(['1234', '5678']), {
+            '1234': {'release pipeline': ['asmith']},
+            '5678': {},
+        })
+        self.assertEqual(self.subscriptions.user_subscriptions('jdoe'), {})
+        self.assertEqual(self.subscriptions.unsubscribe_all('jdoe'), [])
+
+    def test_bulk_subscriptions(self):
+        self.subscriptions.create('1234', 'release pipeline', ['jdoe'])
+        self.subscriptions.create('5678', 'ops', ['asmith'])
+        self.subscriptions.subscribe(['5678'], 'release pipeline', ['jdoe'])
+        self.assertEqual(self.subscriptions.bulk_subscriptions(['1234', '5678', '9999']), {
+            '1234': {'release pipeline': ['jdoe']},
+            '5678': {'ops': ['asmith'], 'release pipeline': ['jdoe']},
+            '9999': {},
+        })
+
+
+class TestNotifyPlugin(unittest.TestCase):
+    """
+    Test the notify plugin commands.
+    """
+    def setUp(self):
+        super(TestNotifyPlugin, self).setUp()
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        self.plugin = NotifyPlugin()
+        self.plugin.storage = mock.Mock(redis=self.redis)
+        self.message = mock.Mock()
+        self.message.sender.nick = 'jdoe'
+        self.mock_reply = self._patch('reply')
+        self.mock_say = self._patch('say')
+        self.mock_get_room = self._patch('get_room_from_name_or_id')
+        self._patch('get_room_from_message', return_value={'name': 'release pipeline'})
+        # Each test gets a dispatcher of its own, delivering through its patches.
+        self._patch('notification_dispatcher', new=None)
+
+    def _patch(self, method, **kwargs):
+        """
+        Patch a NotifyPlugin method for the duration of the test.
+        """
+        patcher = mock.patch.object(NotifyPlugin, method, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_subscribe(self):
+        BuildSubscriptions(self.redis).create('1234', 'release pipeline', ['asmith'])
+        self.plugin.subscribe(self.message, 'me bjones ', ' 1234 1234')
+        self.mock_reply.assert_called_once_with(
+            self.message, "OK, I'll tell asmith, bjones, jdoe when I hear about 1234"
+        )
+
+    def test_subscribe_unknown_build(self):
+        BuildSubscriptions(self.redis).create('1234', 'release pipeline', ['asmith'])
+        self.plugin.subscribe(self.message, 'me ', ' 1234 5678')
+        self.mock_reply.assert_called_once_with(
+            self.message, "Sorry, I don't know about a token named 5678", color='red'
+        )
+        self.assertEqual(BuildSubscriptions(self.redis).subscriptions('1234'), {'release pipeline': ['asmith']})
+
+    @mock.patch.object(NotificationDispatcher, 'BATCH_WINDOW_SECONDS', 0)
+    def test_send_notification(self):
+        BuildSubscriptions(self.redis).create('1234', 'release pipeline', ['asmith', 'jdoe'])
+        with mock.patch.object(NotifyPlugin, '_send_room_notification') as mock_send:
+            self.plugin.send_notification('1234', 'done')
+            self.plugin.send_notification('1234', 'done')
+            self.plugin.notification_dispatcher.wait_until_idle()
+        mock_send.assert_called_once_with('release pipeline', "@asmith @jdoe BuildID: 1234, Message: done")
+
+    @mock.patch.object(NotificationDispatcher, 'BATCH_WINDOW_SECONDS', 0)
+    def test_send_notifications(self):
+        BuildSubscriptions(self.redis).create('1234', 'release pipeline', ['asmith'])
+        BuildSubscriptions(self.redis).create('5678', 'release pipeline', ['jdoe'])
+        BuildSubscriptions(self.redis).create('9012', 'ops', ['bjones'])
+        notifications = [
+            {'build_id': build_id, 'text': 'done'} for build_id in ('1234', '5678', '9012', '1234')
+        ]
+        with mock.patch.object(NotifyPlugin, '_send_room_notification') as mock_send:
+            with mock.patch('plugins.notify.bottle.request') as mock_request:
+                mock_request.json = {'notifications': notifications}
+                self.assertEqual(self.plugin.send_notifications(), {'queued': 3, 'duplicates': 1})
+            self.plugin.notification_dispatcher.wait_until_idle()
+        self.assertEqual(sorted(mock_send.call_args_list), [
+            mock.call('ops', "@bjones BuildID: 9012, Message: done"),
+            mock.call(
+                'release pipeline',
+                "@asmith BuildID: 1234, Message: done\n@jdoe BuildID: 5678, Message: done"
+            ),
+        ])
+
+    def test_routes_share_dispatcher(self):
+        # Will creates a plugin instance for each route.
+        get_route_plugin, post_route_plugin = NotifyPlugin(), NotifyPlugin()
+        for plugin in (get_route_plugin, post_route_plugin):
+            plugin.storage = self.plugin.storage
+        self.assertIs(
+            get_route_plugin._notification_dispatcher(),  # pylint: disable=protected-access
+            post_route_plugin._notification_dispatcher()  # pylint: disable=protected-access
+        )
+
+    def test_send_notifications_bad_request(self):
+        with mock.patch('plugins.notify.bottle.request') as mock_request:
+            mock_request.json = {'notifications': [{'build_id': '1234'}]}
+            with self.assertRaises(bottle.HTTPError):
+                self.plugin.send_notifications()
+
+    def test_my_subscriptions(self):
+        BuildSubscriptions(self.redis).create('1234', 'release pipeline', ['jdoe'])
+        self.plugin.my_subscriptions(self.message)
+        self.assertEqual(self.mock_reply.call_args_list, [
+            mock.call(self.message, "You're subscribed to:"),
+            mock.call(self.message, "1234:  release pipeline"),
+        ])
+
+    def test_unsubscribe_all(self):
+        BuildSubscriptions(self.redis).create('1234', 'release pipeline', ['jdoe'])
+        self.plugin.unsubscribe_all(self.message)
+        self.mock_reply.assert_called_once_with(self.message, "OK, I won't tell you about 1234")
+
+    def test_notification_lines_for_jenkins_list(self):
+        self.assertEqual(
+            self.plugin._notification_lines([('@asmith', 'done')]),  # pylint: disable=protected-access
+            [[(None, "@asmith Message: done")]]
+        )
+
+
+class TestNotificationDispatcher(unittest.TestCase):
+    """
+    Test the background delivery of build notifications.
+    """
+    def setUp(self):
+        super(TestNotificationDispatcher, self).setUp()
+        self.redis = fakeredis.FakeRedis()
+        self.redis.flushall()
+        self.send = mock.Mock()
+        self.dispatcher = NotificationDispatcher(self.redis, self._resolve, self.send)
+        patcher = mock.patch('alton.notification_dispatcher.time.sleep')
+        self.addCleanup(patcher.stop)
+        self.mock_sleep = patcher.start()
+
+    def _resolve(self, notifications):
+        """
+        Notify both rooms about every build.
+        """
+        return [
+            [(room, '{}: {}'.format(build_id, text)) for room in ('ops', 'release pipeline')]
+            for build_id, text in notifications
+        ]
+
+    def test_batches_per_room(self):
+        # pylint: disable=protected-access
+        self.dispatcher._dispatch([('1234', 'done'), ('5678', 'failed')])
+        self.assertEqual(self.send.call_args_list, [
+            mock.call('ops', '1234: done\n5678: failed'),
+            mock.call('release pipeline', '1234: done\n5678: failed'),
+        ])
+
+    def test_batch_size_limit(self):
+        # pylint: disable=protected-access
+        with mock.patch.object(NotificationDispatcher, 'MAX_BATCH_LINES', 2):
+            self.dispatcher._dispatch([('1', 'done'), ('2', 'done'), ('3', 'done')])
+        self.assertEqual(self.send.call_args_list, [
+            mock.call('ops', '1: done\n2: done'),
+            mock.call('ops', '3: done'),
+            mock.call('release pipeline', '1: done\n2: done'),
+            mock.call('release pipeline', '3: done'),
+        ])
+
+    def test_retries_failed_sends(self):
+        self.send.side_effect = [Exception('Service Unavailable'), None, None]
+        self.dispatcher._dispatch([('1234', 'done')])  # pylint: disable=protected-access
+        self.assertEqual(self.send.call_count, 3)
+        self.mock_sleep.assert_called_once_with(NotificationDispatcher.RETRY_DELAY_SECONDS)
+
+    def test_gives_up_after_max_attempts(self):
+        self.send.side_effect = Exception('Service Unavailable')
+        self.dispatcher._dispatch([('1234', 'done')])  # pylint: disable=protected-access
+        self.assertEqual(self.send.call_count, 2 * NotificationDispatcher.MAX_SEND_ATTEMPTS)
+
+    def test_forgets_undelivered_notifications(self):
+        self.send.side_effect = lambda room, content: None if room == 'ops' else self._fail()
+        with mock.patch.object(self.dispatcher, '_start_worker'):
+            self.dispatcher.enqueue_many([('1234', 'done'), ('5678', 'done')])
+        self.dispatcher._dispatch(self.dispatcher.queue.get())  # pylint: disable=protected-access
+        # Delivery to the release pipeline room failed, so a repeated callback is delivered again.
+        with mock.patch.object(self.dispatcher, '_start_worker'):
+            self.assertTrue(self.dispatcher.enqueue('1234', 'done'))
+
+    def test_remembers_delivered_notifications(self):
+        with mock.patch.object(self.dispatcher, '_start_worker'):
+            self.dispatcher.enqueue('1234', 'done')
+        # pylint: disable=protected-access
+        dedup_key = self.dispatcher._dedup_key('1234', 'done')
+        self.assertLessEqual(self.redis.ttl(dedup_key), NotificationDispatcher.PENDING_EXPIRE_SECONDS)
+        self.dispatcher._dispatch(self.dispatcher.queue.get())
+        self.assertGreater(self.redis.ttl(dedup_key), NotificationDispatcher.PENDING_EXPIRE_SECONDS)
+        with mock.patch.object(self.dispatcher, '_start_worker'):
+            self.assertFalse(self.dispatcher.enqueue('1234', 'done'))
+
+    def _fail(self):
+        """
+        Fail to send a message.
+        """
+        raise Exception('Service Unavailable')
+
+    def test_drops_repeated_notifications(self):
+        with mock.patch.object(self.dispatcher, '_start_worker'):
+            self.assertTrue(self.dispatcher.enqueue('1234', 'done'))
+            self.assertFalse(self.dispatcher.enqueue('1234', 'done'))
+            self.assertTrue(self.dispatcher.enqueue('1234', 'failed'))
+        self.assertEqual(self.dispatcher.queue.qsize(), 2)
+
+    def test_enqueue_many(self):
+        with mock.patch.object(self.dispatcher, '_start_worker'):
+            self.assertEqual(self.dispatcher.enqueue_many([('1234', 'done'), ('5678', 'done'), ('1234', 'done')]), 2)
+        self.assertEqual(self.dispatcher.queue.get(), [('1234', 'done'), ('5678', 'done')])
+
+    @mock.patch.object(NotificationDispatcher, 'BATCH_WINDOW_SECONDS', 0)
+    def test_delivers_in_background(self):
+        self.dispatcher.enqueue('1234', 'done')
+        self.dispatcher.wait_until_idle()
+        self.assertEqual(self.send.call_count, 2)
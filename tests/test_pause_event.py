@@ -2,11 +2,12 @@
 Tests for release-pausing functionality.
 """
 
+import json
 import os.path
 from datetime import datetime
 import unittest
 from moto import mock_s3
-from mock import patch, call
+from mock import Mock, patch, call
 from freezegun import freeze_time
 import yaml
 from alton.pause_event import (
@@ -16,9 +17,31 @@ from alton.pause_event import (
     S3PauseEventOps,
     PIPELINE_SYSTEM_INFO
 )
+from alton.command_pool import CommandCancelled
 from alton.gocd_api import GoCDAPI
 
 
+class InlinePool(object):
+    """
+    Stand-in for the pool fetching history files, running each fetch in the calling thread - the moto S3 mock
+    isn't thread-safe.
+    """
+    def __init__(self, processes=None):
+        self.processes = processes
+
+    def map(self, func, iterable):
+        """
+        Call func on each item, in order.
+        """
+        return [func(item) for item in iterable]
+
+    def terminate(self):
+        """
+        There are no threads to stop.
+        """
+        pass
+
+
 class TestS3PauseEventOps(unittest.TestCase):
     """
     Tests all the pause event ops.
@@ -30,6 +53,12 @@ class TestS3PauseEventOps(unittest.TestCase):
     TEST_GOCD_PASSWORD = 'gocd_test_password'
     TEST_GOCD_SVR_URL = 'https://gocd.test.edx.org'
 
+    def setUp(self):
+        super(TestS3PauseEventOps, self).setUp()
+        pool_patcher = patch('alton.pause_event.ThreadPool', InlinePool)
+        pool_patcher.start()
+        self.addCleanup(pool_patcher.stop)
+
     def _create_s3_pause_event_ops_obj(self):
         """
         Construct a standard test S3PauseEventOps object.
@@ -401,3 +430,270 @@ class TestS3PauseEventOps(unittest.TestCase):
             self.assertEqual(len(state['ecommerce']), 1)
             self.assertIn('userauth', state)
             self.assertEqual(len(state['userauth']), 0)
+
+    def _add_events_at(self, pause_ops, times_and_systems):
+        """
+        Add a pause event for each (time, pipeline system) pair, returning the event IDs in the same order.
+        """
+        event_ids = []
+        with patch.dict(
+            'alton.pause_event.PIPELINE_SYSTEM_INFO',
+            {'edxapp': [], 'ecommerce': []}
+        ):
+            for event_time, pipeline_system in times_and_systems:
+                with freeze_time(event_time):
+                    pause_status = pause_ops.add_pipeline_event(
+                        self.TEST_USER,
+                        pipeline_system,
+                        'Paused at {}.'.format(event_time)
+                    )
+                event_ids.append(pause_status['event_id'])
+        return event_ids
+
+    @mock_s3
+    def test_pipeline_history_time_ordered(self):
+        pause_ops = self._create_s3_pause_event_ops_obj()
+        event_ids = self._add_events_at(pause_ops, [
+            ('2017-03-01 12:00:00', 'edxapp'),
+            ('2017-01-15 09:30:00', 'ecommerce'),
+            ('2016-12-31 23:59:59', 'edxapp'),
+            ('2017-01-15 09:29:00', 'edxapp'),
+        ])
+        history = list(pause_ops.pipeline_history())
+        self.assertEqual(
+            [event['event_id'] for event in history],
+            [event_ids[2], event_ids[3], event_ids[1], event_ids[0]]
+        )
+        self.assertEqual(history[0]['time_paused'], '2016-12-31_23:59:59')
+
+    @mock_s3
+    def test_pipeline_history_filters(self):
+        pause_ops = self._create_s3_pause_event_ops_obj()
+        event_ids = self._add_events_at(pause_ops, [
+            ('2016-12-31 23:59:59', 'edxapp'),
+            ('2017-01-15 09:29:00', 'edxapp'),
+            ('2017-01-15 09:30:00', 'ecommerce'),
+            ('2017-03-01 12:00:00', 'edxapp'),
+        ])
+        history = pause_ops.pipeline_history(pipeline_system='edxapp')
+        self.assertEqual([event['event_id'] for event in history], [event_ids[0], event_ids[1], event_ids[3]])
+
+        history = pause_ops.pipeline_history(since=datetime(2017, 1, 15, 9, 30), until=datetime(2017, 3, 1, 12))
+        self.assertEqual([event['event_id'] for event in history], [event_ids[2]])
+
+        history = pause_ops.pipeline_history(pipeline_system='edxapp', since=datetime(2017, 1, 1))
+        self.assertEqual([event['event_id'] for event in history], [event_ids[1], event_ids[3]])
+
+    @mock_s3
+    def test_pipeline_history_month_pruning(self):
+        pause_ops = self._create_s3_pause_event_ops_obj()
+        self._add_events_at(pause_ops, [
+            ('2016-12-31 23:59:59', 'edxapp'),
+            ('2017-01-15 09:29:00', 'edxapp'),
+            ('2017-03-01 12:00:00', 'edxapp'),
+            ('2018-02-01 00:00:00', 'edxapp'),
+        ])
+        # pylint: disable=protected-access
+        self.assertEqual(
+            list(pause_ops._history_month_prefixes()),
+            [
+                'paused/history/2016/12/',
+                'paused/history/2017/01/',
+                'paused/history/2017/03/',
+                'paused/history/2018/02/',
+            ]
+        )
+        self.assertEqual(
+            list(pause_ops._history_month_prefixes(since=datetime(2017, 1, 20), until=datetime(2017, 3, 1))),
+            ['paused/history/2017/01/']
+        )
+
+    @mock_s3
+    def test_pipeline_history_fetch_pool(self):
+        pause_ops = self._create_s3_pause_event_ops_obj()
+        event_ids = self._add_events_at(pause_ops, [
+            ('2017-01-15 09:{:02d}:00'.format(minute), 'edxapp') for minute in range(10)
+        ])
+        with patch('alton.pause_event.ThreadPool', side_effect=InlinePool) as pool_mock:
+            self.assertEqual([event['event_id'] for event in pause_ops.pipeline_history()], event_ids)
+        pool_mock.assert_called_once_with(S3PauseEventOps.HISTORY_FETCH_CONCURRENCY)
+
+    @mock_s3
+    def test_pipeline_history_cancelled(self):
+        pause_ops = self._create_s3_pause_event_ops_obj()
+        event_ids = self._add_events_at(pause_ops, [
+            ('2017-01-15 09:29:00', 'edxapp'),
+            ('2017-03-01 12:00:00', 'edxapp'),
+        ])
+        check_cancelled = Mock()
+        history = pause_ops.pipeline_history(check_cancelled=check_cancelled)
+        self.assertEqual(next(history)['event_id'], event_ids[0])
+        # The chat command reading the history is cancelled - reading stops before the next month.
+        check_cancelled.side_effect = CommandCancelled
+        with self.assertRaises(CommandCancelled):
+            next(history)
+        with self.assertRaises(CommandCancelled):
+            pause_ops.pipeline_stats(check_cancelled=check_cancelled)
+
+    @patch.object(GoCDAPI, 'unpause_pipeline')
+    @mock_s3
+    def test_compact_history(self, __):
+        pause_ops = self._create_s3_pause_event_ops_obj()
+        event_ids = self._add_events_at(pause_ops, [
+            ('2017-01-15 09:29:00', 'edxapp'),
+            ('2017-01-15 09:30:00', 'ecommerce'),
+            ('2017-02-01 12:00:00', 'edxapp'),
+            ('2017-03-01 12:00:00', 'edxapp'),
+        ])
+        with patch.dict('alton.pause_event.PIPELINE_SYSTEM_INFO', {'edxapp': [], 'ecommerce': []}):
+            for event_id in event_ids[:2]:
+                pause_ops.remove_pipeline_event(self.TEST_USER, event_id)
+        expected_history = list(pause_ops.pipeline_history())
+
+        # January is closed and resolved, February still has a current event, March is the live month.
+        self.assertEqual(pause_ops.compact_history(now=datetime(2017, 3, 10)), ['2017/01'])
+        self.assertEqual(pause_ops.compact_history(now=datetime(2017, 3, 10)), [])
+        # pylint: disable=protected-access
+        rollup_index = pause_ops._load_rollup_index()
+        self.assertEqual(
+            rollup_index['months']['2017/01'],
+            {'key': 'paused/rollup/2017/01.jsonl.gz', 'count': 2, 'systems': {'edxapp': 1, 'ecommerce': 1}}
+        )
+
+        # Once compacted, the individual January files are no longer read.
+        with patch.object(S3PauseEventOps, '_load_history_file', side_effect=pause_ops._load_history_file) as load_mock:
+            self.assertEqual(list(pause_ops.pipeline_history()), expected_history)
+        self.assertEqual(load_mock.call_count, 2)
+        self.assertEqual(
+            [event['event_id'] for event in pause_ops.pipeline_history('ecommerce')],
+            [event_ids[1]]
+        )
+        self.assertEqual(
+            [event['event_id'] for event in pause_ops.pipeline_history(since=datetime(2017, 1, 15, 9, 30))],
+            event_ids[1:]
+        )
+
+    @patch.object(GoCDAPI, 'unpause_pipeline')
+    @mock_s3
+    def test_pipeline_stats(self, __):
+        pause_ops = self._create_s3_pause_event_ops_obj()
+        event_ids = self._add_events_at(pause_ops, [
+            ('2017-01-10 00:00:00', 'edxapp'),
+            ('2017-01-20 00:00:00', 'edxapp'),
+            ('2017-01-20 00:00:01', 'ecommerce'),
+            ('2017-02-01 00:00:00', 'edxapp'),
+        ])
+        resolve_times = ['2017-01-10 01:00:00', '2017-01-20 03:00:00', '2017-01-21 00:00:01']
+        with patch.dict('alton.pause_event.PIPELINE_SYSTEM_INFO', {'edxapp': [], 'ecommerce': []}):
+            for event_id, resolve_time in zip(event_ids, resolve_times):
+                with freeze_time(resolve_time):
+                    pause_ops.remove_pipeline_event('resolver', event_id)
+
+        stats = pause_ops.pipeline_stats(now=datetime(2017, 2, 1, 2))
+        self.assertEqual(stats['edxapp'], {
+            'count': 3,
+            # 1h + 3h resolved, plus 2h of the still-unresolved February event.
+            'paused_seconds': 6 * 3600,
+            'resolved': 2,
+            'mean_resolve_seconds': 2 * 3600.0,
+            'p95_resolve_seconds': 3 * 3600,
+            'top_pausers': [(self.TEST_USER, 3)],
+        })
+        self.assertEqual(stats['ecommerce']['count'], 1)
+        self.assertEqual(stats['ecommerce']['p95_resolve_seconds'], 24 * 3600)
+
+        # Reading statistics doesn't write to the bucket - compacting closed, resolved January caches its
+        # statistics, and its events are not read again.
+        # pylint: disable=protected-access
+        self.assertEqual(pause_ops._load_stats_cache()['months'], {})
+        self.assertEqual(pause_ops.compact_history(now=datetime(2017, 2, 1, 2)), ['2017/01'])
+        self.assertEqual(list(pause_ops._load_stats_cache()['months']), ['2017/01'])
+        with patch.object(S3PauseEventOps, '_month_events', side_effect=pause_ops._month_events) as month_events_mock:
+            self.assertEqual(pause_ops.pipeline_stats('edxapp', now=datetime(2017, 2, 1, 2))['edxapp']['count'], 3)
+        self.assertEqual(month_events_mock.call_count, 1)
+
+        # Months compacted before their statistics were cached get cached by the next compaction.
+        pause_ops.pipeline_bucket.delete_key(pause_ops.STATS_CACHE_FILEPATH)
+        self.assertEqual(pause_ops.compact_history(now=datetime(2017, 2, 1, 2)), [])
+        self.assertEqual(list(pause_ops._load_stats_cache()['months']), ['2017/01'])
+
+        # Partial months are filtered by time.
+        stats = pause_ops.pipeline_stats('edxapp', since=datetime(2017, 1, 15), now=datetime(2017, 2, 1, 2))
+        self.assertEqual(stats['edxapp']['count'], 2)
+        self.assertEqual(pause_ops.pipeline_stats('edxapp', until=datetime(2016, 1, 1))['edxapp']['count'], 0)
+
+    @patch.object(GoCDAPI, 'pause_pipeline')
+    @patch.object(GoCDAPI, 'unpause_pipeline')
+    @mock_s3
+    def test_json_file_format(self, __, ___):
+        yaml_ops = self._create_s3_pause_event_ops_obj()
+        json_ops = S3PauseEventOps(
+            self.TEST_S3_BUCKET_NAME,
+            self.TEST_GOCD_USERNAME,
+            self.TEST_GOCD_PASSWORD,
+            self.TEST_GOCD_SVR_URL,
+            file_format='json'
+        )
+        with freeze_time("2017-04-08 05:15:15"):
+            yaml_status = yaml_ops.add_pipeline_event(self.TEST_USER, self.TEST_PIPELINE_SYSTEM, 'YAML reason.')
+        with freeze_time("2017-04-08 05:15:16"):
+            json_status = json_ops.add_pipeline_event(self.TEST_USER, self.TEST_PIPELINE_SYSTEM, 'JSON reason.')
+
+        current_keys = json_ops.pipeline_bucket.get_all_keys(prefix=json_ops.CURRENT_DIRECTORY)
+        self.assertEqual(sorted(os.path.splitext(key.name)[1] for key in current_keys), ['.json', '.yml'])
+        json_key = [key for key in current_keys if key.name.endswith('.json')][0]
+        json_contents = json.loads(json_key.get_contents_as_string())
+        self.assertEqual(json_contents['format_version'], 1)
+        self.assertEqual(json_contents['event_id'], json_status['event_id'])
+
+        # Either backend reads both formats, without leaking the format version into the event.
+        for pause_ops in (yaml_ops, json_ops):
+            state = pause_ops.pipeline_status(self.TEST_PIPELINE_SYSTEM)
+            self.assertEqual(
+                sorted(event['pause_reason'] for event in state[self.TEST_PIPELINE_SYSTEM]),
+                ['JSON reason.', 'YAML reason.']
+            )
+            self.assertTrue(all('format_version' not in event for event in state[self.TEST_PIPELINE_SYSTEM]))
+
+        # Resolving rewrites the historical file in its original format.
+        with freeze_time("2017-04-08 06:00:00"):
+            yaml_ops.remove_pipeline_event(self.TEST_USER, json_status['event_id'])
+            json_ops.remove_pipeline_event(self.TEST_USER, yaml_status['event_id'])
+        history = list(json_ops.pipeline_history())
+        self.assertEqual([event['event_id'] for event in history], [yaml_status['event_id'], json_status['event_id']])
+        self.assertTrue(all(event['who_cleared'] == self.TEST_USER for event in history))
+        self.assertEqual(
+            sorted(os.path.splitext(key.name)[1] for key in json_ops.pipeline_bucket.get_all_keys(
+                prefix=json_ops.HISTORY_DIRECTORY
+            )),
+            ['.json', '.yml']
+        )
+
+    def test_decode_non_event_files(self):
+        # Decoding doesn't touch S3.
+        pause_ops = S3PauseEventOps.__new__(S3PauseEventOps)
+        for key_name, contents in (
+                ('edxapp_2017-04-08_05:15:15_1234.json', '[1, 2]'),
+                ('edxapp_2017-04-08_05:15:15_1234.json', '"paused"'),
+                ('edxapp_2017-04-08_05:15:15_1234.json', 'null'),
+                ('edxapp_2017-04-08_05:15:15_1234.json', '{'),
+                ('edxapp_2017-04-08_05:15:15_1234.yml', '- 1\n- 2\n'),
+                ('edxapp_2017-04-08_05:15:15_1234.yml', 'paused'),
+        ):
+            self.assertIsNone(pause_ops._decode_pause_file(key_name, contents), contents)  # pylint: disable=protected-access
+        self.assertEqual(
+            pause_ops._decode_pause_file(  # pylint: disable=protected-access
+                'edxapp_2017-04-08_05:15:15_1234.json', '{"event_id": "1234", "format_version": 1}'
+            ),
+            {'event_id': '1234'}
+        )
+
+    def test_unknown_file_format(self):
+        with self.assertRaises(ValueError):
+            S3PauseEventOps(
+                self.TEST_S3_BUCKET_NAME,
+                self.TEST_GOCD_USERNAME,
+                self.TEST_GOCD_PASSWORD,
+                self.TEST_GOCD_SVR_URL,
+                file_format='xml'
+            )
@@ -0,0 +1,231 @@
+"""
+Conformance tests run against every pause event storage backend.
+"""
+
+from datetime import datetime
+import unittest
+from moto import mock_s3
+from mock import Mock, patch, call
+from freezegun import freeze_time
+from alton import metrics, tracing
+from alton.command_pool import CommandCancelled
+from alton.pause_event import (
+    PauseEventNotFound,
+    S3PauseEventOps,
+)
+from alton.sqlite_pause_event import SQLitePauseEventOps
+from alton.gocd_api import GoCDAPI
+from alton.tracing import Trace
+from tests.test_pause_event import InlinePool
+
+
+class PauseEventOpsConformanceMixin(object):
+    """
+    Tests of the PauseEventOps interface, shared by all the storage backends.
+    Subclasses implement _create_pause_event_ops().
+    """
+    # Name the backend's calls are reported under.
+    BACKEND = None
+
+    TEST_USER = 'TestUser'
+    TEST_GOCD_USERNAME = 'gocd_test_user'
+    TEST_GOCD_PASSWORD = 'gocd_test_password'
+    TEST_GOCD_SVR_URL = 'https://gocd.test.edx.org'
+
+    def _create_pause_event_ops(self):
+        """
+        Construct the PauseEventOps object under test.
+        """
+        raise NotImplementedError
+
+    def setUp(self):
+        super(PauseEventOpsConformanceMixin, self).setUp()
+        system_info_patcher = patch.dict(
+            'alton.pause_event.PIPELINE_SYSTEM_INFO',
+            {'edxapp': ['edxapp_pipeline'], 'ecommerce': ['ecommerce_pipeline']},
+            clear=True
+        )
+        system_info_patcher.start()
+        self.addCleanup(system_info_patcher.stop)
+        pause_patcher = patch.object(GoCDAPI, 'pause_pipeline')
+        self.pause_mock = pause_patcher.start()
+        self.addCleanup(pause_patcher.stop)
+        unpause_patcher = patch.object(GoCDAPI, 'unpause_pipeline')
+        self.unpause_mock = unpause_patcher.start()
+        self.addCleanup(unpause_patcher.stop)
+        self.pause_ops = self._create_pause_event_ops()
+
+    def _add_event_at(self, event_time, pipeline_system='edxapp', who_paused=None):
+        """
+        Add a pause event at the specified time, returning its event ID.
+        """
+        with freeze_time(event_time):
+            pause_status = self.pause_ops.add_pipeline_event(
+                who_paused or self.TEST_USER, pipeline_system, 'Paused at {}.'.format(event_time)
+            )
+        return pause_status['event_id']
+
+    def _remove_event_at(self, event_time, event_id):
+        """
+        Remove a pause event at the specified time, returning the removal status.
+        """
+        with freeze_time(event_time):
+            return self.pause_ops.remove_pipeline_event(self.TEST_USER, event_id)
+
+    def test_add_and_status(self):
+        event_id = self._add_event_at('2017-04-08 05:15:15')
+        self.pause_mock.assert_has_calls([call('edxapp_pipeline', 'Paused at 2017-04-08 05:15:15.')])
+        state = self.pause_ops.pipeline_status('edxapp', paused_only=True)
+        self.assertEqual(list(state), ['edxapp'])
+        self.assertEqual(len(state['edxapp']), 1)
+        event = state['edxapp'][0]
+        self.assertEqual(event['event_id'], event_id)
+        self.assertEqual(event['pipeline_system'], 'edxapp')
+        self.assertEqual(event['who_paused'], self.TEST_USER)
+        self.assertEqual(event['time_paused'], '2017-04-08_05:15:15')
+        self.assertEqual(event['pause_reason'], 'Paused at 2017-04-08 05:15:15.')
+        self.assertIsNone(event['who_cleared'])
+        self.assertIsNone(event['time_cleared'])
+
+    def test_status_all_systems(self):
+        self._add_event_at('2017-04-08 05:15:15', 'ecommerce')
+        self.assertEqual(
+            {system: len(events) for system, events in self.pause_ops.pipeline_status().items()},
+            {'edxapp': 0, 'ecommerce': 1}
+        )
+        self.assertEqual(list(self.pause_ops.pipeline_status(paused_only=True)), ['ecommerce'])
+        self.assertEqual(self.pause_ops.pipeline_status('edxapp', paused_only=True), {'edxapp': []})
+
+    def test_remove_unpauses_last_event(self):
+        first_event_id = self._add_event_at('2017-04-08 05:15:15')
+        second_event_id = self._add_event_at('2017-04-08 05:15:16')
+
+        remove_status = self._remove_event_at('2017-04-08 06:00:00', first_event_id)
+        self.assertEqual(
+            remove_status, {'pipeline_system': 'edxapp', 'unpaused': False, 'num_remaining_events': 1}
+        )
+        self.unpause_mock.assert_not_called()
+
+        remove_status = self._remove_event_at('2017-04-08 07:00:00', second_event_id)
+        self.assertEqual(
+            remove_status, {'pipeline_system': 'edxapp', 'unpaused': True, 'num_remaining_events': 0}
+        )
+        self.unpause_mock.assert_has_calls([call('edxapp_pipeline')])
+        self.assertEqual(self.pause_ops.pipeline_status('edxapp', paused_only=True), {'edxapp': []})
+
+    def test_remove_missing_event(self):
+        with self.assertRaises(PauseEventNotFound):
+            self.pause_ops.remove_pipeline_event(self.TEST_USER, 'NOT_AN_EVENT_ID')
+        event_id = self._add_event_at('2017-04-08 05:15:15')
+        self._remove_event_at('2017-04-08 06:00:00', event_id)
+        # An event can only be resolved once.
+        with self.assertRaises(PauseEventNotFound):
+            self.pause_ops.remove_pipeline_event(self.TEST_USER, event_id)
+
+    def test_history(self):
+        event_ids = [
+            self._add_event_at('2017-03-01 12:00:00', 'edxapp'),
+            self._add_event_at('2017-01-15 09:30:00', 'ecommerce'),
+            self._add_event_at('2016-12-31 23:59:59', 'edxapp'),
+        ]
+        self._remove_event_at('2017-03-02 12:00:00', event_ids[0])
+
+        history = list(self.pause_ops.pipeline_history())
+        self.assertEqual([event['event_id'] for event in history], list(reversed(event_ids)))
+        self.assertEqual(history[-1]['who_cleared'], self.TEST_USER)
+        self.assertEqual(history[-1]['time_cleared'], '2017-03-02_12:00:00')
+        self.assertIsNone(history[0]['time_cleared'])
+
+        history = self.pause_ops.pipeline_history('edxapp', since=datetime(2017, 1, 1))
+        self.assertEqual([event['event_id'] for event in history], [event_ids[0]])
+        history = self.pause_ops.pipeline_history(since=datetime(2017, 1, 15, 9, 30), until=datetime(2017, 3, 1, 12))
+        self.assertEqual([event['event_id'] for event in history], [event_ids[1]])
+
+    def test_stats(self):
+        first_event_id = self._add_event_at('2017-01-10 00:00:00', who_paused='user1')
+        second_event_id = self._add_event_at('2017-01-20 00:00:00', who_paused='user2')
+        self._add_event_at('2017-01-21 00:00:00', who_paused='user2')
+        self._remove_event_at('2017-01-10 01:00:00', first_event_id)
+        self._remove_event_at('2017-01-20 03:00:00', second_event_id)
+
+        stats = self.pause_ops.pipeline_stats(now=datetime(2017, 1, 21, 2))
+        self.assertEqual(stats, {
+            'edxapp': {
+                'count': 3,
+                'paused_seconds': 6 * 3600,
+                'resolved': 2,
+                'mean_resolve_seconds': 2 * 3600.0,
+                'p95_resolve_seconds': 3 * 3600,
+                'top_pausers': [('user2', 2), ('user1', 1)],
+            }
+        })
+        self.assertEqual(self.pause_ops.pipeline_stats('ecommerce')['ecommerce']['count'], 0)
+
+    def test_cancelled(self):
+        self._add_event_at('2017-01-10 00:00:00')
+        check_cancelled = Mock(side_effect=CommandCancelled)
+        with self.assertRaises(CommandCancelled):
+            list(self.pause_ops.pipeline_history(check_cancelled=check_cancelled))
+        with self.assertRaises(CommandCancelled):
+            self.pause_ops.pipeline_stats(check_cancelled=check_cancelled)
+
+    def test_operations_are_traced_and_timed(self):
+        trace = Trace('pause', self.TEST_USER, 'pipeline pause edxapp because testing')
+        registry = metrics.MetricsRegistry()
+        with patch.object(tracing, '_CURRENT', Mock(trace=trace)), patch.object(metrics, 'METRICS', registry):
+            event_id = self._add_event_at('2017-01-01 00:00:00')
+            self.pause_ops.remove_pipeline_event(self.TEST_USER, event_id)
+            self.pause_ops.pipeline_status()
+
+        span_names = set(each.name for each in trace.spans)
+        self.assertTrue({
+            'add_pipeline_event', '_add_event_state_ops', '_add_event_pipeline_ops',
+            'remove_pipeline_event', '_remove_event_state_ops', '_remove_event_pipeline_ops', 'pipeline_status',
+        } <= span_names)
+        self.assertIn('{}.list_current'.format(self.BACKEND), span_names)
+        backend_calls = [
+            series for series in registry.values()
+            if series.startswith('alton_backend_calls_total{{backend="{}"'.format(self.BACKEND))
+        ]
+        self.assertTrue(backend_calls)
+
+
+class TestS3PauseEventOpsConformance(PauseEventOpsConformanceMixin, unittest.TestCase):
+    """
+    Conformance tests of the S3 backend.
+    """
+    BACKEND = 's3'
+
+    def _create_pause_event_ops(self):
+        s3_mock = mock_s3()
+        s3_mock.start()
+        self.addCleanup(s3_mock.stop)
+        pool_patcher = patch('alton.pause_event.ThreadPool', InlinePool)
+        pool_patcher.start()
+        self.addCleanup(pool_patcher.stop)
+        return S3PauseEventOps(
+            'pause_operations_bucket',
+            self.TEST_GOCD_USERNAME,
+            self.TEST_GOCD_PASSWORD,
+            self.TEST_GOCD_SVR_URL
+        )
+
+
+class TestSQLitePauseEventOpsConformance(PauseEventOpsConformanceMixin, unittest.TestCase):
+    """
+    Conformance tests of the SQLite backend.
+    """
+    BACKEND = 'sqlite'
+
+    def _create_pause_event_ops(self):
+        return SQLitePauseEventOps(
+            ':memory:',
+            self.TEST_GOCD_USERNAME,
+            self.TEST_GOCD_PASSWORD,
+            self.TEST_GOCD_SVR_URL
+        )
+
+    def test_history_batches(self):
+        with patch.object(SQLitePauseEventOps, 'HISTORY_BATCH_SIZE', 2):
+            event_ids = [self._add_event_at('2017-01-01 00:00:0{}'.format(second)) for second in range(5)]
+            self.assertEqual([event['event_id'] for event in self.pause_ops.pipeline_history()], event_ids)
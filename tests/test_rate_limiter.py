@@ -0,0 +1,112 @@
+"""
+Tests for limiting the rate of AWS API calls.
+"""
+import unittest
+
+import mock
+
+from alton import rate_limiter
+from alton.rate_limiter import AwsRateLimiter
+
+
+class FakeClock(object):
+    """
+    Clock which only moves forward when slept on.
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        """
+        Returns the current time.
+        """
+        return self.now
+
+    def sleep(self, seconds):
+        """
+        Move the clock forward.
+        """
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ThrottlingError(Exception):
+    """
+    Error like the one boto raises when AWS throttles a call.
+    """
+    error_code = 'RequestLimitExceeded'
+
+
+class NotFoundError(Exception):
+    """
+    Error like the one boto raises for an unknown AMI.
+    """
+    error_code = 'InvalidAMIID.NotFound'
+
+
+class TestAwsRateLimiter(unittest.TestCase):
+    """
+    Test token buckets per account and API, and backing off when throttled.
+    """
+    def setUp(self):
+        super(TestAwsRateLimiter, self).setUp()
+        self.clock = FakeClock()
+        patcher = mock.patch.object(rate_limiter, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.limiter = AwsRateLimiter({'get_all_images': (2.0, 3)})
+
+    def test_bursts_then_waits(self):
+        for __ in range(5):
+            self.assertEqual(self.limiter.call('edx', 'get_all_images', lambda: 'ami'), 'ami')
+        self.assertEqual(self.clock.sleeps, [0.5, 0.5])
+
+    def test_refills_over_time(self):
+        for __ in range(3):
+            self.limiter.call('edx', 'get_all_images', lambda: 'ami')
+        self.clock.now += 1
+        for __ in range(2):
+            self.limiter.call('edx', 'get_all_images', lambda: 'ami')
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_buckets_are_per_account_and_api(self):
+        for account in ('edx', 'edge', 'mckinsey'):
+            for __ in range(3):
+                self.limiter.call(account, 'get_all_images', lambda: 'ami')
+        self.limiter.call('edx', 'get_all_load_balancers', lambda: [])
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertEqual(len(self.limiter.buckets), 4)
+
+    def test_backs_off_and_retries_when_throttled(self):
+        func = mock.Mock(side_effect=[ThrottlingError(), ThrottlingError(), 'ami'])
+        self.assertEqual(self.limiter.call('edx', 'get_all_images', func, 'ami-1234'), 'ami')
+        func.assert_called_with('ami-1234')
+        self.assertEqual(func.call_count, 3)
+        # Each throttling halves the rate, and drops the burst - so the retries wait a token each.
+        self.assertEqual(self.clock.sleeps, [1.0, 2.0])
+        bucket = self.limiter.bucket('edx', 'get_all_images')
+        self.assertAlmostEqual(bucket.rate, 0.6)
+        self.assertEqual(self.limiter.status(), [('edx', 'get_all_images', bucket.rate, 2.0, 0)])
+
+    def test_recovers_rate_after_successes(self):
+        bucket = self.limiter.bucket('edx', 'get_all_images')
+        bucket.throttled()
+        for __ in range(10):
+            self.limiter.call('edx', 'get_all_images', lambda: 'ami')
+        self.assertEqual(bucket.rate, 2.0)
+        self.assertEqual(self.limiter.status(), [])
+
+    def test_gives_up_after_max_attempts(self):
+        func = mock.Mock(side_effect=ThrottlingError())
+        with self.assertRaises(ThrottlingError):
+            self.limiter.call('edx', 'get_all_images', func)
+        self.assertEqual(func.call_count, AwsRateLimiter.MAX_ATTEMPTS)
+        self.assertEqual(self.limiter.bucket('edx', 'get_all_images').rate, 0.1)
+
+    def test_other_errors_are_not_retried(self):
+        func = mock.Mock(side_effect=NotFoundError())
+        with self.assertRaises(NotFoundError):
+            self.limiter.call('edx', 'get_all_images', func)
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(self.limiter.bucket('edx', 'get_all_images').rate, 2.0)
@@ -0,0 +1,56 @@
+"""
+Tests for the release pipeline plugin.
+"""
+import unittest
+
+import mock
+
+from plugins import release
+from plugins.release import ReleasePlugin
+
+
+class TestReleasePlugin(unittest.TestCase):
+    """
+    Test creating the pause event backend.
+    """
+    @mock.patch.object(ReleasePlugin, 'say')
+    @mock.patch.multiple(
+        release.settings, create=True,
+        PIPELINE_BUCKET_NAME='pause_operations_bucket',
+        GOCD_USERNAME='gocd_test_user',
+        GOCD_PASSWORD='gocd_test_password',
+        GOCD_SERVER_URL='https://gocd.test.edx.org'
+    )
+    @mock.patch.object(release, 'S3PauseEventOps')
+    def test_pause_ops_created_on_first_use(self, mock_s3_pause_ops, mock_say):
+        plugin = ReleasePlugin()
+        mock_say.assert_not_called()
+        mock_s3_pause_ops.assert_not_called()
+        self.assertIs(plugin.pause_ops, mock_s3_pause_ops.return_value)
+        self.assertIs(plugin.pause_ops, mock_s3_pause_ops.return_value)
+        mock_s3_pause_ops.assert_called_once_with(
+            'pause_operations_bucket', 'gocd_test_user', 'gocd_test_password', 'https://gocd.test.edx.org',
+            file_format='yaml'
+        )
+
+    @mock.patch.object(ReleasePlugin, '_say_error')
+    @mock.patch.object(ReleasePlugin, 'pause_ops', new_callable=mock.PropertyMock)
+    def test_stats_window_too_long(self, mock_pause_ops, mock_say_error):
+        with mock.patch.object(ReleasePlugin, '__init__', return_value=None):
+            plugin = ReleasePlugin()
+        message = mock.MagicMock()
+        plugin.stats(message, 'edxapp', '99999999y')
+        mock_say_error.assert_called_once_with(
+            "Window '99999999y' is too long - windows are at most {} days.".format(release.MAX_WINDOW_DAYS), message
+        )
+        mock_pause_ops.return_value.pipeline_stats.assert_not_called()
+
+    @mock.patch.object(ReleasePlugin, '_say_error')
+    @mock.patch.object(ReleasePlugin, 'pause_ops', new_callable=mock.PropertyMock)
+    def test_history_date_out_of_range(self, mock_pause_ops, mock_say_error):
+        with mock.patch.object(ReleasePlugin, '__init__', return_value=None):
+            plugin = ReleasePlugin()
+        message = mock.MagicMock()
+        plugin.history(message, None, '2017-01', '9999-12')
+        mock_say_error.assert_called_once_with("Invalid date: date value out of range", message)
+        mock_pause_ops.return_value.pipeline_history.assert_not_called()
@@ -2,9 +2,16 @@
 Tests for showing AMI information.
 """
 
+from collections import OrderedDict
+import threading
 import unittest
+import fakeredis
 import mock
 from pyparsing import ParseException
+from alton.ami_cache import AmiCache
+from alton.git_mirrors import CommitRange
+from alton.single_flight import SingleFlight
+from plugins import show
 from plugins.show import Versions, ShowPlugin
 
 # pylint: disable=line-too-long
@@ -41,6 +48,8 @@ class TestParseCutAmi(unittest.TestCase):
          'msg': '''using both "noop" and "verbose" options failed or they're not order-independent'''},
         {'text': 'cut ami verbose noop for prod-edx-programs from stage-edx-programs',
          'msg': '''using both "noop" and "verbose" options failed or they're not order-independent'''},
+        {'text': 'cut ami for prod-edx-programs from stage-edx-programs using ami-deadbeef verbose',
+         'msg': '"verbose" suffix failed'},
     ]
 
     def test_valid(self):
@@ -95,6 +104,12 @@ class TestParseCutAmi(unittest.TestCase):
             'noop': False,
         })
 
+    def test_verbose_suffix(self):
+        text = "cut ami for foo-bar-baz from one-two-three with thing=athing verbose"
+        result = ShowPlugin._parse_cut_ami(text)  # pylint: disable=protected-access
+        self.assertEqual(result['version_overrides'], {'thing': 'athing'})
+        self.assertTrue(result['verbose'])
+
     def test_all_properties(self):
         text = "cut ami verbose noop for foo-bar-baz from one-two-three using ami-deadbeef with thing=athing bang=abang"
         result = ShowPlugin._parse_cut_ami(text)  # pylint: disable=protected-access
@@ -126,9 +141,10 @@ class TestCutFromEdp(unittest.TestCase):
     @mock.patch.object(ShowPlugin, '_ami_for_edp', return_value='ami-00000000')  # uses boto
     @mock.patch.object(ShowPlugin, '_notify_abbey')     # this is how we test the result
     def test_complex_result(self, mocked_notify_abbey, *args):  # pylint: disable=unused-argument
-        message = mock.Mock()
+        message = mock.MagicMock()
         show_plugin = ShowPlugin()
         body = "cut ami verbose noop for foo-bar-baz from one-two-three using ami-deadbeef with thing=athing bang=abang"
+        message.__getitem__.return_value = body
         final_versions = Versions(
             'CONFIG REF', 'CONFIG_SECURE REF',
             {'THING': 'athing', 'thing': 'athing', 'BANG': 'abang', 'bang': 'abang'},
@@ -163,9 +179,10 @@ class TestCutFromEdp(unittest.TestCase):
     ))
     @mock.patch.object(ShowPlugin, '_notify_abbey')     # this is how we test the result
     def test_basic_result(self, mocked_notify_abbey, mocked_get_ami_versions, *args):  # pylint: disable=unused-argument
-        message = mock.Mock()
+        message = mock.MagicMock()
         show_plugin = ShowPlugin()
         body = "cut ami for foo-bar-baz from one-two-three"
+        message.__getitem__.return_value = body
 
         show_plugin.cut_from_edp(message, body)
         # spec: self._notify_abbey(message, dest_env, dest_dep, dest_play,
@@ -174,3 +191,327 @@ class TestCutFromEdp(unittest.TestCase):
             message, 'foo', 'bar', 'baz',
             mocked_get_ami_versions.return_value, False, 'ami-00000000', False
         )
+
+
+class TestVersions(unittest.TestCase):
+    """
+    Tests for parsing the versions an AMI was built with.
+    """
+    TAGS = {
+        'version:configuration': 'https://github.com/edx/configuration.git c0ffee1',
+        'version:edx_platform': 'https://github.com/edx/edx-platform.git 1111111',
+        'version:xqueue_VERSION': 'https://github.com/edx/xqueue.git 3333333',
+        'play': 'edxapp',
+    }
+
+    def setUp(self):
+        super(TestVersions, self).setUp()
+        with mock.patch.object(ShowPlugin, '__init__', return_value=None):
+            self.show_plugin = ShowPlugin()
+        self.show_plugin.ami_versions = OrderedDict()
+        self.show_plugin.ami_versions_lock = threading.Lock()
+
+    def test_from_tags(self):
+        versions = Versions.from_tags(self.TAGS)
+        self.assertEqual(versions.configuration, 'c0ffee1')
+        self.assertIsNone(versions.configuration_secure)
+        self.assertEqual(versions.play_versions, {
+            'edx_platform_version': '1111111', 'EDX_PLATFORM_VERSION': '1111111',
+            'xqueue_version_version': '3333333', 'XQUEUE_VERSION_VERSION': '3333333',
+        })
+        self.assertEqual(
+            sorted(versions.refs()),
+            ['configuration=c0ffee1', 'edx_platform_version=1111111', 'xqueue_VERSION=3333333']
+        )
+
+    def test_set_version_either_case(self):
+        versions = Versions(None, None, {'EDX_PLATFORM_VERSION': '1111111'})
+        versions.set_version('edx_platform_version', '2222222')
+        self.assertEqual(versions.play_versions, {
+            'edx_platform_version': '2222222', 'EDX_PLATFORM_VERSION': '2222222',
+        })
+
+    def test_memoized_by_ami(self):
+        ami = mock.Mock(id='ami-11111111', tags=self.TAGS)
+        with mock.patch.object(Versions, 'from_tags', wraps=Versions.from_tags) as from_tags:
+            first = self.show_plugin._ami_versions(ami)  # pylint: disable=protected-access
+            second = self.show_plugin._ami_versions(ami)  # pylint: disable=protected-access
+        self.assertIs(first, second)
+        self.assertEqual(from_tags.call_count, 1)
+
+    def test_copies_are_independent(self):
+        ami = mock.Mock(id='ami-11111111', tags=self.TAGS)
+        with mock.patch.object(self.show_plugin, '_get_ami', return_value=ami):
+            overridden = self.show_plugin._get_ami_versions('ami-11111111')  # pylint: disable=protected-access
+            overridden.set_version('edx_platform_version', 'master')
+            fresh = self.show_plugin._get_ami_versions('ami-11111111')  # pylint: disable=protected-access
+        self.assertEqual(fresh.play_versions['edx_platform_version'], '1111111')
+
+    def test_cache_size(self):
+        self.show_plugin.AMI_VERSIONS_CACHE_SIZE = 2
+        for index in range(3):
+            self.show_plugin._ami_versions(  # pylint: disable=protected-access
+                mock.Mock(id='ami-{}'.format(index), tags=self.TAGS)
+            )
+        self.assertEqual(list(self.show_plugin.ami_versions), ['ami-1', 'ami-2'])
+
+
+class TestDiffCommits(unittest.TestCase):
+    """
+    Tests for summarizing the commits between the versions of two AMIs.
+    """
+    def setUp(self):
+        super(TestDiffCommits, self).setUp()
+        with mock.patch.object(ShowPlugin, '__init__', return_value=None):
+            self.show_plugin = ShowPlugin()
+        self.show_plugin.git_mirrors = mock.Mock()
+        self.show_plugin.git_mirrors.commits.return_value = CommitRange(3, 1, [u'3333333 Third', u'2222222 Second'])
+        versions = {
+            'ami-11111111': Versions('c0ffee1', None, {}, {
+                'edx_platform': {'url': 'git@github.com:edx/edx-platform.git', 'shorthash': '1111111'},
+                'xqueue': {'url': 'https://github.com/edx/xqueue.git', 'shorthash': 'aaaaaaa'},
+            }),
+            'ami-22222222': Versions('c0ffee1', None, {}, {
+                'edx_platform': {'url': 'https://github.com/edx/edx-platform.git', 'shorthash': '3333333'},
+                'xqueue': {'url': 'https://github.com/edx/xqueue.git', 'shorthash': 'aaaaaaa'},
+            }),
+        }
+        self.said = []
+        for name, func in (
+                ('_get_ami_versions', lambda ami_id, message: versions[ami_id]),
+                ('say', lambda content, message, **kwargs: self.said.append(content)),
+        ):
+            patcher = mock.patch.object(self.show_plugin, name, side_effect=func)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_commits(self):
+        self.show_plugin._diff_amis('ami-11111111', 'ami-22222222', None, commits=True)  # pylint: disable=protected-access
+        self.show_plugin.git_mirrors.commits.assert_called_once_with(
+            'git@github.com:edx/edx-platform.git', '1111111', '3333333'
+        )
+        self.assertEqual(sorted(self.said), [
+            "edx_platform: https://github.com/edx/edx-platform/compare/1111111...3333333\n"
+            "    3 commit(s) added, 1 removed\n"
+            "      3333333 Third\n"
+            "      2222222 Second\n"
+            "      ... and 1 more",
+            "xqueue: no difference",
+        ])
+
+    def test_without_commits(self):
+        self.show_plugin._diff_amis('ami-11111111', 'ami-22222222', None)  # pylint: disable=protected-access
+        self.assertFalse(self.show_plugin.git_mirrors.commits.called)
+        self.assertEqual(sorted(self.said), [
+            "edx_platform: https://github.com/edx/edx-platform/compare/1111111...3333333",
+            "xqueue: no difference",
+        ])
+
+    def test_no_mirrors(self):
+        self.show_plugin.git_mirrors = None
+        self.show_plugin._diff_amis('ami-11111111', 'ami-22222222', None, commits=True)  # pylint: disable=protected-access
+        self.assertIn("GIT_MIRROR_DIR isn't set, so I can't summarize commits.", self.said)
+        self.assertEqual(len(self.said), 3)
+
+
+class TestCutConfirm(unittest.TestCase):
+    """
+    Tests for building the AMI planned by "cut ami noop".
+    """
+    def setUp(self):
+        super(TestCutConfirm, self).setUp()
+        redis = fakeredis.FakeRedis()
+        redis.flushall()
+        with mock.patch.object(ShowPlugin, '__init__', return_value=None):
+            self.show_plugin = ShowPlugin()
+        self.show_plugin.storage = mock.Mock(redis=redis)
+        self.message = mock.MagicMock()
+        self.message.sender.nick = 'jdoe'
+        self.said = []
+        self.jenkins = mock.Mock()
+        self.jenkins.get_job_info.return_value = {'nextBuildNumber': 42}
+        self.ami_for_edp = mock.Mock(return_value='ami-00000000')
+        self.get_ami_versions = mock.Mock(side_effect=lambda ami_id, message: Versions(
+            'CONFIG REF', 'CONFIG_SECURE REF', {'thing': 'someotherthing'},
+            {'thing': {'url': 'THINGURL', 'shorthash': 'THINGSHORTHASH'}}
+        ))
+        for patcher in (
+                mock.patch.object(self.show_plugin, 'say', side_effect=lambda content, *args, **kwargs: self.said.append(content)),
+                mock.patch.object(self.show_plugin, 'get_room_from_message', return_value={'name': 'ops'}),
+                mock.patch.object(self.show_plugin, '_ami_for_edp', self.ami_for_edp),
+                mock.patch.object(self.show_plugin, '_get_ami_versions', self.get_ami_versions),
+                mock.patch.multiple(
+                    show.settings, create=True, JENKINS_URL='https://jenkins', JENKINS_API_USER='alton',
+                    JENKINS_API_KEY='key', NOTIFY_CALLBACK_URL='https://alton/notify'
+                ),
+                mock.patch('jenkins.Jenkins', return_value=self.jenkins),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _run(self, body, command):
+        """
+        Run a command, returning what it said.
+        """
+        self.said = []
+        self.message.__getitem__.return_value = body
+        command(self.message, *body.split()[3:4])
+        return self.said
+
+    def _plan(self):
+        """
+        Plan a build with "cut ami noop", returning the token it can be confirmed with.
+        """
+        body = "cut ami noop for foo-bar-baz from one-two-three with thing=athing"
+        said = self._run(body, lambda message, *args: self.show_plugin.cut_from_edp(message, body))
+        self.assertFalse(self.jenkins.build_job.called)
+        return said[-1].split('"')[1].split()[-1]
+
+    def test_confirm_builds_plan(self):
+        token = self._plan()
+        self.ami_for_edp.reset_mock()
+        self.get_ami_versions.reset_mock()
+
+        self._run('cut ami confirm ' + token, self.show_plugin.cut_confirm)
+        self.assertFalse(self.ami_for_edp.called)
+        self.assertFalse(self.get_ami_versions.called)
+        params = self.jenkins.build_job.call_args[1]['parameters']
+        self.assertEqual(
+            [params['environment'], params['deployment'], params['play'], params['base_ami']],
+            ['foo', 'bar', 'baz', 'ami-00000000']
+        )
+        self.assertEqual(params['configuration'], 'CONFIG REF')
+        self.assertEqual(params['vars'], 'THING: athing\nthing: athing\n')
+
+    def test_confirm_once(self):
+        token = self._plan()
+        self._run('cut ami confirm ' + token, self.show_plugin.cut_confirm)
+        said = self._run('cut ami confirm ' + token, self.show_plugin.cut_confirm)
+        self.assertEqual(self.jenkins.build_job.call_count, 1)
+        self.assertIn("I don't have a build plan " + token, said[-1])
+
+    def test_only_planner_confirms(self):
+        token = self._plan()
+        self.message.sender.nick = 'mallory'
+        said = self._run('cut ami confirm ' + token, self.show_plugin.cut_confirm)
+        self.assertFalse(self.jenkins.build_job.called)
+        self.assertIn("I don't have a build plan {} of yours".format(token), said[-1])
+
+        # The plan is still there for the user who made it.
+        self.message.sender.nick = 'jdoe'
+        self._run('cut ami confirm ' + token, self.show_plugin.cut_confirm)
+        self.assertEqual(self.jenkins.build_job.call_count, 1)
+
+    def test_unknown_token(self):
+        said = self._run('cut ami confirm 0123abcd', self.show_plugin.cut_confirm)
+        self.assertFalse(self.jenkins.build_job.called)
+        self.assertIn("I don't have a build plan 0123abcd", said[-1])
+
+
+def _instance(instance_id, play, image_id, state='running'):
+    """
+    Returns a mock EC2 instance.
+    """
+    return mock.Mock(id=instance_id, image_id=image_id, state=state, tags={'play': play})
+
+
+class TestClusterReports(unittest.TestCase):
+    """
+    Tests for summarizing the instances of a cluster, and finding plays with more than one AMI.
+    """
+    def setUp(self):
+        super(TestClusterReports, self).setUp()
+        self.instances = instances = [_instance('i-{}'.format(index), 'edxapp', 'ami-11111111') for index in range(200)]
+        instances[7] = _instance('i-7', 'edxapp', 'ami-11111111', state='stopped')
+        instances[8] = _instance('i-8', 'edxapp', 'ami-22222222')
+        instances.append(_instance('i-worker', 'worker', 'ami-33333333'))
+        elbs = [mock.Mock(instances=instances[:150]), mock.Mock(instances=instances[100:190])]
+        elbs[0].name = 'edxapp-a'
+        elbs[1].name = 'edxapp-b'
+        images = {
+            'ami-11111111': mock.Mock(id='ami-11111111', tags={
+                'version:edx_platform': 'https://github.com/edx/edx-platform.git 1111111',
+                'version:configuration': 'https://github.com/edx/configuration.git c0ffee1',
+            }),
+            'ami-22222222': mock.Mock(id='ami-22222222', tags={
+                'version:edx_platform': 'https://github.com/edx/edx-platform.git 2222222',
+                'version:configuration': 'https://github.com/edx/configuration.git c0ffee1',
+            }),
+        }
+        self.ec2 = mock.Mock()
+        self.ec2.get_all_images.side_effect = lambda filters: [
+            images[ami_id] for ami_id in filters['image-id'] if ami_id in images
+        ]
+
+        with mock.patch.object(ShowPlugin, '__init__', return_value=None):
+            self.show_plugin = ShowPlugin()
+        self.show_plugin.aws_lookups = SingleFlight()
+        self.show_plugin.aws_profiles = ['edx']
+        self.show_plugin.ami_cache = AmiCache(':memory:')
+        self.show_plugin.ami_versions = OrderedDict()
+        self.show_plugin.ami_versions_lock = threading.Lock()
+        self.said = []
+        for name, func in (
+                ('_get_instances', lambda dep, filters: [mock.Mock(instances=self.instances)]),
+                ('_get_load_balancers', lambda dep: elbs),
+                ('_aws_connection', lambda service, profile: self.ec2),
+                ('say', lambda content, message, **kwargs: self.said.append(content)),
+        ):
+            patcher = mock.patch.object(self.show_plugin, name, side_effect=func)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_summary(self):
+        self.show_plugin._show_summary(None, 'prod', 'edx')  # pylint: disable=protected-access
+        lines = self.said[-1][len('/code '):].split('\n')
+        self.assertEqual([line.split() for line in lines], [
+            ['Count', 'Play', 'State', 'AMI', 'ELBs', 'Versions'],
+            ['-----', '----', '-----', '---', '----', '--------'],
+            ['98', 'edxapp', 'running', 'ami-11111111', 'edxapp-a', 'configuration=c0ffee1', 'edx_platform_version=1111111'],
+            ['50', 'edxapp', 'running', 'ami-11111111', 'edxapp-a,edxapp-b', 'configuration=c0ffee1', 'edx_platform_version=1111111'],
+            ['40', 'edxapp', 'running', 'ami-11111111', 'edxapp-b', 'configuration=c0ffee1', 'edx_platform_version=1111111'],
+            ['10', 'edxapp', 'running', 'ami-11111111', '-', 'configuration=c0ffee1', 'edx_platform_version=1111111'],
+            ['1', 'edxapp', 'stopped', 'ami-11111111', 'edxapp-a', 'configuration=c0ffee1', 'edx_platform_version=1111111'],
+            ['1', 'edxapp', 'running', 'ami-22222222', 'edxapp-a', 'configuration=c0ffee1', 'edx_platform_version=2222222'],
+            ['1', 'worker', 'running', 'ami-33333333', '-', '(AMI', 'not', 'found)'],
+            ['201', 'instances', 'in', '7', 'groups'],
+        ])
+        # All the AMIs are looked up at once.
+        self.ec2.get_all_images.assert_called_once_with(
+            filters={'image-id': ['ami-11111111', 'ami-22222222', 'ami-33333333']}
+        )
+
+    def test_summary_of_play_leaves_out_play(self):
+        self.show_plugin._show_summary(None, 'prod', 'edx', 'edxapp')  # pylint: disable=protected-access
+        lines = self.said[-1][len('/code '):].split('\n')
+        self.assertEqual(lines[0].split(), ['Count', 'State', 'AMI', 'ELBs', 'Versions'])
+        self.assertEqual(lines[2].split()[:4], ['98', 'running', 'ami-11111111', 'edxapp-a'])
+
+    def test_drift(self):
+        self.show_plugin._show_drift(None, 'prod', 'edx')  # pylint: disable=protected-access
+        self.assertEqual(self.said[-1], '/code ' + '\n'.join([
+            '1 of 1 plays in prod-edx have more than one AMI in service:',
+            'edxapp',
+            '  ami-11111111  188 instances  edx_platform_version=1111111',
+            '  ami-22222222    1 instances  edx_platform_version=2222222',
+        ]))
+        # Only the drifted play's AMIs are looked up.
+        self.ec2.get_all_images.assert_called_once_with(filters={'image-id': ['ami-11111111', 'ami-22222222']})
+
+    def test_no_drift(self):
+        # Leave out the instance running the other AMI.
+        del self.instances[8]
+        self.show_plugin._show_drift(None, 'prod', 'edx')  # pylint: disable=protected-access
+        self.assertEqual(self.said[-1], 'All 1 plays in prod-edx have a single AMI in service.')
+        self.ec2.get_all_images.assert_not_called()
+
+    def test_amis_cached(self):
+        self.show_plugin._show_drift(None, 'prod', 'edx')  # pylint: disable=protected-access
+        self.show_plugin._show_drift(None, 'prod', 'edx')  # pylint: disable=protected-access
+        self.assertEqual(self.said[1], self.said[3])
+        self.assertEqual(self.ec2.get_all_images.call_count, 1)
+        self.assertEqual(self.show_plugin._get_ami('ami-22222222').tags, {  # pylint: disable=protected-access
+            'version:edx_platform': 'https://github.com/edx/edx-platform.git 2222222',
+            'version:configuration': 'https://github.com/edx/configuration.git c0ffee1',
+        })
+        self.assertEqual(self.ec2.get_all_images.call_count, 1)
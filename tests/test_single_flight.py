@@ -0,0 +1,94 @@
+"""
+Tests for coalescing identical concurrent calls.
+"""
+import threading
+import unittest
+
+import mock
+
+from alton import single_flight
+from alton.single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    Test sharing calls in flight between threads.
+    """
+    def setUp(self):
+        super(TestSingleFlight, self).setUp()
+        self.single_flight = SingleFlight()
+        self.call_started = threading.Event()
+        self.release = threading.Event()
+        self.follower_waiting = threading.Event()
+        self.outcomes = []
+
+        # Signal when a follower starts waiting for the call in flight.
+        follower_waiting = self.follower_waiting
+
+        class ObservedEvent(threading._Event):  # pylint: disable=protected-access
+            """
+            Event which signals when something waits on it.
+            """
+            def wait(self, timeout=None):
+                follower_waiting.set()
+                return super(ObservedEvent, self).wait(timeout)
+
+        patcher = mock.patch.object(single_flight.threading, 'Event', ObservedEvent)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _slow_call(self, result):
+        """
+        Signal the call is in flight, then return result (or raise it, if it's an exception) once released.
+        """
+        self.call_started.set()
+        self.release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _call(self, func, *args):
+        """
+        Make a call keyed 'key', recording its result or exception.
+        """
+        try:
+            self.outcomes.append(self.single_flight.call('key', func, *args))
+        except Exception as exc:  # pylint: disable=broad-except
+            self.outcomes.append(exc)
+
+    def _leader_and_follower(self, leader_result, follower_func):
+        """
+        Start a slow call, make the same call from another thread while it's in flight, then let them finish.
+        """
+        leader = threading.Thread(target=self._call, args=(self._slow_call, leader_result))
+        leader.start()
+        self.assertTrue(self.call_started.wait(5))
+        follower = threading.Thread(target=self._call, args=(follower_func,))
+        follower.start()
+        self.assertTrue(self.follower_waiting.wait(5))
+        self.release.set()
+        leader.join(5)
+        follower.join(5)
+
+    def test_follower_shares_result(self):
+        follower_func = mock.Mock()
+        self._leader_and_follower(['ami-1234'], follower_func)
+        self.assertEqual(self.outcomes, [['ami-1234'], ['ami-1234']])
+        follower_func.assert_not_called()
+        self.assertEqual(self.single_flight.calls, {})
+
+    def test_follower_shares_error(self):
+        error = ValueError('Throttling')
+        self._leader_and_follower(error, mock.Mock())
+        self.assertEqual(self.outcomes, [error, error])
+        self.assertEqual(self.single_flight.calls, {})
+
+    def test_calls_are_not_cached(self):
+        self.release.set()
+        self.assertEqual(self.single_flight.call('key', self._slow_call, 'first'), 'first')
+        self.assertEqual(self.single_flight.call('key', self._slow_call, 'second'), 'second')
+
+    def test_different_keys_are_not_shared(self):
+        self.release.set()
+        self.assertEqual(self.single_flight.call('first', lambda: 1), 1)
+        self.assertEqual(self.single_flight.call('second', lambda: 2), 2)
@@ -0,0 +1,61 @@
+"""
+Tests for timing plugin startup.
+"""
+import imp
+import os
+import shutil
+import tempfile
+import unittest
+
+from alton.startup_report import PluginStartupTimer
+
+PLUGIN_SOURCE = '''
+class FakeWillPlugin(object):
+    is_will_plugin = True
+
+
+class SlowPlugin(FakeWillPlugin):
+    def __init__(self):
+        self.initialized = True
+
+
+class InheritedInitPlugin(FakeWillPlugin):
+    pass
+'''
+
+
+class TestPluginStartupTimer(unittest.TestCase):
+    """
+    Test timing the import and initialization of plugins.
+    """
+    def setUp(self):
+        super(TestPluginStartupTimer, self).setUp()
+        plugin_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, plugin_dir)
+        self.plugin_path = os.path.join(plugin_dir, 'fake_plugins.py')
+        with open(self.plugin_path, 'w') as plugin_file:
+            plugin_file.write(PLUGIN_SOURCE)
+
+    def test_timing(self):
+        timer = PluginStartupTimer()
+        module = timer.timed_load_source(imp.load_source)('fake_plugins', self.plugin_path)
+        self.assertTrue(module.SlowPlugin().initialized)
+        module.InheritedInitPlugin()
+        timer.restore()
+
+        self.assertEqual(list(timer.import_seconds), ['fake_plugins'])
+        self.assertEqual(sorted(timer.init_seconds), ['FakeWillPlugin', 'InheritedInitPlugin', 'SlowPlugin'])
+        report = timer.report()
+        self.assertEqual(len(report), 5)
+        self.assertTrue(report[-1].endswith('total'))
+        self.assertTrue(any(line.endswith('import fake_plugins') for line in report))
+
+    def test_restore(self):
+        timer = PluginStartupTimer()
+        module = timer.timed_load_source(imp.load_source)('fake_plugins', self.plugin_path)
+        self.assertEqual(module.SlowPlugin.__dict__['__init__'].__name__, 'timed_init')
+        timer.restore()
+        self.assertEqual(module.SlowPlugin.__dict__['__init__'].__name__, '__init__')
+        self.assertNotIn('__init__', module.InheritedInitPlugin.__dict__)
+        module.SlowPlugin()
+        self.assertEqual(timer.init_seconds['SlowPlugin'], 0)
@@ -0,0 +1,145 @@
+"""
+Tests for tracing the stages of chat commands.
+"""
+import json
+import unittest
+
+import fakeredis
+import mock
+
+from alton.metrics import timed_backend
+from alton.tracing import TraceStore, current_trace, span, spanned, traced, traced_quietly
+
+
+class TracedPlugin(object):
+    """
+    Plugin with a traced command, storing its traces in fakeredis.
+    """
+    def __init__(self):
+        self.storage = mock.Mock(redis=fakeredis.FakeRedis())
+        self.said = []
+
+    def bootstrap_storage(self):
+        """
+        The storage is already set up.
+        """
+        pass
+
+    def say(self, content, message=None):  # pylint: disable=unused-argument
+        """
+        Record what was said.
+        """
+        self.said.append(content)
+
+    @timed_backend('ec2', 'get_all_images')
+    def _find_images(self, ami_id):
+        """
+        Look up an AMI, failing for unknown ones.
+        """
+        if ami_id == 'ami-unknown':
+            raise ValueError(ami_id)
+        return [ami_id]
+
+    @spanned
+    def _get_ami(self, ami_id):
+        """
+        Look up an AMI, returning None for unknown ones.
+        """
+        try:
+            return self._find_images(ami_id)[0]
+        except ValueError:
+            return None
+
+    @traced
+    def show_ami(self, message, ami_id):  # pylint: disable=unused-argument
+        """
+        Look up an AMI twice.
+        """
+        self._get_ami(ami_id)
+        self._get_ami('ami-unknown')
+        if ami_id == 'ami-broken':
+            raise RuntimeError(ami_id)
+
+    @traced_quietly
+    def pause(self, message, reason):  # pylint: disable=unused-argument
+        """
+        Look up an AMI, for a free-text reason.
+        """
+        self._get_ami('ami-1234')
+
+
+class TestTracing(unittest.TestCase):
+    """
+    Test recording, printing and storing traces.
+    """
+    def setUp(self):
+        super(TestTracing, self).setUp()
+        self.plugin = TracedPlugin()
+        self.plugin.storage.redis.flushall()
+        self.store = TraceStore(self.plugin.storage.redis)
+
+    def _message(self, body):
+        """
+        Returns a chat message from jdoe.
+        """
+        message = mock.MagicMock()
+        message.sender.nick = 'jdoe'
+        message.__getitem__.return_value = body
+        return message
+
+    def test_records_nested_spans(self):
+        self.plugin.show_ami(self._message('show ami-1234'), 'ami-1234')
+        trace = self.store.recent()[0]
+        self.assertEqual(trace['command'], 'show_ami')
+        self.assertEqual(trace['user'], 'jdoe')
+        self.assertEqual(trace['body'], 'show ami-1234')
+        self.assertFalse(trace['failed'])
+        self.assertEqual(
+            [(span_dict['name'], span_dict['depth'], span_dict['failed']) for span_dict in trace['spans']],
+            [
+                ('show_ami', 0, False),
+                ('_get_ami', 1, False),
+                ('ec2.get_all_images', 2, False),
+                ('_get_ami', 1, False),
+                ('ec2.get_all_images', 2, True),
+            ]
+        )
+        starts = [span_dict['start'] for span_dict in trace['spans']]
+        self.assertEqual(starts, sorted(starts))
+        self.assertEqual(self.plugin.said, [])
+        self.assertIsNone(current_trace())
+
+    def test_verbose_prints_breakdown(self):
+        self.plugin.show_ami(self._message('show ami-1234 verbose'), 'ami-1234')
+        self.assertEqual(len(self.plugin.said), 1)
+        lines = self.plugin.said[0].split('\n')
+        self.assertTrue(lines[0].startswith('/code '))
+        self.assertTrue(lines[0].endswith('s  show_ami'))
+        self.assertTrue(lines[2].endswith('s      ec2.get_all_images'))
+        self.assertTrue(lines[4].endswith('s      ec2.get_all_images (failed)'))
+
+    def test_free_text_command_never_prints_breakdown(self):
+        self.plugin.pause(self._message('pause edxapp because too verbose'), 'too verbose')
+        self.assertEqual(self.plugin.said, [])
+        self.assertEqual(self.store.recent()[0]['command'], 'pause')
+
+    def test_failed_command_is_traced(self):
+        with self.assertRaises(RuntimeError):
+            self.plugin.show_ami(self._message('show ami-broken verbose'), 'ami-broken')
+        self.assertTrue(self.store.recent()[0]['failed'])
+        self.assertEqual(len(self.plugin.said), 1)
+        self.assertIsNone(current_trace())
+
+    def test_spans_outside_a_trace_are_ignored(self):
+        with span('ec2.get_all_images') as outside:
+            self.assertIsNone(outside)
+        self.assertEqual(self.plugin._get_ami('ami-1234'), 'ami-1234')  # pylint: disable=protected-access
+
+    def test_store_keeps_recent_traces(self):
+        with mock.patch.object(TraceStore, 'MAX_TRACES', 2):
+            for ami_id in ('ami-1', 'ami-2', 'ami-3'):
+                self.plugin.show_ami(self._message('show ' + ami_id), ami_id)
+        self.assertEqual([trace['body'] for trace in self.store.recent()], ['show ami-3', 'show ami-2'])
+        self.assertEqual(len(self.store.recent(limit=1)), 1)
+        self.assertEqual(self.store.recent(command='diff_ami_ids'), [])
+        json.dumps(self.store.recent())
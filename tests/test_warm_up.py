@@ -0,0 +1,53 @@
+"""
+Tests for warming up plugins at startup.
+"""
+import threading
+import unittest
+
+import mock
+
+from alton.warm_up import start_warm_up, warm_up_plugins
+from plugins.show import ShowPlugin
+
+
+class TestWarmUp(unittest.TestCase):
+    """
+    Test running the plugins' warm-ups.
+    """
+    def test_warm_up_plugins(self):
+        plugins = [mock.Mock(), object(), mock.Mock()]
+        plugins[0].warm_up.side_effect = Exception('S3 is unreachable')
+        warm_up_plugins(plugins)
+        plugins[0].warm_up.assert_called_once_with()
+        plugins[2].warm_up.assert_called_once_with()
+
+    def test_start_warm_up(self):
+        warmed_up = threading.Event()
+        plugin = mock.Mock()
+        plugin.warm_up.side_effect = warmed_up.set
+        thread = start_warm_up([plugin])
+        self.assertTrue(thread.daemon)
+        self.assertTrue(warmed_up.wait(5))
+        thread.join(5)
+
+
+class TestShowPluginWarmUp(unittest.TestCase):
+    """
+    Test warming up the show plugin's AWS connections.
+    """
+    @mock.patch.object(ShowPlugin, '__init__', return_value=None)   # reads settings
+    def test_warm_up(self, __):
+        show_plugin = ShowPlugin()
+        show_plugin.aws_profiles = ['edx', 'edge']
+        show_plugin.aws_lookups = mock.Mock(call=lambda key, func, *args: func(*args))
+        show_plugin.aws_connections = {}
+        show_plugin.aws_connections_lock = threading.Lock()
+        show_plugin.inventory_enabled = False
+        with mock.patch('boto.connect_ec2') as connect_ec2, \
+                mock.patch('boto.connect_elb') as connect_elb:
+            show_plugin.warm_up()
+            show_plugin.warm_up()
+        self.assertEqual(connect_ec2.call_args_list, [mock.call(profile_name='edx'), mock.call(profile_name='edge')])
+        self.assertEqual(connect_elb.call_args_list, [mock.call(profile_name='edx'), mock.call(profile_name='edge')])
+        self.assertEqual(connect_ec2.return_value.get_all_instances.call_count, 4)
+        self.assertEqual(connect_elb.return_value.get_all_load_balancers.call_count, 4)